@@ -3,10 +3,13 @@ from maeri.compiler.assembler.opcodes import Opcodes, ConfigureStates
 from maeri.compiler.assembler.opcodes import ConfigureWeights, LoadFeatures
 from maeri.compiler.assembler.opcodes import StoreFeatures, Run, Debug
 from maeri.compiler.assembler.opcodes import ConfigureCollectors
-from maeri.compiler.assembler.signs import to_unsigned
+from maeri.compiler.assembler.opcodes import ConfigureRelus, ConfigureScales
 
 valid_ops = {ConfigureStates, ConfigureWeights, LoadFeatures, 
-            StoreFeatures, Run, Debug, ConfigureCollectors}
+            StoreFeatures, Run, Debug, ConfigureCollectors, ConfigureRelus,
+            ConfigureScales}
+config_ops = {ConfigureStates, ConfigureWeights, ConfigureCollectors,
+            ConfigureRelus, ConfigureScales}
 
 DEBUG = False
 
@@ -23,58 +26,53 @@ def assemble(list_of_ops, as_bytes=False):
     config_counter = 0
     config_offset = instr_mem_size
 
-    if opcodes.bytes_in_address != 3:
-        raise RuntimeError("CURRENTLY ONLY SUPPORTING 3 BYTE ADDRESSES")
-    if opcodes.num_nodes != 63:
-        raise RuntimeError("CURRENTLY ONLY SUPPORTING TREES OF DEPTH 6")
+    if opcodes.bytes_in_line is None:
+        raise RuntimeError("THE ISA MUST BE INITIALIZED WITH THE BYTES IN A MEMORY LINE")
     if opcodes.INPUT_WIDTH != 8:
         raise RuntimeError("CURRENTLY ONLY SUPPORTING WIDTHS OF 8")
-    if opcodes.num_ports != 16:
-        raise RuntimeError("CURRENTLY ONLY SUPPORTING TREES WITH 16 PORTS")
+
+    def address(line):
+        return list(int(line).to_bytes(opcodes.bytes_in_address, 'little'))
 
     for op in list_of_ops:
         assert(type(op) in valid_ops)
 
-        if type(op) in {ConfigureStates}:
-            instr_mem += [opcodes.ConfigureStates.op]
-            address = list(int(config_offset).to_bytes(3, 'little'))
-            instr_mem += address
-
-            config_mem += [int(conf) for conf in op.states] + [0]
-            config_offset += 64//4
-
-        if type(op) in {ConfigureWeights}:
-            instr_mem += [opcodes.ConfigureWeights.op]
-            address = list(int(config_offset).to_bytes(3, 'little'))
-            instr_mem += address
+        # configuration ops point at their block of whole
+        # lines in the config memory
+        if type(op) in config_ops:
+            instr_mem += [type(op).op]
+            instr_mem += address(config_offset)
 
-            weights = [0,0,0] + [int(conf) for conf in op.weights] + [0]
-            weights = [to_unsigned(weight, opcodes.INPUT_WIDTH) for weight in weights]
-            config_mem += weights
-            config_offset += 36//4
+            config = op.config()
+            config_mem += config
+            config_offset += len(config)//opcodes.bytes_in_line
 
-        if type(op) in {ConfigureCollectors}:
-            instr_mem += [opcodes.ConfigureCollectors.op]
-            address = list(int(config_offset).to_bytes(3, 'little'))
-            instr_mem += address
+        # the byte after the address is reserved
+        if type(op) in {LoadFeatures, StoreFeatures}:
+            instr_mem += [type(op).op]
+            instr_mem += address(op.address)
+            instr_mem += [0, int(op.port_buffer_address), int(op.num_lines)]
 
-            config_mem += [int(conf) for conf in op.states] + [0]
-            config_offset += 16//4
+        if type(op) in {Run}:
+            instr_mem += [opcodes.Run.op, int(op.len_runtime), int(op.pace)]
         
         if type(op) in {Debug}:
             instr_mem += [opcodes.Debug.op]
     
     instr_mem += [opcodes.Reset.op]
-    instr_mem += (4*instr_mem_size - len(instr_mem))*[0]
+    bytes_in_line = opcodes.bytes_in_line
+    assert(len(instr_mem) <= bytes_in_line*instr_mem_size)
+    instr_mem += (bytes_in_line*instr_mem_size - len(instr_mem))*[0]
 
-    config_mem += (4*config_mem_size - len(config_mem))*[0]
+    assert(len(config_mem) <= bytes_in_line*config_mem_size)
+    config_mem += (bytes_in_line*config_mem_size - len(config_mem))*[0]
 
     combined_mem = instr_mem + config_mem
     if as_bytes:
         return combined_mem
 
     for mem_line in range(instr_mem_size + config_mem_size):
-        array = combined_mem[mem_line*4 : (mem_line + 1)*4]
+        array = combined_mem[mem_line*bytes_in_line : (mem_line + 1)*bytes_in_line]
         final_mem += [int.from_bytes(bytearray(array), 'little')]
 
     if DEBUG:
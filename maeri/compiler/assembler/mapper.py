@@ -0,0 +1,411 @@
+"""
+Packs several virtual neurons, the dot products of Conv2
+rows, into one configuration of the multiplier tree.
+
+Every port injects into one mult, and each mult passes
+the feature it sees on to its left neighbour a cycle
+later. A filter row of width ``w`` is therefore laid over
+a chain of ``w`` mults ending at the injecting mult of the
+port streaming its input row, and slides along that row
+as it streams in. The rows of a neuron are laid one
+after the other, left to right, with any mults between
+chains holding a zero weight, and neurons follow each
+other until the ports or mults run out. The adder states
+reducing each neuron are then found by ``reduction_states``.
+
+Mults are numbered from 0 at the left of the tree, ports
+as in ``Skeleton``.
+"""
+from maeri.common.logger import logger
+from maeri.compiler.assembler import opcodes
+from maeri.compiler.assembler.reduction import reduction_states, reduce
+from maeri.compiler.assembler.states import InjectEn
+from maeri.compiler.nodes import OpTable
+from maeri.compiler.sim_engine import overlaps
+
+import numpy as np
+
+# operand positions of Conv2 rows in an op table
+X, W, RES, BIAS, RESIDUAL = 0, 1, 2, 3, 4
+
+def inject_mults(num_mults, num_ports):
+    """
+    Mult each port injects into, the rightmost mult of each
+    of ``num_ports`` equal groups.
+    """
+    interval = num_mults//num_ports
+    return [(port + 1)*interval - 1 for port in range(num_ports)]
+
+def verify_tree(num_mults, num_ports):
+    """
+    Raises when the tree has fewer mults than ports, which
+    leaves some port no mult to inject into.
+    """
+    if not (0 < num_ports <= num_mults):
+        raise ValueError(f"{num_ports} ports need at least as many mults to inject " +\
+            f"into, got {num_mults}.")
+
+def layout_chains(lengths, first_mult, first_port, num_mults, num_ports):
+    """
+    Lays chains of ``lengths`` mults over the tree, one
+    after the other, starting at ``first_mult`` and
+    ``first_port``. Every chain ends at the mult of the
+    first free port injecting far enough right to hold it.
+    Returns the last mult of every chain along with the
+    port feeding it, or None when they do not fit.
+    """
+    injects = inject_mults(num_mults, num_ports)
+
+    chains = []
+    mult, port = first_mult, first_port
+    for length in lengths:
+        while (port < num_ports) and (injects[port] - length + 1 < mult):
+            port += 1
+        if port == num_ports:
+            return None
+        chains += [(injects[port], port)]
+        mult, port = injects[port] + 1, port + 1
+
+    return chains
+
+def layout_neuron(shape, first_mult, first_port, num_mults, num_ports, bias=False,
+        residual=False):
+    """
+    Lays the ``(channels, depth, width)`` filter of a neuron
+    over the tree, starting at ``first_mult`` and
+    ``first_port``, followed by a single mult for its bias
+    and one for its residual when it has them. Returns the
+    last mult of the chain of every filter row, of the bias
+    and of the residual, along with the port feeding it, or
+    None when the neuron does not fit.
+    """
+    channels, depth, width = shape
+    lengths = [width]*(channels*depth) + [1]*bias + [1]*residual
+    return layout_chains(lengths, first_mult, first_port, num_mults, num_ports)
+
+def neuron_fits(rows, width, lanes, num_mults, num_ports):
+    """
+    Whether a neuron of ``rows`` filter rows of ``width``
+    weights, and ``lanes`` bias and residual lanes, fits on
+    an empty tree. The solver splits filters by the same
+    rule the mapper lays them out with.
+    """
+    lengths = [width]*rows + [1]*lanes
+    return layout_chains(lengths, 0, 0, num_mults, num_ports) is not None
+
+class TreeMapping():
+    """
+    One configuration of the tree running the Conv2 rows
+    ``rows`` together, a neuron each, or the outputs of a
+    single Gemm row, a neuron per output.
+
+    ports:
+        ``(neuron, channel, filter row)`` streamed into each
+        port, None for idle ports
+    collectors:
+        port each neuron's sum is collected on
+    relus:
+        whether each port's collector clamps what it writes
+        at zero, fusing the Relu of its neuron
+    scales:
+        factor each port's collector multiplies what it
+        writes by, before clamping
+
+    A neuron with a bias has it on a mult of its own, fed
+    a row of ones by a port streaming ``(neuron, None,
+    None)``. A neuron with a residual sums it on a mult of
+    its own weighted by one, fed by a port streaming
+    ``(neuron, None, 'residual')``. Neurons of strided
+    filters share the ``pace`` at which collectors keep
+    their sums.
+    """
+    def __init__(self, rows, depth, num_ports, filters, relus=None, biases=None,
+            pace=1, scales=None, residuals=None):
+        self.rows = rows
+        self.depth = depth
+        self.num_ports = num_ports
+        self.filters = filters
+        self.pace = pace
+
+        if biases is None:
+            biases = [None]*len(filters)
+        self.biases = biases
+
+        if residuals is None:
+            residuals = [False]*len(filters)
+        self.residuals = [bool(residual) for residual in residuals]
+
+        num_mults = 2**(depth - 1)
+        dtype = np.result_type(*filters, *[bias for bias in biases if bias is not None])
+        self.weights = np.zeros([num_mults], dtype=dtype)
+        self.inject = [InjectEn.off]*num_mults
+        self.ports = [None]*num_ports
+        self.bias_mults = []
+
+        segments = []
+        mult, port = 0, 0
+        for neuron, (filter_, bias, residual) in enumerate(zip(filters, biases,
+                self.residuals)):
+            chains = layout_neuron(filter_.shape, mult, port, num_mults, num_ports,
+                bias is not None, residual)
+            if chains is None:
+                raise ValueError(f"Neuron {neuron} of shape {filter_.shape} " +\
+                    "does not fit in the tree.")
+
+            width = filter_.shape[2]
+            for (last, port), (channel, row) in zip(chains, np.ndindex(filter_.shape[:2])):
+                self.weights[last - width + 1 : last + 1] = filter_[channel, row]
+                self.inject[last] = InjectEn.on
+                self.ports[port] = (neuron, channel, row)
+            lanes = chains[filter_.shape[0]*filter_.shape[1]:]
+            if bias is not None:
+                (last, port), lanes = lanes[0], lanes[1:]
+                self.weights[last] = bias
+                self.inject[last] = InjectEn.on
+                self.ports[port] = (neuron, None, None)
+                self.bias_mults += [last]
+            if residual:
+                last, port = lanes[0]
+                self.weights[last] = 1
+                self.inject[last] = InjectEn.on
+                self.ports[port] = (neuron, None, 'residual')
+
+            segments += [(chains[0][0] - width + 1, chains[-1][0] + 1)]
+            mult, port = chains[-1][0] + 1, chains[-1][1] + 1
+
+        self.segments = segments
+        self.adder_states, nodes = reduction_states(segments, depth)
+
+        # neuron ``i`` is collected on port ``i``, idle
+        # collectors listen to the root
+        self.collectors = nodes
+        self.collector_nodes = nodes + [0]*(num_ports - len(nodes))
+
+        if relus is None:
+            relus = [False]*len(filters)
+        self.relus = [bool(relu) for relu in relus] + [False]*(num_ports - len(relus))
+
+        if scales is None:
+            scales = [1.0]*len(filters)
+        self.scales = [float(scale) for scale in scales] + [1.0]*(num_ports - len(scales))
+
+    @property
+    def states(self):
+        return list(self.adder_states) + self.inject
+
+    @property
+    def weight_bytes(self):
+        """
+        Bytes of the weights loaded into the tree, a word
+        of ``opcodes.INPUT_WIDTH`` bits per mult, 8 bits when
+        the ISA is not initialized.
+        """
+        width = opcodes.INPUT_WIDTH or 8
+        return len(self.weights)*(-(-width//8))
+
+    @property
+    def utilization(self):
+        used = sum(filter_.size for filter_ in self.filters)
+        return used/len(self.weights)
+
+    def weight_words(self):
+        """
+        Weight of every mult as the integer the tree is
+        configured with. Weights must already be integers,
+        as those of a quantized model are. A bias lane holds
+        a weight as narrow as any other, so a wider bias,
+        such as a large int32 bias of a quantized model, is
+        an error rather than a silently different result.
+        """
+        if not np.all(np.mod(self.weights, 1) == 0):
+            raise ValueError("Tree weights must be integers, quantize the model " +\
+                "before mapping it.")
+        bound = 2**(opcodes.INPUT_WIDTH - 1)
+        words = [int(weight) for weight in self.weights]
+        for mult in self.bias_mults:
+            if not (-bound <= words[mult] < bound):
+                raise ValueError(f"Bias {words[mult]} on mult {mult} does not fit " +\
+                    f"the {opcodes.INPUT_WIDTH} bit weight of its lane.")
+        return words
+
+    def instructions(self):
+        """
+        Configuration ops loading this mapping, once the
+        ISA is initialized for the target tree.
+        """
+        return [opcodes.ConfigureStates(self.states),
+            opcodes.ConfigureWeights(self.weight_words()),
+            opcodes.ConfigureCollectors(self.collector_nodes),
+            opcodes.ConfigureRelus(self.relus),
+            opcodes.ConfigureScales(self.scales)]
+
+    def run(self, port_data):
+        """
+        Functional model of a run, streaming row ``i`` of
+        ``port_data`` into port ``i``. Returns the sum of every
+        neuron on every cycle, the first ``width - 1`` of
+        which are still filling the chains, as written by
+        its collector. Ports of bias lanes stream ones, and
+        those of residual lanes the residual of the sum
+        collected on each cycle. Collectors keep every
+        ``pace``th sum once the chains are full, and scale
+        sums by the fixed point multiplier and shift of
+        ``ConfigureScales``.
+        """
+        num_mults = len(self.weights)
+        length = port_data.shape[1]
+
+        port_data = np.array(port_data)
+        for port, stream in enumerate(self.ports):
+            if (stream is not None) and (stream[1:] == (None, None)):
+                port_data[port] = 1
+
+        # every mult sees the feature injected at the closest
+        # injecting mult to its right, delayed a cycle a mult
+        port_of = {mult : port for port, mult in
+            enumerate(inject_mults(num_mults, self.num_ports))}
+        source = np.zeros([num_mults], dtype=np.int64)
+        delay = np.zeros([num_mults], dtype=np.int64)
+        feed = None
+        for mult in reversed(range(num_mults)):
+            if self.inject[mult] == InjectEn.on:
+                feed = (port_of[mult], mult)
+            if feed is not None:
+                source[mult], delay[mult] = feed[0], feed[1] - mult
+
+        time = np.arange(length)[:, None] - delay[None, :]
+        features = np.where(time >= 0, port_data[source, np.maximum(time, 0)], 0)
+        products = features*self.weights
+
+        sums = np.zeros([len(self.filters), length], dtype=products.dtype)
+        for cycle in range(length):
+            values = reduce(self.adder_states, list(products[cycle]), self.depth)
+            sums[:, cycle] = [values[node] for node in self.collectors]
+
+        for neuron, scale in enumerate(self.scales[:len(self.filters)]):
+            if scale != 1:
+                multiplier, shift = opcodes.ConfigureScales.fixed_point(scale)
+                sums[neuron] = (sums[neuron]*multiplier)//2**shift
+
+        relus = np.array(self.relus[:len(self.filters)])
+        sums[relus] = np.maximum(sums[relus], 0)
+
+        if self.pace > 1:
+            fill = max(filter_.shape[2] for filter_ in self.filters) - 1
+            sums = np.concatenate([sums[:, :fill], sums[:, fill::self.pace]], axis=1)
+        return sums
+
+def depends(table, rows, row):
+    """
+    Whether ``row`` reads or writes anything the Conv2 rows
+    ``rows`` write, or writes what they read, so it can not
+    run alongside them.
+    """
+    rows = np.array(rows)
+    for position, other_positions in [(X, [RES]), (RESIDUAL, [RES]),
+            (RES, [X, RESIDUAL, RES])]:
+        for other in other_positions:
+            same = table.mem[rows, other] == table.mem[row, position]
+            hit = overlaps(table.start[[row], position], table.stop[[row], position],
+                table.start[rows, other], table.stop[rows, other])[0]
+            if np.any(same & hit):
+                return True
+    return False
+
+def filter_of(table, row):
+    memory = table.memories[table.mem[row, W]]
+    data = memory.data[table.operand_slice(row, W)]
+    return data.reshape(table.extent(W)[row, 1:])
+
+def bias_of(table, row):
+    if table.mem[row, BIAS] < 0:
+        return None
+    memory = table.memories[table.mem[row, BIAS]]
+    return memory.data[table.operand_slice(row, BIAS)]
+
+def conv_mapping(table, rows, depth, num_ports):
+    """
+    Configuration running the Conv2 rows ``rows`` of
+    ``table`` together, a neuron each. Raises ValueError
+    when they do not fit.
+    """
+    return TreeMapping(rows, depth, num_ports, [filter_of(table, row) for row in rows],
+        table.relu[rows], [bias_of(table, row) for row in rows], int(table.stride[rows[-1]]),
+        table.scale[rows], table.mem[rows, RESIDUAL] >= 0)
+
+def gemm_mapping(table, row, depth, num_ports):
+    """
+    Configuration running the Gemm row ``row`` of ``table``,
+    a neuron per output.
+    """
+    memory = table.memories[table.mem[row, W]]
+    weights = np.asarray(memory.data[table.operand_slice(row, W)])
+    weights = weights.reshape(-1, table.extent(W)[row, 3])
+    filters = [weight.reshape(1, 1, -1) for weight in weights]
+    biases = [None]*len(filters)
+    if table.mem[row, BIAS] >= 0:
+        biases = list(np.asarray(bias_of(table, row)).reshape(-1))
+    return TreeMapping([row], depth, num_ports, filters, [table.relu[row]]*len(filters),
+        biases, 1, [table.scale[row]]*len(filters))
+
+def remap(table, mapping):
+    """
+    Builds ``mapping`` again from the current contents of
+    the memories of ``table``, running the same rows.
+    """
+    rows = list(mapping.rows)
+    if table.kind[rows[0]] == OpTable.GEMM:
+        return gemm_mapping(table, rows[0], mapping.depth, mapping.num_ports)
+    return conv_mapping(table, rows, mapping.depth, mapping.num_ports)
+
+def mapping_index(mappings, num_rows):
+    """
+    Index of the mapping running every one of ``num_rows``
+    rows, -1 for rows the tree does not run.
+    """
+    index = np.full([num_rows], -1, dtype=np.int64)
+    for position, mapping in enumerate(mappings):
+        index[mapping.rows] = position
+    return index
+
+def map_table(table, depth, num_ports):
+    """
+    Packs runs of consecutive, independent Conv2 rows of
+    ``table`` that stream rows of the same width through
+    the same filter shape at the same stride into as few
+    tree configurations as will hold them. Every Gemm row
+    gets a configuration of its own, each of its outputs a
+    neuron whose weights are a single filter row, streaming
+    the row's slice of the input vector. Returns the list of
+    ``TreeMapping``.
+    """
+    conv = table.kind == OpTable.CONV
+    gemm = table.kind == OpTable.GEMM
+    pad = table.pad.astype(np.int64)
+    width = table.extent(X)[:, 3] + pad[:, 0] + pad[:, 2]
+    key = np.concatenate([width[:, None], table.extent(W)[:, 1:],
+        table.stride[:, None]], axis=1)
+
+    mappings = []
+    group = []
+    for row in np.nonzero(conv | gemm)[0].tolist():
+        if gemm[row]:
+            group = []
+            mappings += [gemm_mapping(table, row, depth, num_ports)]
+            continue
+
+        packable = group and (row == group[-1] + 1) and\
+            np.all(key[row] == key[group[0]]) and not depends(table, group, row)
+        if packable:
+            try:
+                mapping = conv_mapping(table, group + [row], depth, num_ports)
+                group += [row]
+                mappings[-1] = mapping
+                continue
+            except ValueError:
+                pass
+
+        group = [row]
+        mappings += [conv_mapping(table, group, depth, num_ports)]
+
+    return mappings
@@ -1,7 +1,10 @@
 from maeri.compiler.assembler.states import ConfigForward, ConfigUp
 from maeri.compiler.assembler.states import InjectEn
 
+from maeri.compiler.assembler.signs import to_unsigned
+
 from enum import IntEnum, unique
+from math import floor, log2
 
 bytes_in_address = None
 num_nodes = None
@@ -9,10 +12,12 @@ num_adders = None
 num_mults = None
 num_ports = None
 INPUT_WIDTH = None
+bytes_in_line = None
 
 class InitISA():
     def __init__(self, _bytes_in_address, _num_nodes, 
-            _num_adders, _num_mults, _input_width, _num_ports):
+            _num_adders, _num_mults, _input_width, _num_ports,
+            _bytes_in_line=None):
         global bytes_in_address
         bytes_in_address = _bytes_in_address
 
@@ -31,6 +36,16 @@ class InitISA():
         global INPUT_WIDTH
         INPUT_WIDTH = _input_width
 
+        global bytes_in_line
+        bytes_in_line = _bytes_in_line
+
+def pad_to_lines(config):
+    """
+    Pads the bytes of a config block out to a whole number
+    of memory lines.
+    """
+    return config + [0]*(-len(config) % bytes_in_line)
+
 
 @unique
 class Opcodes(IntEnum):
@@ -44,6 +59,7 @@ class Opcodes(IntEnum):
     store_features = 7
     run = 8
     debug = 9
+    configure_scales = 11
 
 class Reset():
     op = Opcodes.reset
@@ -61,6 +77,12 @@ class ConfigureStates():
         for state in states[num_adders:]:
             assert(state in InjectEn)
 
+    def config(self):
+        """
+        A byte per node, adders first.
+        """
+        return pad_to_lines([int(state) for state in self.states])
+
     @staticmethod
     def num_params():
         return bytes_in_address
@@ -78,6 +100,15 @@ class ConfigureWeights():
 
         self.weights = weights
 
+    def config(self):
+        """
+        A byte per mult. The tree loads whole lines of nodes
+        from the line holding the first mult, so the adders
+        sharing that line are padded with zeros.
+        """
+        weights = [0]*(num_adders % bytes_in_line) + [int(weight) for weight in self.weights]
+        return pad_to_lines([to_unsigned(weight, INPUT_WIDTH) for weight in weights])
+
     @staticmethod
     def num_params():
         return bytes_in_address
@@ -86,7 +117,8 @@ class ConfigureCollectors():
     op = Opcodes.configure_collectors
 
     def __init__(self, node_ids):
-        assert(len(node_ids) == num_nodes)
+        # one node for the collector of every port
+        assert(len(node_ids) == num_ports)
         min = 0
         max = 255
 
@@ -95,6 +127,87 @@ class ConfigureCollectors():
 
         self.node_ids = node_ids
 
+    def config(self):
+        """
+        The node of every port, a byte each, port 0 first.
+        """
+        return pad_to_lines([int(node_id) for node_id in self.node_ids])
+
+    @staticmethod
+    def num_params():
+        return bytes_in_address
+
+class ConfigureRelus():
+    op = Opcodes.configure_relus
+
+    def __init__(self, relu_en):
+        # whether the collector of every port clamps
+        # what it writes at zero
+        assert(len(relu_en) == num_ports)
+        self.relu_en = [bool(en) for en in relu_en]
+
+    def mask(self):
+        """
+        Enables packed a bit per port, port 0 in the least
+        significant bit of the first byte.
+        """
+        mask = sum(int(en) << port for port, en in enumerate(self.relu_en))
+        return list(mask.to_bytes(-(-num_ports//8), 'little'))
+
+    def config(self):
+        # the tree reads the whole mask from one line
+        assert(num_ports <= 8*bytes_in_line)
+        return pad_to_lines(self.mask())
+
+    @staticmethod
+    def num_params():
+        return bytes_in_address
+
+class ConfigureScales():
+    op = Opcodes.configure_scales
+
+    # widest right shift of the collectors, fine enough
+    # that a factor too small for it leaves no int32 sum
+    # above half a step
+    MAX_SHIFT = 31
+
+    def __init__(self, scales):
+        # factor the collector of every port multiplies
+        # what it writes by, before any relu
+        assert(len(scales) == num_ports)
+        self.scales = [float(scale) for scale in scales]
+
+    @staticmethod
+    def fixed_point(scale):
+        """
+        Unsigned 8 bit multiplier and right shift closest to
+        ``scale``, the multiplier keeping as many significant
+        bits as the shift allows. Factors below half the
+        finest step round to a zero multiplier.
+        """
+        assert(0 < scale < 256)
+        shift = min(7 - floor(log2(scale)), ConfigureScales.MAX_SHIFT)
+        multiplier = round(scale*2**shift)
+        if multiplier == 256:
+            multiplier, shift = 128, shift - 1
+        assert(0 <= multiplier < 256)
+        return multiplier, shift
+
+    def params(self):
+        """
+        The multiplier then the shift of every port, a byte
+        each, port 0 first.
+        """
+        params = []
+        for scale in self.scales:
+            params += list(ConfigureScales.fixed_point(scale))
+        return params
+
+    def config(self):
+        # the tree reads whole ports from every line
+        assert(bytes_in_line % 2 == 0)
+        return pad_to_lines(self.params())
+
     @staticmethod
     def num_params():
         return bytes_in_address
@@ -126,6 +239,8 @@ class StoreFeatures():
 class Run():
     op = Opcodes.run
 
+    # collectors keep one sum every ``pace`` cycles, those
+    # of the windows a strided filter keeps
     def __init__(self, len_runtime, pace):
         self.len_runtime = len_runtime
         self.pace = pace
@@ -0,0 +1,232 @@
+"""
+Configures the adder tree so that several virtual neurons,
+each a contiguous segment of mults, are reduced inside the
+tree in a single pass.
+
+Adders whose children belong to the same neuron sum them
+with ``sum_l_r``. Where a neuron straddles two subtrees,
+the adder on one side sends its part over the forwarding
+link and its neighbour folds it in with ``sum_l_r_f``, so
+partial sums never leave the tree. Each neuron is then
+collected from the lowest adder holding its full sum.
+
+Nodes are numbered as in ``Skeleton``, the root being 0.
+"""
+from maeri.compiler.assembler.states import ConfigForward, ConfigUp
+
+from itertools import product
+
+# values carried on a link are labelled by the neuron
+# they belong to and the number of its products summed
+ZERO = None
+DIRTY = 'dirty'
+INVALID = 'invalid'
+
+# candidate adder states, most preferred first
+STATES = [ConfigUp.sum_l_r, ConfigUp.sum_l_r_f, ConfigUp.l,
+    ConfigUp.r, ConfigForward.sum_l_r]
+
+def add(*labels):
+    total = ZERO
+    for label in labels:
+        if label is ZERO:
+            continue
+        if (total is ZERO) or (label is INVALID):
+            total = label
+        elif (total is DIRTY) and (label is DIRTY):
+            total = DIRTY
+        elif (total is DIRTY) or (label is DIRTY) or (total is INVALID):
+            total = INVALID
+        elif total[0] != label[0]:
+            total = INVALID
+        else:
+            total = (total[0], total[1] + label[1])
+    return total
+
+def outputs(state, lhs, rhs, forward_in):
+    """
+    Returns the up and forward labels of an adder in
+    ``state``, as in the table of ``states``.
+    """
+    if state == ConfigUp.sum_l_r:
+        return add(lhs, rhs), ZERO
+    if state == ConfigForward.sum_l_r:
+        return ZERO, add(lhs, rhs)
+    if state == ConfigUp.sum_l_r_f:
+        return add(lhs, rhs, forward_in), ZERO
+    if state == ConfigUp.l:
+        return lhs, rhs
+    if state == ConfigUp.r:
+        return rhs, lhs
+
+    raise ValueError(f"Unknown adder state {state}.")
+
+def forward_partner(node):
+    """
+    Heap numbered (root is 1) neighbour sharing a forwarding
+    link with ``node``, or None. Links join the right child
+    of one adder to the left child of the next.
+    """
+    is_power = lambda value: (value & (value - 1)) == 0
+    if (node % 2 == 1) and not is_power(node + 1):
+        return node + 1
+    if (node % 2 == 0) and not is_power(node):
+        return node - 1
+    return None
+
+# bound on the number of adder groups tried before giving up
+# on a layout, since infeasible layouts are searched exhaustively
+SEARCH_LIMIT = 20000
+
+def reduction_states(segments, depth):
+    """
+    Returns the adder states reducing each ``(first, end)``
+    segment of mults, indexed by adder id, along with the id
+    of the adder to collect each segment's sum from.
+
+    Mults outside every segment must hold a zero weight.
+    Raises ``ValueError`` when the segments cannot all be
+    reduced within the tree.
+    """
+    num_mults = 2**(depth - 1)
+    lengths = [end - first for first, end in segments]
+    assert(all(0 <= first < end <= num_mults for first, end in segments))
+
+    # labels of the up link of every heap numbered node
+    up = [ZERO]*(2*num_mults)
+    for neuron, (first, end) in enumerate(segments):
+        for mult in range(first, end):
+            assert(up[num_mults + mult] is ZERO)
+            up[num_mults + mult] = (neuron, 1)
+
+    def complete(label):
+        return isinstance(label, tuple) and (label[1] == lengths[label[0]])
+
+    # adders sharing a forwarding link are configured
+    # together, level by level from the mults up
+    groups = []
+    for level in reversed(range(depth - 1)):
+        for node in range(2**level, 2**(level + 1)):
+            partner = forward_partner(node)
+            if (partner is None) or (node < partner):
+                groups += [[node] if partner is None else [node, partner]]
+
+    states = [ConfigUp.sum_l_r]*num_mults
+    budget = [SEARCH_LIMIT]
+
+    def options(group):
+        # children holding a complete sum are collected
+        # there, so adders above ignore their value
+        children = {}
+        for node in group:
+            for child in [2*node, 2*node + 1]:
+                label = up[child]
+                if (child < num_mults) and complete(label):
+                    label = DIRTY
+                children[child] = label
+
+        found = {}
+        for choice in product(STATES, repeat=len(group)):
+            labels = evaluate(group, choice, children)
+            if labels is None:
+                continue
+            cost = sum(STATES.index(state) for state in choice)
+            key = tuple(labels)
+            if (key not in found) or (cost < found[key][0]):
+                found[key] = (cost, choice, labels)
+        return sorted(found.values(), key=lambda option: option[0])
+
+    def search(index):
+        if index == len(groups):
+            return all(any(complete(label) and (label[0] == neuron) for label in up[1:num_mults])
+                for neuron in range(len(segments)))
+
+        budget[0] -= 1
+        if budget[0] < 0:
+            return False
+
+        group = groups[index]
+        for cost, choice, labels in options(group):
+            for node, state, label in zip(group, choice, labels):
+                states[node] = state
+                up[node] = label
+            if search(index + 1):
+                return True
+        return False
+
+    if not search(0):
+        raise ValueError(f"Unable to reduce segments {segments} within the tree.")
+
+    # each neuron is collected from the lowest adder
+    # holding its full sum
+    collectors = [None]*len(segments)
+    for node in reversed(range(1, num_mults)):
+        if complete(up[node]) and (collectors[up[node][0]] is None):
+            collectors[up[node][0]] = node - 1
+
+    return states[1:], collectors
+
+def evaluate(group, choice, up):
+    """
+    Up labels of a group of adders sharing a forwarding
+    link, given the labels ``up`` of their children, or None
+    when ``choice`` mixes neurons or drops part of a sum.
+    """
+    forwards = []
+    for node, state in zip(group, choice):
+        _, forward = outputs(state, up[2*node], up[2*node + 1], ZERO)
+        forwards += [forward]
+
+    labels = []
+    for index, (node, state) in enumerate(zip(group, choice)):
+        forward_in = forwards[1 - index] if len(group) == 2 else ZERO
+        label, _ = outputs(state, up[2*node], up[2*node + 1], forward_in)
+        if label is INVALID:
+            return None
+
+        # a forwarded sum is lost unless the partner adds it
+        partner_state = choice[1 - index] if len(group) == 2 else None
+        if isinstance(forwards[index], tuple) and (partner_state != ConfigUp.sum_l_r_f):
+            return None
+        labels += [label]
+
+    return labels
+
+def reduce(states, products, depth):
+    """
+    Functional model of the adder tree, returning the value
+    on the up link of every node given the product of every
+    mult.
+    """
+    num_mults = 2**(depth - 1)
+    assert(len(products) == num_mults)
+    values = [0]*num_mults + list(products)
+    heap_states = [None] + list(states)
+
+    for level in reversed(range(depth - 1)):
+        nodes = range(2**level, 2**(level + 1))
+        forwards = {}
+        for node in nodes:
+            _, forward = apply(heap_states[node], values[2*node], values[2*node + 1], 0)
+            forwards[node] = forward
+        for node in nodes:
+            partner = forward_partner(node)
+            forward_in = 0 if partner is None else forwards[partner]
+            values[node], _ = apply(heap_states[node], values[2*node],
+                values[2*node + 1], forward_in)
+
+    return values[1:]
+
+def apply(state, lhs, rhs, forward_in):
+    if state == ConfigUp.sum_l_r:
+        return lhs + rhs, 0
+    if state == ConfigForward.sum_l_r:
+        return 0, lhs + rhs
+    if state == ConfigUp.sum_l_r_f:
+        return lhs + rhs + forward_in, 0
+    if state == ConfigUp.l:
+        return lhs, rhs
+    if state == ConfigUp.r:
+        return rhs, lhs
+
+    raise ValueError(f"Unknown adder state {state}.")
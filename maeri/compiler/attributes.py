@@ -0,0 +1,12 @@
+from onnx.helper import get_attribute_value
+
+def get_attribute(node, name, default):
+    """
+    Value of the attribute ``name`` of the onnx ``node``,
+    ``default`` when it is not set.
+    """
+    for attribute in node.attribute:
+        if attribute.name == name:
+            return get_attribute_value(attribute)
+
+    return default
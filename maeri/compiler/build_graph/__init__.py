@@ -1,11 +1,18 @@
+from .build_add import build_add
 from .build_conv import build_conv
+from .build_gemm import build_gemm
 from .build_memories import build_memories
+from .build_pool import build_average_pool, build_global_average_pool
 from .build_result import build_result
 from .build_root import build_root
 
 
 __all__ = [
+    "build_add",
+    "build_average_pool",
     "build_conv",
+    "build_gemm",
+    "build_global_average_pool",
     "build_memories",
     "build_result",
     "build_root"
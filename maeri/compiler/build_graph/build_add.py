@@ -0,0 +1,44 @@
+from maeri.common.logger import logger, LogIndent
+from maeri.compiler.nodes import Input, Output
+from maeri.compiler.nodes import Add
+
+def build_add(add_node, name_v_mem):
+    A = add_node.input[0]
+    B = add_node.input[1]
+    C = add_node.output[0]
+
+    a_mem = name_v_mem[A]
+    b_mem = name_v_mem[B]
+    c_mem = name_v_mem[C]
+
+    a_dims = a_mem.data.shape
+    b_dims = b_mem.data.shape
+    c_dims = c_mem.data.shape
+
+    # Compiler currently unable to reason about
+    # broadcasting adds
+    if not (a_dims == b_dims == c_dims):
+        raise NotImplementedError("Compiler does not yet support broadcasting" +\
+            f" adds, got {a_dims} + {b_dims} -> {c_dims}.")
+
+    # Compiler currently unable to reason about add
+    # inputs that are not 4d
+    assert(len(c_dims) == 4)
+    assert(c_dims[0] == 1)
+
+    ops = []
+    mems = []
+
+    h_size_slice = slice(0, c_dims[2])
+    w_size_slice = slice(0, c_dims[3])
+
+    # one add per channel, so that each row of the
+    # channel maps onto a port
+    for channel in range(c_dims[1]):
+        slice_ = (0, channel, h_size_slice, w_size_slice)
+        a = Input(slice_, a_mem)
+        b = Input(slice_, b_mem)
+        c = Output(slice_, c_mem)
+        ops += [Add(a, b, c)]
+
+    return ops, mems
@@ -1,6 +1,6 @@
 from maeri.common.logger import logger, LogIndent
-from maeri.compiler.nodes import Memory, Input, Output
-from maeri.compiler.nodes import Conv2, Add
+from maeri.compiler.nodes import Input, Output
+from maeri.compiler.nodes import Conv2
 
 import numpy as np
 
@@ -12,13 +12,28 @@ def get_pads(conv_node):
     
     return pads
 
+def get_stride(conv_node):
+    for attribute in conv_node.attribute:
+        if attribute.name == 'strides':
+            return attribute.ints[0]
+    
+    return 1
+
+def get_group(conv_node):
+    for attribute in conv_node.attribute:
+        if attribute.name == 'group':
+            return attribute.i
+    
+    return 1
+
 def build_conv(conv_node, name_v_mem):
     INPUT = conv_node.input[0]
     FILTER = conv_node.input[1]
     OUTPUT = conv_node.output[0]
-    if len(conv_node.input) == 3:
-        BIAS = conv_node.input[2]
-        raise NotImplementedError("Compiler does not yet support bias.")
+    # an empty name marks an omitted optional input, and
+    # a fused residual follows the bias
+    BIAS = conv_node.input[2] if len(conv_node.input) >= 3 else ""
+    RESIDUAL = conv_node.input[3] if len(conv_node.input) == 4 else ""
 
     input_mem = name_v_mem[INPUT]
     filter_mem = name_v_mem[FILTER]
@@ -32,6 +47,24 @@ def build_conv(conv_node, name_v_mem):
     # and outputs
     assert(output_dims[1] == filter_dims[0])
 
+    # every group of output channels reads its own
+    # group of input channels
+    group = get_group(conv_node)
+    assert(input_dims[1] == filter_dims[1]*group)
+    assert(filter_dims[0] % group == 0)
+    outputs_in_group = filter_dims[0]//group
+
+    # a bias holds an element per output channel
+    bias_mem = name_v_mem[BIAS] if BIAS else None
+    if bias_mem is not None:
+        assert(bias_mem.data.shape == (filter_dims[0],))
+
+    # a residual is summed elementwise into the result
+    residual_mem = name_v_mem[RESIDUAL] if RESIDUAL else None
+    if (residual_mem is not None) and (residual_mem.data.shape != output_dims):
+        raise NotImplementedError("Compiler does not yet support broadcasting " +\
+            f"residuals, got {residual_mem.data.shape} into {output_dims}.")
+
     # Compiler currently unable to reason about conv
     # inputs that are not 4d
     assert(len(input_dims) == 4)
@@ -56,6 +89,11 @@ def build_conv(conv_node, name_v_mem):
     assert(pads[0] == pads[1] == pads[2] == pads[3])
     pad = pads[0]
 
+    # only the outputs at multiples of the stride are
+    # ever computed
+    stride = get_stride(conv_node)
+    assert(output_dims[2] == (input_dims[2] + 2*pad - filter_dims[2])//stride + 1)
+
     # compiler currently unable to support more padding
     # than the filter depth
     assert(pad < filter_dims[2])
@@ -68,50 +106,34 @@ def build_conv(conv_node, name_v_mem):
     i_size_slice = slice(0, input_dims[2])
     o_size_slice = slice(0, output_dims[2])
 
-    # if there is only one channel
-    if filter_dims[1] == 1:
-        for output in range(filter_dims[0]):
-            input_slice = (0, 0, i_size_slice, i_size_slice)
-            X = Input(input_slice, input_mem)
+    # each output channel is a single op over every input
+    # channel of its group, the tree sums across channels
+    # so partial sums never go back to memory. Ops of a
+    # depthwise conv each read a single channel
+    if filter_dims[1] < 1:
+        raise ValueError(f"filter_dims[1] of {filter_dims[1]} is less than 1.")
+    c_size_slice = slice(0, filter_dims[1])
 
-            filter_slice = (output, 0, f_size_slice, f_size_slice)
-            W = Input(filter_slice, filter_mem)
+    for output in range(filter_dims[0]):
+        first = (output//outputs_in_group)*filter_dims[1]
+        group_slice = slice(first, first + filter_dims[1])
+        input_slice = (0, group_slice, i_size_slice, i_size_slice)
+        X = Input(input_slice, input_mem)
 
-            output_slice = (0, output, o_size_slice, o_size_slice)
-            res = Output(output_slice, output_mem)
+        filter_slice = (output, c_size_slice, f_size_slice, f_size_slice)
+        W = Input(filter_slice, filter_mem)
 
-            ops += [Conv2(X, W, res, [pad]*4)]
-    
-    # if there is more than one channel
-    elif filter_dims[1] > 1:
-        # TODO, return buffer
-        buffer_mem = Memory(np.zeros([1,1,output_dims[2],output_dims[2]]))
-        mems += [buffer_mem]
-        buffer_slice = (0, 0, o_size_slice, o_size_slice)
-
-        for output in range(filter_dims[0]):
-            for channel in range(filter_dims[1]):
-                input_slice = (0, channel, i_size_slice, i_size_slice)
-                X = Input(input_slice, input_mem)
-
-                filter_slice = (output, channel, f_size_slice, f_size_slice)
-                W = Input(filter_slice, filter_mem)
-
-                output_slice = (0, output, o_size_slice, o_size_slice)
-
-                if channel == 0:
-                    res = Output(output_slice, output_mem)
-                    ops += [Conv2(X, W, res, [pad]*4)]
-
-                else:
-                    buf_res = Output(buffer_slice, buffer_mem)
-                    
-                    a = Input(output_slice, output_mem)
-                    b = Input(buffer_slice, buffer_mem)
-                    c = Output(output_slice, output_mem)
-                    ops += [Conv2(X, W, buf_res, [pad]*4), Add(a, b, c)]
-
-    else:
-        raise ValueError(f"filter_dims[1] of {filter_dims[1]} is less than 1.")
+        output_slice = (0, output, o_size_slice, o_size_slice)
+        res = Output(output_slice, output_mem)
+
+        B = None
+        if bias_mem is not None:
+            B = Input((output,), bias_mem)
+
+        R = None
+        if residual_mem is not None:
+            R = Input(output_slice, residual_mem)
+
+        ops += [Conv2(X, W, res, [pad]*4, B=B, stride=stride, R=R)]
 
     return ops, mems
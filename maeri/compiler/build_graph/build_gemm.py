@@ -0,0 +1,75 @@
+from maeri.common.logger import logger, LogIndent
+from maeri.compiler.nodes import Input, Output
+from maeri.compiler.nodes import Gemm, Memory
+from maeri.compiler.attributes import get_attribute
+
+import numpy as np
+
+def whole(shape):
+    return tuple(slice(0, length) for length in shape)
+
+def build_gemm(gemm_node, name_v_mem):
+    """
+    Lowers a Gemm, or a MatMul, of a single input vector by
+    a matrix of weights into one Gemm op. ``alpha`` becomes
+    the scale of the op and ``beta`` is folded into its bias.
+    """
+    INPUT = gemm_node.input[0]
+    WEIGHTS = gemm_node.input[1]
+    OUTPUT = gemm_node.output[0]
+    # an empty name marks an omitted optional input
+    BIAS = gemm_node.input[2] if len(gemm_node.input) == 3 else ""
+
+    input_mem = name_v_mem[INPUT]
+    weight_mem = name_v_mem[WEIGHTS]
+    output_mem = name_v_mem[OUTPUT]
+
+    input_dims = input_mem.data.shape
+    weight_dims = weight_mem.data.shape
+    output_dims = output_mem.data.shape
+
+    alpha = get_attribute(gemm_node, 'alpha', 1.0)
+    beta = get_attribute(gemm_node, 'beta', 1.0)
+    trans_A = get_attribute(gemm_node, 'transA', 0)
+    trans_B = get_attribute(gemm_node, 'transB', 0)
+
+    # Compiler currently unable to reason about more than
+    # a single input vector, which may be a flattened
+    # tensor with every other dimension of length 1
+    assert(trans_A == 0)
+    assert(np.count_nonzero(np.array(input_dims) > 1) <= 1)
+    assert(np.count_nonzero(np.array(output_dims) > 1) <= 1)
+    K = int(np.prod(input_dims))
+    N = int(np.prod(output_dims))
+
+    ops = []
+    mems = []
+
+    # weights are held a row per output, a MatMul's
+    # are transposed into a memory of their own
+    assert(len(weight_dims) == 2)
+    if not trans_B:
+        weight_mem = Memory(np.ascontiguousarray(weight_mem.data.T))
+        mems += [weight_mem]
+    assert(weight_mem.data.shape == (N, K))
+
+    # the bias is added before the result is scaled by
+    # alpha, so it is held as beta/alpha times C
+    B = None
+    if BIAS:
+        bias_mem = name_v_mem[BIAS]
+        assert(bias_mem.data.size == N)
+        if beta != alpha:
+            if bias_mem.dtype.kind != 'f':
+                raise NotImplementedError("Gemm with an integer bias only " +\
+                    "supported when alpha equals beta.")
+            bias_mem = Memory((bias_mem.data*(beta/alpha)).astype(bias_mem.dtype))
+            mems += [bias_mem]
+        B = Input(whole(bias_mem.data.shape), bias_mem)
+
+    A = Input(whole(input_dims), input_mem)
+    W = Input(whole((N, K)), weight_mem)
+    res = Output(whole(output_dims), output_mem)
+    ops += [Gemm(A, W, res, B=B, scale=alpha)]
+
+    return ops, mems
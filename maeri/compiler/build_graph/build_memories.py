@@ -1,9 +1,101 @@
 from maeri.common.logger import logger, LogIndent
 from maeri.compiler.nodes import Memory
+from maeri.compiler.nodes.Memory import compact_dtype
 
+from onnx import TensorProto
 import numpy as np
+import os
 
-def build_memories(model):
+try:
+    from onnx.helper import tensor_dtype_to_np_dtype
+except ImportError:
+    from onnx.mapping import TENSOR_TYPE_TO_NP_TYPE
+    tensor_dtype_to_np_dtype = lambda data_type: TENSOR_TYPE_TO_NP_TYPE[data_type]
+
+# typed field holding the data of tensors not stored
+# as raw bytes, by data type
+typed_fields = {
+    TensorProto.FLOAT : 'float_data',
+    TensorProto.DOUBLE : 'double_data',
+    TensorProto.INT64 : 'int64_data',
+    TensorProto.UINT32 : 'uint64_data',
+    TensorProto.UINT64 : 'uint64_data',
+    TensorProto.INT32 : 'int32_data',
+    TensorProto.INT16 : 'int32_data',
+    TensorProto.INT8 : 'int32_data',
+    TensorProto.UINT16 : 'int32_data',
+    TensorProto.UINT8 : 'int32_data',
+    TensorProto.BOOL : 'int32_data',
+    TensorProto.FLOAT16 : 'int32_data',
+    }
+
+def load_external(tensor, dtype, dims, base_dir):
+    """
+    Memory maps the external data file of ``tensor``, read
+    only, so its data is paged in as it is used.
+    """
+    info = {entry.key : entry.value for entry in tensor.external_data}
+    if base_dir is None:
+        raise ValueError(f"Initializer {tensor.name} has external data but " +\
+            "the model directory is unknown.")
+
+    path = os.path.join(base_dir, info['location'])
+    offset = int(info.get('offset', 0))
+    count = int(np.prod(dims))
+    if ('length' in info) and (int(info['length']) != count*dtype.itemsize):
+        raise ValueError(f"Initializer {tensor.name} has {info['length']} bytes " +\
+            f"of external data but needs {count*dtype.itemsize}.")
+
+    return np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=(count,)).reshape(dims)
+
+def load_initializer(tensor, base_dir=None):
+    """
+    Returns the data of an initializer as a numpy array.
+    Raw and external data are viewed in place rather than
+    copied, and a tensor holding no data is an error.
+    """
+    dims = tuple(tensor.dims)
+    dtype = np.dtype(tensor_dtype_to_np_dtype(tensor.data_type)).newbyteorder('<')
+
+    if int(np.prod(dims)) == 0:
+        return np.zeros(dims, dtype=dtype)
+
+    if tensor.data_location == TensorProto.EXTERNAL:
+        return load_external(tensor, dtype, dims, base_dir)
+
+    if tensor.raw_data:
+        return np.frombuffer(tensor.raw_data, dtype=dtype).reshape(dims)
+
+    field = typed_fields.get(tensor.data_type)
+    if field is None:
+        raise NotImplementedError(f"Initializer {tensor.name} has unsupported " +\
+            f"data type {tensor.data_type}.")
+
+    values = getattr(tensor, field)
+    if not values:
+        raise ValueError(f"Initializer {tensor.name} has no data.")
+
+    # float16 values are stored as their bits
+    if tensor.data_type == TensorProto.FLOAT16:
+        return np.array(values, dtype=np.uint16).view(np.float16).reshape(dims)
+    return np.array(values, dtype=dtype).reshape(dims)
+
+def value_dtype(value):
+    """
+    Type a memory for the value ``value`` is allocated with.
+    """
+    elem_type = value.type.tensor_type.elem_type
+    if elem_type == TensorProto.UNDEFINED:
+        return compact_dtype(np.float32)
+    return compact_dtype(tensor_dtype_to_np_dtype(elem_type))
+
+def build_memories(model, base_dir=None):
+    """
+    Creates a memory for every tensor in ``model``, each in
+    the compact dtype of its element type. External
+    initializer data is found relative to ``base_dir``,
+    usually the directory holding the model.
+    """
 
     name_v_mem = {}
 
@@ -15,7 +107,7 @@ def build_memories(model):
     with LogIndent():
         for input_ in model.graph.input:
             dims = [dim.dim_value for dim in input_.type.tensor_type.shape.dim]
-            data = np.zeros(dims)
+            data = np.zeros(dims, dtype=value_dtype(input_))
 
             # add memory node to lists
             name_v_mem[input_.name] = Memory(data)
@@ -25,7 +117,7 @@ def build_memories(model):
     with LogIndent():
         for input_ in model.graph.value_info:
             dims = [dim.dim_value for dim in input_.type.tensor_type.shape.dim]
-            data = np.zeros(dims)
+            data = np.zeros(dims, dtype=value_dtype(input_))
 
             # add memory node to lists
             name_v_mem[input_.name] = Memory(data)
@@ -38,7 +130,7 @@ def build_memories(model):
     with LogIndent():
         for input_ in model.graph.output:
             dims = [dim.dim_value for dim in input_.type.tensor_type.shape.dim]
-            data = np.zeros(dims)
+            data = np.zeros(dims, dtype=value_dtype(input_))
 
             # add memory node to lists
             name_v_mem[input_.name] = Memory(data)
@@ -50,15 +142,9 @@ def build_memories(model):
     logger.debug("Adding memory for model.graph.initializer")
     with LogIndent():
         for input_ in model.graph.initializer:
-            dims = input_.dims
+            data = load_initializer(input_, base_dir)
+            data = data.astype(compact_dtype(data.dtype), copy=False)
 
-            # get data for memory instance
-            if input_.float_data:
-                data = np.array(input_.float_data).reshape(dims)
-            else:
-                logger.debug(f"{input_.name} has no data")
-                data = np.zeros(dims)
-            
             # add memory node to lists
             name_v_mem[input_.name] = Memory(data)
             if input_.name in input_names + valueinfo_names + output_names:
@@ -0,0 +1,86 @@
+from maeri.common.logger import logger, LogIndent
+from maeri.compiler.nodes import Input, Output
+from maeri.compiler.nodes import Conv2, Memory
+from maeri.compiler.build_graph.build_conv import get_pads, get_stride
+
+import numpy as np
+
+def get_kernel(pool_node):
+    for attribute in pool_node.attribute:
+        if attribute.name == 'kernel_shape':
+            return list(attribute.ints)
+
+    return []
+
+def build_pool(input_mem, output_mem, kernel, pad, stride):
+    """
+    Lowers an average pool of ``kernel`` by ``kernel``
+    windows into a Conv2 op per channel. Every op sums its
+    window through a filter of ones and scales the sum by
+    the size of the window as it is written.
+    """
+    input_dims = input_mem.data.shape
+    output_dims = output_mem.data.shape
+
+    # SANITY CHECK : pooling keeps the channels
+    assert(input_dims[:2] == output_dims[:2])
+
+    # Compiler currently unable to reason about pool
+    # inputs that are not 4d or not square
+    assert(len(input_dims) == 4)
+    assert(input_dims[0] == 1)
+    assert(input_dims[2] == input_dims[3])
+    assert(output_dims[2] == (input_dims[2] + 2*pad - kernel)//stride + 1)
+
+    # compiler currently unable to support more padding
+    # than the window
+    assert(pad < kernel)
+
+    # every channel shares the one filter of ones
+    ones = Memory(np.ones([1, 1, kernel, kernel], dtype=input_mem.dtype))
+    mems = [ones]
+    ops = []
+
+    k_size_slice = slice(0, kernel)
+    i_size_slice = slice(0, input_dims[2])
+    o_size_slice = slice(0, output_dims[2])
+
+    for channel in range(input_dims[1]):
+        input_slice = (0, slice(channel, channel + 1), i_size_slice, i_size_slice)
+        X = Input(input_slice, input_mem)
+
+        W = Input((0, slice(0, 1), k_size_slice, k_size_slice), ones)
+
+        output_slice = (0, channel, o_size_slice, o_size_slice)
+        res = Output(output_slice, output_mem)
+
+        ops += [Conv2(X, W, res, [pad]*4, stride=stride, scale=1/kernel**2)]
+
+    return ops, mems
+
+def build_average_pool(pool_node, name_v_mem):
+    INPUT = pool_node.input[0]
+    OUTPUT = pool_node.output[0]
+
+    kernel = get_kernel(pool_node)
+    assert(len(kernel) == 2)
+    assert(kernel[0] == kernel[1])
+
+    # padding counts towards the window, which sanitize
+    # checks for any padded pool
+    pads = get_pads(pool_node) or [0]*4
+    assert(len(pads) == 4)
+    assert(pads[0] == pads[1] == pads[2] == pads[3])
+
+    return build_pool(name_v_mem[INPUT], name_v_mem[OUTPUT], kernel[0],
+        pads[0], get_stride(pool_node))
+
+def build_global_average_pool(pool_node, name_v_mem):
+    INPUT = pool_node.input[0]
+    OUTPUT = pool_node.output[0]
+
+    # a single window over the whole of every channel
+    input_mem = name_v_mem[INPUT]
+    kernel = input_mem.data.shape[-1]
+
+    return build_pool(input_mem, name_v_mem[OUTPUT], kernel, 0, 1)
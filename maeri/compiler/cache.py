@@ -0,0 +1,433 @@
+"""
+On disk cache of compiled models.
+
+Entries are keyed by a hash of the onnx model bytes, any
+external data files they reference, the target and
+quantization parameters and the sources of every module
+the compiler imports, so editing any of them produces a
+fresh compile. Writes go to a temporary file that is
+atomically renamed into place, so concurrent writers never
+expose a partial entry, and the least recently used
+entries are evicted once the cache grows past its limits.
+
+An entry only holds data, the arrays of a compile in an
+npz archive along with a JSON manifest of everything else,
+and is loaded without unpickling anything, so a shared
+cache directory can not run code in the process reading
+it.
+"""
+from maeri.common.logger import logger
+from maeri.compiler.compile import Compile
+from maeri.compiler.nodes import Memory, OpTable, Root, Result
+from maeri.compiler.plan_memory import MemoryPlan
+from maeri.compiler.quantize import Quantizer
+
+from hashlib import sha256
+from onnx import TensorProto
+import numpy as np
+import tempfile
+import onnx
+import json
+import ast
+import os
+
+default_path = os.environ.get('MAERI_CACHE',
+    os.path.join(os.path.expanduser('~'), '.cache', 'maeri'))
+
+# version of the layout of cache entries
+FORMAT = 1
+
+_compiler_version = None
+
+def module_file(root, name):
+    """
+    Source file of the module ``name`` of the package in
+    ``root``, None when it is not a module of the package.
+    """
+    parts = name.split('.')
+    if parts[0] != os.path.basename(root):
+        return None
+    path = os.path.join(os.path.dirname(root), *parts)
+    for candidate in [path + '.py', os.path.join(path, '__init__.py')]:
+        if os.path.isfile(candidate):
+            return candidate
+    return None
+
+def imported_files(root, path):
+    """
+    Source files of the modules of the package in ``root``
+    that the module at ``path`` imports, along with the
+    ``__init__`` of every package they are in.
+    """
+    with open(path, 'rb') as source:
+        tree = ast.parse(source.read(), path)
+
+    package = os.path.relpath(os.path.dirname(path), os.path.dirname(root)).split(os.sep)
+    names = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names += [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom):
+            if node.level:
+                base = package[:len(package) - node.level + 1]
+                module = '.'.join(base + ([node.module] if node.module else []))
+            else:
+                module = node.module or ''
+            # a name imported from a package may be a module
+            names += [module] + [f"{module}.{alias.name}" for alias in node.names]
+
+    files = set()
+    for name in names:
+        parts = name.split('.')
+        for end in range(1, len(parts) + 1):
+            found = module_file(root, '.'.join(parts[:end]))
+            if found is not None:
+                files.add(found)
+    return files
+
+def compiler_sources():
+    """
+    Source files of every module the compiler depends on,
+    following imports from ``maeri.compiler`` into the
+    rest of the ``maeri`` package. Tests are left out.
+    """
+    compiler = os.path.dirname(os.path.abspath(__file__))
+    root = os.path.dirname(compiler)
+
+    pending = []
+    for directory, subdirectories, files in os.walk(compiler):
+        subdirectories[:] = [name for name in subdirectories if name != 'tests']
+        pending += [os.path.join(directory, name) for name in files if name.endswith('.py')]
+
+    sources = set()
+    while pending:
+        path = pending.pop()
+        if path in sources:
+            continue
+        sources.add(path)
+        pending += list(imported_files(root, path) - sources)
+    return root, sorted(sources)
+
+def compiler_version():
+    """
+    Hash of the sources of every module the compiler
+    depends on, computed once per process.
+    """
+    global _compiler_version
+    if _compiler_version is None:
+        digest = sha256()
+        root, sources = compiler_sources()
+        for path in sources:
+            digest.update(os.path.relpath(path, root).encode())
+            with open(path, 'rb') as source:
+                digest.update(source.read())
+        _compiler_version = digest.hexdigest()
+
+    return _compiler_version
+
+def external_files(model_bytes, base_dir):
+    """
+    Paths of the external data files the initializers of
+    the model in ``model_bytes`` reference, relative to
+    ``base_dir``.
+    """
+    model = onnx.load_from_string(model_bytes)
+    locations = set()
+    for init in model.graph.initializer:
+        if init.data_location == TensorProto.EXTERNAL:
+            locations |= {entry.value for entry in init.external_data
+                if entry.key == 'location'}
+    return [os.path.join(base_dir, location) for location in sorted(locations)]
+
+def cache_key(model_bytes, params, base_dir=None):
+    """
+    Hash of a compile of ``model_bytes`` with ``params``,
+    covering the contents of any external data files the
+    model references from ``base_dir``.
+    """
+    digest = sha256()
+    digest.update(model_bytes)
+    if base_dir is not None:
+        for path in external_files(model_bytes, base_dir):
+            digest.update(os.path.basename(path).encode())
+            with open(path, 'rb') as data:
+                digest.update(data.read())
+    digest.update(json.dumps(params, sort_keys=True).encode())
+    digest.update(compiler_version().encode())
+    return digest.hexdigest()
+
+def encode_slices(slices):
+    return [[item.start, item.stop, item.step] if isinstance(item, slice) else int(item)
+        for item in slices]
+
+def decode_slices(items):
+    return tuple(slice(*item) if isinstance(item, list) else item for item in items)
+
+def compile_image(compiled):
+    """
+    Splits ``compiled`` into a JSON manifest and a dict of
+    numpy arrays, holding no Python objects. Memories are
+    numbered, and the op graph is stored as an ``OpTable``.
+    """
+    table = compiled.op_graph
+    if not isinstance(table, OpTable):
+        table = OpTable.from_ops(table, list(compiled.memories))
+
+    memories = list(table.memories)
+    index_by_id = {id(memory) : index for index, memory in enumerate(memories)}
+    def index_of(memory):
+        if memory is None:
+            return None
+        if id(memory) not in index_by_id:
+            index_by_id[id(memory)] = len(memories)
+            memories.append(memory)
+        return index_by_id[id(memory)]
+
+    manifest = {
+        'format' : FORMAT,
+        'buff_length' : compiled.buff_length,
+        'ports' : compiled.ports,
+        'mults' : compiled.mults,
+        'topology' : compiled.topology,
+        'table_memories' : len(table.memories),
+        'memories' : [index_of(memory) for memory in compiled.memories],
+        'entrypoint' : [index_of(compiled.entrypoint.mem_ref),
+            encode_slices(compiled.entrypoint.slice)],
+        'exitpoint' : [index_of(compiled.exitpoint.mem_ref),
+            encode_slices(compiled.exitpoint.slice)],
+        }
+    arrays = {f"table_{name}" : getattr(table, name) for name in OpTable.column_names}
+
+    if hasattr(compiled, 'dataflows'):
+        manifest['dataflows'] = list(compiled.dataflows)
+
+    plan = getattr(compiled, 'plan', None)
+    if plan is not None:
+        manifest['zeros'] = index_of(compiled.zeros)
+        manifest['ones'] = index_of(compiled.ones)
+        manifest['plan'] = {
+            'b_in_line' : plan.b_in_line,
+            'm_depth' : plan.m_depth,
+            'base' : plan.base,
+            'peak' : int(plan.peak),
+            'unshared' : int(plan.unshared),
+            'zeros' : index_of(plan.zeros),
+            'lines' : [[index_of(memory), int(lines)] for memory, lines in plan.lines.items()],
+            'lifetimes' : [[index_of(memory), int(first), int(last)]
+                for memory, (first, last) in plan.lifetimes.items()],
+            }
+
+    quantizer = compiled.quantizer
+    if quantizer is not None:
+        scales = list(quantizer.scales.items())
+        requant = list(quantizer.requant.items())
+        manifest['quantizer'] = {
+            'per_channel' : quantizer.per_channel,
+            'input' : None if quantizer.input is None else float(quantizer.input),
+            'output' : None if quantizer.output is None else float(quantizer.output),
+            'scales' : [[name, isinstance(scale, np.ndarray)] for name, scale in scales],
+            'requant' : [name for name, _ in requant],
+            }
+        for index, (_, scale) in enumerate(scales):
+            arrays[f"scale_{index}"] = np.asarray(scale)
+        for index, (_, factors) in enumerate(requant):
+            arrays[f"requant_{index}"] = np.asarray(factors)
+
+    # memories numbered as they were found, the table's first
+    manifest['offsets'] = [memory.offset for memory in memories]
+    for index, memory in enumerate(memories):
+        arrays[f"memory_{index}"] = np.asarray(memory.data)
+
+    for name, array in arrays.items():
+        if array.dtype.hasobject:
+            raise ValueError(f"Cache entries hold only data, {name} holds objects.")
+    return manifest, arrays
+
+def compile_from_image(manifest, arrays):
+    """
+    Rebuilds the ``Compile`` split by ``compile_image``.
+    """
+    if manifest['format'] != FORMAT:
+        raise ValueError(f"Cache entry of format {manifest['format']}, not {FORMAT}.")
+
+    memories = []
+    for index, offset in enumerate(manifest['offsets']):
+        memory = Memory(np.array(arrays[f"memory_{index}"]))
+        memory.offset = offset
+        memories += [memory]
+
+    table_memories = memories[:manifest['table_memories']]
+    columns = {name : np.array(arrays[f"table_{name}"]) for name in OpTable.column_names}
+    table = OpTable(table_memories, **columns)
+
+    compiled = Compile.__new__(Compile)
+    compiled.buff_length = manifest['buff_length']
+    compiled.ports = manifest['ports']
+    compiled.mults = manifest['mults']
+    compiled.topology = manifest['topology']
+    compiled.op_graph = table
+    # the compile shares its list of memories with the table
+    # whenever it did before
+    if manifest['memories'] == list(range(len(table_memories))):
+        compiled.memories = table_memories
+    else:
+        compiled.memories = [memories[index] for index in manifest['memories']]
+
+    index, slices = manifest['entrypoint']
+    compiled.entrypoint = Root(decode_slices(slices), memories[index])
+    index, slices = manifest['exitpoint']
+    compiled.exitpoint = Result(decode_slices(slices), memories[index])
+
+    if 'dataflows' in manifest:
+        compiled.dataflows = manifest['dataflows']
+
+    if 'plan' in manifest:
+        layout = manifest['plan']
+        compiled.zeros = memories[manifest['zeros']]
+        ones = manifest['ones']
+        compiled.ones = None if ones is None else memories[ones]
+        plan = MemoryPlan(layout['b_in_line'], layout['m_depth'], layout['base'],
+            memories[layout['zeros']])
+        plan.peak = layout['peak']
+        plan.unshared = layout['unshared']
+        plan.lines = {memories[index] : lines for index, lines in layout['lines']}
+        plan.lifetimes = {memories[index] : (first, last)
+            for index, first, last in layout['lifetimes']}
+        compiled.plan = plan
+
+    compiled.quantizer = None
+    if 'quantizer' in manifest:
+        layout = manifest['quantizer']
+        quantizer = Quantizer(None, per_channel=layout['per_channel'])
+        for index, (name, is_array) in enumerate(layout['scales']):
+            scale = np.array(arrays[f"scale_{index}"])
+            quantizer.scales[name] = scale if is_array else scale.item()
+        for index, name in enumerate(layout['requant']):
+            quantizer.requant[name] = np.array(arrays[f"requant_{index}"])
+        quantizer.input = layout['input']
+        quantizer.output = layout['output']
+        compiled.quantizer = quantizer
+
+    return compiled
+
+class CompileCache():
+    def __init__(self, path=default_path, max_entries=64, max_bytes=2**30):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        os.makedirs(path, exist_ok=True)
+
+    def entry_path(self, key):
+        return os.path.join(self.path, f"{key}.maeri")
+
+    def get(self, key):
+        path = self.entry_path(key)
+        try:
+            with np.load(path, allow_pickle=False) as archive:
+                manifest = json.loads(str(archive['manifest']))
+                arrays = {name : archive[name] for name in archive.files if name != 'manifest'}
+            compiled = compile_from_image(manifest, arrays)
+        except FileNotFoundError:
+            return None
+        except Exception as error:
+            logger.warning(f"Discarding unreadable cache entry {path} : {error}")
+            self.remove(path)
+            return None
+
+        # mark entry as recently used
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+
+        return compiled
+
+    def put(self, key, compiled):
+        manifest, arrays = compile_image(compiled)
+
+        # write to a private file then rename, which is atomic,
+        # so readers only ever see complete entries
+        handle, tmp_path = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        try:
+            with os.fdopen(handle, 'wb') as entry:
+                np.savez_compressed(entry, manifest=np.array(json.dumps(manifest)), **arrays)
+            os.replace(tmp_path, self.entry_path(key))
+        except BaseException:
+            self.remove(tmp_path)
+            raise
+
+        self.evict()
+
+    def remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def evict(self):
+        """
+        Removes the least recently used entries until the
+        cache is within ``max_entries`` and ``max_bytes``.
+        """
+        entries = []
+        for name in os.listdir(self.path):
+            if not name.endswith('.maeri'):
+                continue
+            path = os.path.join(self.path, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries += [(stat.st_mtime, stat.st_size, path)]
+
+        entries.sort(reverse=True)
+        total = 0
+        for count, (mtime, size, path) in enumerate(entries):
+            total += size
+            if (count >= self.max_entries) or (total > self.max_bytes):
+                self.remove(path)
+
+    def clear(self):
+        for name in os.listdir(self.path):
+            if name.endswith('.maeri'):
+                self.remove(os.path.join(self.path, name))
+
+def cached_compile(model_path, buff_length=128, ports=4, mults=64,
+        solve=True, b_in_line=None, m_depth=None, cache=None, calibration=None,
+        per_channel=True):
+    """
+    Returns a ``Compile`` for ``model_path``, quantized over
+    ``calibration`` when given, solved when ``solve`` is set
+    and with its memory plan baked when ``b_in_line`` is
+    given, loading it from ``cache`` when an identical
+    compile was done before.
+    """
+    if cache is None:
+        cache = CompileCache()
+
+    with open(model_path, 'rb') as model_file:
+        model_bytes = model_file.read()
+
+    params = dict(buff_length=buff_length, ports=ports, mults=mults,
+        solve=solve, b_in_line=b_in_line, m_depth=m_depth,
+        per_channel=per_channel, calibration=None)
+    if calibration is not None:
+        calibration = np.asarray(calibration)
+        params['calibration'] = [str(calibration.dtype), list(calibration.shape),
+            sha256(np.ascontiguousarray(calibration).tobytes()).hexdigest()]
+    key = cache_key(model_bytes, params, os.path.dirname(os.path.abspath(model_path)))
+
+    compiled = cache.get(key)
+    if compiled is not None:
+        logger.debug(f"Loaded {model_path} from compile cache")
+        return compiled
+
+    compiled = Compile(model_path, buff_length=buff_length, ports=ports,
+        mults=mults, calibration=calibration, per_channel=per_channel)
+    if solve:
+        compiled.solve(b_in_line=b_in_line or 4)
+    if b_in_line is not None:
+        compiled.bake_offsets(b_in_line=b_in_line, m_depth=m_depth)
+
+    cache.put(key, compiled)
+    return compiled
@@ -2,90 +2,255 @@ from maeri.common.logger import LogIndent, logger
 from maeri.compiler.sanitize.sanitize import sanitize
 from maeri.compiler.build_graph import build_memories
 from maeri.compiler.schedule import schedule
+from maeri.compiler.fuse import fuse_relus, fuse_residuals
 from maeri.compiler.build_graph import build_conv
+from maeri.compiler.build_graph import build_add
+from maeri.compiler.build_graph import build_average_pool
+from maeri.compiler.build_graph import build_global_average_pool
+from maeri.compiler.build_graph import build_gemm
 from maeri.compiler.build_graph import build_root
 from maeri.compiler.build_graph import build_result
 
+from maeri.compiler.plan_memory import plan_memory
+from maeri.compiler.sim_engine import SimEngine
+from maeri.compiler.cost_model import DeviceConfig, estimate_cost
+from maeri.compiler.assembler.mapper import map_table, mapping_index
+from maeri.compiler.reorder import reorder
+from maeri.compiler.dataflow import select_dataflows
+from maeri.compiler.patch import topology, patch_weights
+from maeri.compiler.quantize import Quantizer
+from maeri.compiler.attributes import get_attribute
+
 from maeri.compiler.nodes.Conv2 import Conv2
 from maeri.compiler.nodes.Add import Add
+from maeri.compiler.nodes.Memory import Memory
+from maeri.compiler.nodes import OpTable
 
-from maeri.compiler.solver import solve_conv
-from maeri.compiler.solver import solve_add
+from maeri.compiler.solver import solve_graph
 
 import numpy as np
+import os
 
 import onnx
 
+# operand position of the bias of Conv2 rows
+BIAS = 3
+
+# lowers each supported onnx op_type into ops
+# on the op graph
+builders = {
+    "Conv" : build_conv,
+    "Add" : build_add,
+    "AveragePool" : build_average_pool,
+    "GlobalAveragePool" : build_global_average_pool,
+    "Gemm" : build_gemm,
+    "MatMul" : build_gemm,
+    }
+
+# ops that only rename a tensor, sharing its memory
+aliases = {"Flatten"}
+
 class Compile():
-    def __init__(self, model_path, buff_length=128, ports=4, mults=64, wordsize=2):
+    def __init__(self, model_path, buff_length=128, ports=4, mults=64,
+            calibration=None, per_channel=True):
         self.buff_length = buff_length
         self.ports = ports
         self.mults = mults
 
-        model = onnx.load(model_path)
-        model = sanitize(model)
+        # a float model is quantized to int8 from the ranges
+        # its tensors take over the calibration inputs
+        self.quantizer = None
+        if calibration is not None:
+            self.quantizer = Quantizer(calibration, per_channel=per_channel)
+
+        self.memories, self.op_graph, self.entrypoint, self.exitpoint =\
+            self.lower(model_path, self.quantizer)
+        self.topology = topology(self.op_graph, self.memories)
+
+    @staticmethod
+    def lower(model_path, quantizer=None, keep_scales=False):
+        """
+        Lowers the model at ``model_path`` into an op graph,
+        returning its memories, ops, entrypoint and exitpoint.
+        Adds of a Conv's result and a residual are fused into
+        the Conv, Relus into the ops feeding them, and
+        Flattens of a vector share the memory of their input.
+        Relus that can not be fused are rejected, as the
+        tree has no op for them.
+        With a ``quantizer`` the sanitized model is quantized
+        first, and every op writes with the requantization of
+        its layer folded into its scale, keeping the scales
+        it found before when ``keep_scales`` is set.
+        """
+        base_dir = os.path.dirname(os.path.abspath(model_path))
+        model = onnx.load(model_path, load_external_data=False)
+        model = sanitize(model, base_dir=base_dir)
         #onnx.save(model, f"{model_path[:-5]}-sanitized.onnx")
 
-        ordered_nodes = schedule(model)
-        # TODO : remove name_v_mem from self
-        name_v_mem = build_memories(model)
-        self.memories = memories = list(name_v_mem.values())
+        if quantizer is not None:
+            model = quantizer.quantize(model, base_dir=base_dir, keep_scales=keep_scales)
 
-        self.op_graph = op_graph = []
-        self.entrypoint = build_root(model, name_v_mem)
-        self.exitpoint = build_result(model, name_v_mem)
+        nodes, dead = fuse_residuals(schedule(model), model)
+        ordered_nodes, dead_relus = fuse_relus(nodes, model)
+        dead += dead_relus
+        name_v_mem = build_memories(model, base_dir=base_dir)
+        for name in dead:
+            del name_v_mem[name]
+        for node, _ in ordered_nodes:
+            if node.op_type in aliases:
+                source = name_v_mem[node.input[0]]
+                if np.count_nonzero(np.array(source.data.shape) > 1) > 1:
+                    raise NotImplementedError(f"Compiler does not yet support " +\
+                        f"{node.op_type} of {source.data.shape} tensors.")
+                if node.output[0] == model.graph.output[0].name:
+                    raise NotImplementedError(f"Compiler does not yet support " +\
+                        f"a {node.op_type} writing the model output.")
+                name_v_mem[node.output[0]] = source
+        memories = list({id(memory) : memory for memory in name_v_mem.values()}.values())
 
-        for node in ordered_nodes:
-            if node.op_type == "Conv":
-                logger.debug(f"Compiling Convolutional Node: {node.name}")
+        op_graph = []
+        entrypoint = build_root(model, name_v_mem)
+        exitpoint = build_result(model, name_v_mem)
 
-                with LogIndent():
-                    ops_, mems_ = build_conv(node, name_v_mem)
-                    op_graph += ops_
-                    memories += mems_
-                
-                break
+        # lower every node into one continuous op graph,
+        # intermediate activations stay in their memories
+        for node, relu in ordered_nodes:
+            if node.op_type in aliases:
+                continue
+            # the tree only clamps results as the collectors
+            # write them, there is no op for a Relu alone
+            if node.op_type == "Relu":
+                raise NotImplementedError(f"Compiler does not yet support a Relu " +\
+                    f"that can not be fused into the op writing {node.input[0]}.")
+            if node.op_type not in builders:
+                raise NotImplementedError(f"Compiler does not yet support " +\
+                    f"{node.op_type} nodes.")
+
+            logger.debug(f"Compiling {node.op_type} Node: {node.name}")
+
+            with LogIndent():
+                ops_, mems_ = builders[node.op_type](node, name_v_mem)
+                # one factor per output channel, in the order
+                # their ops are built, or one for every op
+                requant = get_attribute(node, 'requant', None)
+                if requant is not None:
+                    requant = np.broadcast_to(requant, [len(ops_)])
+                    for op, factor in zip(ops_, requant.tolist()):
+                        op.scale *= factor
+                if relu:
+                    for op in ops_:
+                        op.relu = True
+                op_graph += ops_
+                memories += mems_
+
+        return memories, op_graph, entrypoint, exitpoint
     
     def sim(self, data):
+        """
+        Simulates the op graph on ``data``. Stacking several
+        inputs along a new leading dimension simulates them
+        all in one call.
+        """
         logger.debug("RUNNING SIMULATION")
         with LogIndent():
-            self.entrypoint.init_root(data)
-            [op.sim() for op in self.op_graph]
-            return self.exitpoint.get_data()
+            engine = SimEngine(self.op_graph, self.entrypoint, self.exitpoint)
+            return engine.run(data)
     
-    def solve(self):
+    def solve(self, processes=None, b_in_line=4, dataflow=False):
+        """
+        Splits the op graph to fit the hardware, tiling for a
+        memory of ``b_in_line`` bytes per line. ``processes``
+        fans solving out over a pool of processes, with the
+        same result as solving serially. With ``dataflow`` set,
+        every convolution is ordered by the dataflow moving
+        the least data.
+        """
         logger.debug("SOLVING GRAPH")
         op_graph = self.op_graph
-        op_graph_new = []
 
         with LogIndent():
-            for op in op_graph:
-
-                # Solve Conv2 nodes
-                if type(op) is Conv2:
-                    op_graph_new += solve_conv(op, self.buff_length, self.ports, self.mults)
-                elif type(op) is Add:
-                    op_graph_new += solve_add(op, self.buff_length, self.ports)
-                else:
-                    # TODO : should be raising error
-                    op_graph_new += [op]
+            op_graph_new = solve_graph(op_graph, self.buff_length,
+                self.ports, self.mults, memories=self.memories,
+                processes=processes, b_in_line=b_in_line)
+
+            if dataflow:
+                device = DeviceConfig(b_in_line, self.ports, self.mults)
+                op_graph_new, self.dataflows = select_dataflows(op_graph_new, device)
         print(f"Original op count : {len(op_graph)}")
         print(f"Final op count : {len(op_graph_new)}")
         self.op_graph = op_graph_new
     
-    def bake_offsets(self):
-        # first, build the zero node
-        zeros = np.zeros([self.ports, self.buff_length])
-
-        # the zeros memory is always the first node
-        # on the memory list
-        self.memories.insert(0, zeros)
-
-        offset = len(self.memories[0].data.flatten())
-        self.memories[0].offset = 0
-        for memory in self.memories:
-            memory.offset = offset
-            offset = len(memory.data.flatten())
+    def reorder(self):
+        """
+        Groups solved ops running on the same tree
+        configuration, within their dependencies.
+        """
+        self.op_graph, _ = reorder(self.op_graph)
+    
+    def map(self):
+        """
+        Packs the solved Conv2 and Gemm ops into tree
+        configurations, several neurons to a configuration,
+        keeping the configuration running every op.
+        """
+        logger.debug("MAPPING GRAPH")
+        depth = int(np.log2(self.mults)) + 1
+        with LogIndent():
+            self.mappings = map_table(self.op_graph, depth, self.ports)
+            self.mapping_index = mapping_index(self.mappings, len(self.op_graph))
+
+        ops = sum(len(mapping.rows) for mapping in self.mappings)
+        utilization = np.mean([mapping.utilization for mapping in self.mappings])
+        print(f"Tree configurations : {len(self.mappings)} for {ops} ops")
+        print(f"Mean mult utilization : {100*utilization:.1f}%")
+        return self.mappings
+    
+    def bake_offsets(self, b_in_line=4, m_depth=None, base=0):
+        # the zeros memory is shared by every padded load
+        # and always sits at the start of the arena
+        self.zeros = Memory(np.zeros([self.ports, self.buff_length],
+            dtype=self.entrypoint.mem_ref.dtype))
+
+        # the host writes the input and reads the output
+        # so both must survive the whole program
+        pinned = [self.entrypoint.mem_ref, self.exitpoint.mem_ref]
+
+        # bias lanes all stream the same row of ones
+        table = self.op_graph
+        if not isinstance(table, OpTable):
+            table = OpTable.from_ops(table, list(self.memories))
+        memories = self.memories
+        self.ones = None
+        if np.any(table.mem[:, BIAS] >= 0):
+            self.ones = Memory(np.ones([self.buff_length],
+                dtype=self.entrypoint.mem_ref.dtype))
+            memories = memories + [self.ones]
+            pinned += [self.ones]
+
+        self.plan = plan_memory(self.op_graph, memories, self.zeros,
+            pinned=pinned, b_in_line=b_in_line, m_depth=m_depth, base=base)
+        return self.plan
+    
+    def estimate_cost(self, config, clock_hz=None):
+        """
+        Predicts the cycles and traffic of the op graph on the
+        device described by ``config``, the driver's config
+        JSON or its parsed dict.
+        """
+        device = DeviceConfig.from_config(config, clock_hz=clock_hz)
+        self.estimate = estimate_cost(self.op_graph, device,
+            memories=self.memories)
+        self.estimate.report()
+        return self.estimate
+    
+    def update_weights(self, model_path):
+        """
+        Takes the weights of the model at ``model_path``, of
+        the same topology as the compiled one, without
+        recompiling. Returns the ``WeightPatch`` of device
+        writes bringing an uploaded program up to date.
+        """
+        return patch_weights(self, model_path)
     
     def debug(self):
         op_graph = self.op_graph
@@ -0,0 +1,295 @@
+from maeri.common.logger import LogIndent, logger
+from maeri.compiler.nodes import OpTable
+from maeri.compiler.nodes.OpTable import MAX_DIMS
+
+from json import loads
+from math import ceil, log2
+import numpy as np
+
+# operand positions of rows in an op table
+X, W, RES, BIAS, RESIDUAL = 0, 1, 2, 3, 4
+
+# padding columns
+LEFT, UPPER, RIGHT, BOTTOM = 0, 1, 2, 3
+
+class DeviceConfig():
+    """
+    Parameters of the compute unit the cost model times
+    ops against. ``line_cycles`` is the number of cycles
+    the memory adaptor takes to read or write one line.
+    """
+    def __init__(self, b_in_line, ports, mults, m_depth=None,
+            bytes_in_address=3, line_cycles=2, clock_hz=None):
+        self.b_in_line = b_in_line
+        self.ports = ports
+        self.mults = mults
+        self.m_depth = m_depth
+        self.bytes_in_address = bytes_in_address
+        self.line_cycles = line_cycles
+        self.clock_hz = clock_hz
+
+        self.num_adders = mults - 1
+        self.num_nodes = 2*mults - 1
+        self.tree_depth = ceil(log2(mults)) + 1
+
+    @staticmethod
+    def from_config(config, **kwargs):
+        """
+        Builds a device from the config the driver reads
+        back from the board, either as the JSON string or
+        as the parsed dict.
+        """
+        if isinstance(config, (str, bytes)):
+            config = loads(config)
+        return DeviceConfig(b_in_line=config['b_in_line'], ports=config['ports'],
+            mults=config['no.mults'], m_depth=config.get('m_depth'), **kwargs)
+
+def lines(num_bytes, b_in_line):
+    return -(-num_bytes//b_in_line)
+
+class CostEstimate():
+    """
+    Predicted cycles of every op of an op table, split into
+    the phases the compute unit steps through, along with
+    the bytes each op moves between memory and the ports.
+    """
+    phases = ['fetch', 'configure', 'load', 'run', 'store']
+
+    def __init__(self, device, table, fetch, configure, load, run, store,
+            bytes_moved, macs, layer):
+        self.device = device
+        self.table = table
+        self.fetch = fetch
+        self.configure = configure
+        self.load = load
+        self.run = run
+        self.store = store
+        self.bytes_moved = bytes_moved
+        self.macs = macs
+        self.layer = layer
+
+    @property
+    def cycles(self):
+        return self.fetch + self.configure + self.load + self.run + self.store
+
+    @property
+    def total_cycles(self):
+        return int(np.sum(self.cycles))
+
+    def layers(self):
+        """
+        Yields the rows of each layer, in the order layers
+        first appear in the table.
+        """
+        labels, first = np.unique(self.layer, return_index=True)
+        for label in labels[np.argsort(first)]:
+            yield np.nonzero(self.layer == label)[0]
+
+    def summary(self, rows):
+        summary = {phase : int(np.sum(getattr(self, phase)[rows]))
+            for phase in self.phases}
+        summary['cycles'] = sum(summary[phase] for phase in self.phases)
+        summary['bytes'] = int(np.sum(self.bytes_moved[rows]))
+        summary['macs'] = int(np.sum(self.macs[rows]))
+        summary['ops'] = len(np.arange(len(self.table))[rows])
+        return summary
+
+    def report(self):
+        names = {OpTable.CONV : "Conv2", OpTable.ADD : "Add", OpTable.RELU : "Relu",
+            OpTable.GEMM : "Gemm"}
+        for index, rows in enumerate(self.layers()):
+            kinds = ", ".join(f"{names[kind]} x {np.count_nonzero(self.table.kind[rows] == kind)}"
+                for kind in np.unique(self.table.kind[rows]))
+            summary = self.summary(rows)
+            print(f"Layer {index} ({kinds}) : {summary['cycles']} cycles, " +\
+                f"{summary['bytes']} bytes")
+            print("    " + ", ".join(f"{phase} {summary[phase]}" for phase in self.phases))
+
+        summary = self.summary(slice(None))
+        peak = summary['cycles']*self.device.mults
+        print(f"Total latency : {summary['cycles']} cycles for {summary['ops']} ops")
+        print(f"Total traffic : {summary['bytes']} bytes " +\
+            f"({summary['bytes']/max(summary['cycles'], 1):.2f} bytes/cycle)")
+        print(f"Throughput : {summary['macs']/max(summary['cycles'], 1):.2f} MACs/cycle " +\
+            f"({100*summary['macs']/max(peak, 1):.1f}% of {self.device.mults} mults)")
+        if self.device.clock_hz is not None:
+            seconds = summary['cycles']/self.device.clock_hz
+            print(f"At {self.device.clock_hz/1e6:.1f} MHz : {1e3*seconds:.3f} ms, " +\
+                f"{1/max(seconds, 1e-12):.1f} inferences/s")
+
+def layer_labels(table):
+    """
+    Labels every row with the memory its layer writes.
+    Partial sums written to scratch and then accumulated
+    into a result by an Add belong to the result's layer,
+    as do those accumulated in a wider memory before the
+    last Add writes them to a narrow result.
+    """
+    owner = np.arange(len(table.memories))
+    add = table.kind == OpTable.ADD
+    accumulate = add & (table.mem[:, 0] == table.mem[:, 2])
+    owner[table.mem[accumulate, 1]] = table.mem[accumulate, 2]
+
+    itemsize = np.array([memory.dtype.itemsize for memory in table.memories])
+    narrow = add & (itemsize[table.mem[:, 0]] > itemsize[table.mem[:, 2]])
+    for operand in [0, 1]:
+        owner[table.mem[narrow, operand]] = table.mem[narrow, 2]
+    return owner[owner[table.mem[:, RES]]]
+
+def config_keys(table):
+    """
+    Key of the tree configuration every row runs on. Conv2
+    and Gemm rows running the same box of weights share the states,
+    weights and collectors, any other rows share them when
+    they are of the same kind and shape. Rows share the
+    Relus and scales of the collectors when they fuse the
+    same Relu and scale, the weight of a bias lane when
+    they add the same bias, and a residual lane when they
+    both sum a residual.
+    """
+    conv = np.isin(table.kind, [OpTable.CONV, OpTable.GEMM])
+    biased = table.mem[:, BIAS] >= 0
+    key = np.zeros([len(table), 7 + 2*MAX_DIMS], dtype=np.int64)
+    key[:, 0] = table.kind
+    key[:, 1] = np.where(conv, table.mem[:, W], -1)
+    key[:, 2] = table.relu
+    key[:, 3] = table.mem[:, BIAS]
+    key[:, 4] = np.where(biased, table.start[:, BIAS, -1], -1)
+    key[:, 5] = table.scale.astype(np.float32).view(np.int32)
+    key[:, 6] = table.mem[:, RESIDUAL] >= 0
+    key[conv, 7:7 + MAX_DIMS] = table.start[conv, W]
+    key[conv, 7 + MAX_DIMS:] = table.stop[conv, W]
+    key[~conv, 7:7 + MAX_DIMS] = table.extent(X)[~conv]
+    return key
+
+def reconfigures(table):
+    """
+    Marks the rows that must configure the tree before
+    running, those whose configuration differs from the
+    previous row's.
+    """
+    key = config_keys(table)
+    changed = np.ones([len(table)], dtype=bool)
+    changed[1:] = np.any(key[1:] != key[:-1], axis=1)
+    return changed
+
+def reloads(table):
+    """
+    Marks the rows that must load their features. A Conv2
+    row streaming the same window through the same ports
+    as the previous Conv2 row finds it still held in the
+    injection buffers.
+    """
+    conv = table.kind == OpTable.CONV
+    key = np.concatenate([table.mem[:, X, None], table.start[:, X], table.stop[:, X],
+        table.pad, table.extent(W)[:, 1:3]], axis=1)
+    kept = np.zeros([len(table)], dtype=bool)
+    kept[1:] = conv[1:] & conv[:-1] & np.all(key[1:] == key[:-1], axis=1)
+    return ~kept
+
+def phase_cycles(device, streams, width, out_rows, out_width, reconfigure,
+        in_itemsize=1, out_itemsize=1, reload=True, stride=1):
+    """
+    Cycles of each phase of ops streaming ``streams`` input
+    rows of ``width`` elements of ``in_itemsize`` bytes into
+    ports and storing ``out_rows`` output rows of
+    ``out_width`` elements of ``out_itemsize`` bytes, along
+    with the bytes they move. ``reconfigure`` marks the ops
+    that configure the tree first, ``reload`` those that
+    load their features. Collectors keep one sum every
+    ``stride`` cycles.
+    """
+    b_in_line = device.b_in_line
+    line_cycles = device.line_cycles
+
+    loads = np.where(reload, streams, 0)
+    load_lines = loads*lines(width*in_itemsize, b_in_line)
+
+    # one output row per collector
+    store_lines = out_rows*lines(out_width*out_itemsize, b_in_line)
+
+    # the tree produces one output per cycle per collector
+    # once the pipeline through its levels is full
+    run = (out_width - 1)*stride + 1 + device.tree_depth
+
+    # the states of every node, the weights of every mult
+    # and the collector of every port, a line at a time
+    config_lines = lines(device.num_nodes, b_in_line) +\
+        lines(device.mults, b_in_line) + lines(device.ports, b_in_line)
+    config_instructions = 3
+    configure = np.where(reconfigure, config_lines*line_cycles, 0)
+
+    # instructions are fetched a byte at a time
+    address = device.bytes_in_address
+    instruction_bytes = (1 + address + 3)*(loads + out_rows) + (1 + 2)
+    instruction_bytes += np.where(reconfigure, config_instructions*(1 + address), 0)
+    fetch = instruction_bytes + lines(instruction_bytes, b_in_line)*line_cycles
+
+    load = load_lines*line_cycles
+    store = store_lines*line_cycles
+    config_bytes = np.where(reconfigure, config_lines*b_in_line, 0)
+    bytes_moved = (load_lines + store_lines)*b_in_line + config_bytes + instruction_bytes
+
+    return fetch, configure, load, run, store, bytes_moved
+
+def estimate_cost(op_graph, device, memories=None):
+    """
+    Predicts the cycles each op of a solved op graph takes
+    on ``device``, with every element taking the bytes of
+    its memory's dtype. Phases run back to back, as in the compute
+    unit's state machine.
+    """
+    if isinstance(op_graph, OpTable):
+        table = op_graph
+    else:
+        table = OpTable.from_ops(op_graph, list(memories or []))
+
+    conv = table.kind == OpTable.CONV
+    add = table.kind == OpTable.ADD
+    gemm = table.kind == OpTable.GEMM
+
+    logger.debug("ESTIMATING COST")
+    with LogIndent():
+        pad = table.pad.astype(np.int64)
+        x_extent = table.extent(X).astype(np.int64)
+        w_extent = table.extent(W).astype(np.int64)
+        res_extent = table.extent(RES).astype(np.int64)
+
+        # every row streams into its own port, convolutions
+        # stream a window of filter_depth rows per channel,
+        # padding included, a row of ones for a bias and a
+        # row of a residual, adds stream both operands.
+        # Every neuron of a gemm streams the whole slice of
+        # the input vector
+        width = x_extent[:, 3] + np.where(conv, pad[:, LEFT] + pad[:, RIGHT], 0)
+        width = np.where(gemm, np.prod(x_extent, axis=1), width)
+        streams = np.prod(x_extent[:, :3], axis=1)
+        streams = np.where(conv, w_extent[:, 1]*w_extent[:, 2] +
+            (table.mem[:, BIAS] >= 0) + (table.mem[:, RESIDUAL] >= 0), streams)
+        streams = np.where(gemm, w_extent[:, 2] + (table.mem[:, BIAS] >= 0), streams)
+        streams = np.where(add, 2*streams, streams)
+
+        out_rows = np.prod(res_extent[:, :3], axis=1)
+        out_width = res_extent[:, 3]
+
+        itemsize = np.array([memory.dtype.itemsize for memory in table.memories],
+            dtype=np.int64)
+        in_itemsize = itemsize[table.mem[:, X]]
+        out_itemsize = itemsize[table.mem[:, RES]]
+
+        fetch, configure, load, run, store, bytes_moved = phase_cycles(device, streams,
+            width, out_rows, out_width, reconfigures(table), in_itemsize, out_itemsize,
+            reloads(table),
+            table.stride.astype(np.int64))
+        macs = np.where(conv, np.prod(w_extent[:, 1:], axis=1)*out_width*out_rows, 0)
+
+        # a gemm collects each of its sums once the whole
+        # slice has streamed through its chain
+        run = np.where(gemm, width + device.tree_depth, run)
+        macs = np.where(gemm, np.prod(w_extent, axis=1), macs)
+        phases = fetch, configure, load, run, store, bytes_moved
+
+        estimate = CostEstimate(device, table, *phases, macs, layer_labels(table))
+        logger.debug(f"{estimate.total_cycles} cycles over {len(table)} ops")
+
+    return estimate
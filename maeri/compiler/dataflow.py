@@ -0,0 +1,101 @@
+from maeri.common.logger import LogIndent, logger
+from maeri.compiler.nodes import OpTable
+from maeri.compiler.cost_model import estimate_cost, layer_labels
+from maeri.compiler.reorder import dependencies, list_schedule
+
+import numpy as np
+
+# operand positions of Conv2 rows in an op table
+X, W, RES = 0, 1, 2
+
+# loop nest of each dataflow, outermost loop first, over
+# the output channel, filter pass, output row and tile of
+# the rows of a convolution
+DATAFLOWS = {
+    'weight_stationary' : ['channel', 'pass', 'tile', 'row'],
+    'input_stationary' : ['row', 'tile', 'pass', 'channel'],
+    'output_stationary' : ['row', 'tile', 'channel', 'pass'],
+    }
+
+def loop_indices(table):
+    """
+    Index of every row of a solved convolution in each loop
+    of the nest. Adds accumulating a pass into the result
+    take the indices of the Conv2 row before them, just
+    after its pass.
+    """
+    rows = np.arange(len(table))
+    conv = table.kind == OpTable.CONV
+    source = np.maximum.accumulate(np.where(conv, rows, 0))
+
+    _, filter_pass = np.unique(table.start[source, W, 1:3], axis=0, return_inverse=True)
+    filter_pass = 2*filter_pass.reshape(-1) + np.where(conv, 0, 1)
+
+    return {
+        'channel' : table.start[source, W, 0],
+        'pass' : filter_pass,
+        'row' : table.start[:, RES, 2],
+        'tile' : table.start[:, RES, 3],
+        }
+
+def dataflow_rank(table, dataflow):
+    """
+    Position of every row in the loop nest of ``dataflow``.
+    """
+    indices = loop_indices(table)
+    keys = [indices[loop] for loop in reversed(DATAFLOWS[dataflow])]
+    order = np.lexsort(keys)
+    rank = np.empty([len(table)], dtype=np.int64)
+    rank[order] = np.arange(len(table))
+    return rank
+
+def layer_runs(table):
+    """
+    Yields the bounds of every run of consecutive rows of
+    the same layer.
+    """
+    labels = layer_labels(table)
+    changes = np.nonzero(labels[1:] != labels[:-1])[0] + 1
+    bounds = [0] + changes.tolist() + [len(table)]
+    yield from zip(bounds[:-1], bounds[1:])
+
+def select_dataflows(table, device):
+    """
+    Orders the rows of every solved convolution in
+    ``table`` by the dataflow moving the fewest bytes
+    between memory and the tree on ``device``, ties going
+    to the fewest cycles. Every order keeps the
+    dependencies between rows.
+
+    Returns the reordered table and the dataflow picked
+    for each convolution.
+    """
+    orders = []
+    picked = []
+
+    logger.debug("SELECTING DATAFLOWS")
+    with LogIndent():
+        for begin, end in layer_runs(table):
+            rows = np.arange(begin, end)
+            layer = table.select(slice(begin, end))
+            if not np.any(layer.kind == OpTable.CONV):
+                orders += [rows]
+                continue
+
+            best = None
+            pairs = dependencies(layer)
+            for dataflow in DATAFLOWS:
+                order = list_schedule(layer, dataflow_rank(layer, dataflow), pairs=pairs)
+                estimate = estimate_cost(layer.select(order), device)
+                cost = (int(np.sum(estimate.bytes_moved)), estimate.total_cycles)
+                logger.debug(f"{dataflow} : {cost[0]} bytes, {cost[1]} cycles")
+                if (best is None) or (cost < best[0]):
+                    best = (cost, dataflow, order)
+
+            (traffic, cycles), dataflow, order = best
+            logger.debug(f"Layer {len(picked)} : {dataflow} ({traffic} bytes, {cycles} cycles)")
+            orders += [rows[order]]
+            picked += [dataflow]
+
+    order = np.concatenate(orders) if orders else np.zeros([0], dtype=np.int64)
+    return table.select(order), picked
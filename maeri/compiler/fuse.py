@@ -0,0 +1,129 @@
+"""
+Fuses activations and residual adds into the ops producing
+their inputs, so that they are applied as results are
+written rather than costing ops, loads and stores of their
+own.
+"""
+from maeri.common.logger import LogIndent, logger
+import onnx
+
+# ops whose result can be clamped at zero as the
+# collectors write it
+RELU_PRODUCERS = {"Conv", "AveragePool", "GlobalAveragePool", "Gemm", "MatMul", "Add"}
+
+def consumers(nodes, model):
+    """
+    Number of times each tensor is read, graph outputs
+    counting as a read.
+    """
+    reads = {}
+    for node in nodes:
+        for input_ in node.input:
+            reads[input_] = reads.get(input_, 0) + 1
+    for output in model.graph.output:
+        reads[output.name] = reads.get(output.name, 0) + 1
+    return reads
+
+def fuse_relus(nodes, model):
+    """
+    Fuses every Relu into the op producing its input, a
+    Conv, AveragePool, GlobalAveragePool, Gemm, MatMul or
+    Add, when nothing else reads that input. The producer
+    is replaced by a copy writing the Relu's output and
+    the Relu is dropped.
+
+    Takes the scheduled ``nodes`` of ``model`` and returns
+    them paired with whether each clamps its result at zero,
+    along with the names of the tensors no longer written.
+    """
+    reads = consumers(nodes, model)
+    producer_of = {node.output[0] : index for index, node in enumerate(nodes)
+        if node.op_type in RELU_PRODUCERS}
+
+    fused = [[node, False] for node in nodes]
+    dropped = set()
+    dead = []
+
+    logger.debug("FUSING RELUS")
+    with LogIndent():
+        for index, node in enumerate(nodes):
+            if node.op_type != "Relu":
+                continue
+            source = node.input[0]
+            if (source not in producer_of) or (reads[source] != 1):
+                continue
+
+            producer = fused[producer_of[source]]
+            copy = onnx.NodeProto()
+            copy.CopyFrom(producer[0])
+            copy.output[0] = node.output[0]
+            producer[0], producer[1] = copy, True
+
+            dropped.add(index)
+            dead += [source]
+            logger.debug(f"Fused {node.name or node.op_type} into " +\
+                f"{copy.name or copy.op_type}")
+
+    return [(node, relu) for index, (node, relu) in enumerate(fused)
+        if index not in dropped], dead
+
+def fuse_residuals(nodes, model):
+    """
+    Fuses every Add of a Conv's result and another tensor,
+    the residual, into the Conv when nothing else reads its
+    result. The Conv is replaced by a copy writing the Add's
+    output that takes the residual as a fourth input, after
+    any bias, and moves to the Add's place so that the
+    residual is written before it is read. The tree sums the
+    residual into every output on a lane of its own, weighted
+    by one, sparing the Add a full pass over both operands.
+
+    Layers that requantize their results, those of quantized
+    models, are left alone as the residual would need a
+    weight other than one.
+
+    Takes the scheduled ``nodes`` of ``model`` and returns the
+    nodes left, along with the names of the tensors no
+    longer written.
+    """
+    reads = consumers(nodes, model)
+    producer_of = {node.output[0] : index for index, node in enumerate(nodes)
+        if node.op_type == "Conv"}
+
+    def requantized(node):
+        return any(attribute.name == 'requant' for attribute in node.attribute)
+
+    fused = list(nodes)
+    dropped = set()
+    dead = []
+
+    logger.debug("FUSING RESIDUALS")
+    with LogIndent():
+        for index, node in enumerate(nodes):
+            if (node.op_type != "Add") or requantized(node):
+                continue
+
+            first, second = node.input
+            for source, residual in [(first, second), (second, first)]:
+                if (source in producer_of) and (reads[source] == 1):
+                    break
+            else:
+                continue
+            producer = nodes[producer_of[source]]
+            if requantized(producer):
+                continue
+
+            copy = onnx.NodeProto()
+            copy.CopyFrom(producer)
+            copy.output[0] = node.output[0]
+            while len(copy.input) < 3:
+                copy.input.append("")
+            copy.input.append(residual)
+            fused[index] = copy
+
+            dropped.add(producer_of[source])
+            dead += [source]
+            logger.debug(f"Fused {node.name or node.op_type} into " +\
+                f"{copy.name or copy.op_type}")
+
+    return [node for index, node in enumerate(fused) if index not in dropped], dead
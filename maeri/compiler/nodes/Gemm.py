@@ -0,0 +1,58 @@
+from maeri.common.logger import LogIndent, logger
+import numpy as np
+
+from .Memory import compute_dtype
+
+class Gemm():
+    """
+    Fully connected layer over a single input vector,
+    ``res = scale*(W @ A + B)``. ``W`` holds a row of
+    weights per output, so every output is the dot product
+    of ``A`` with its row, one neuron of the tree.
+    """
+    def __init__(self, A, W, res, relu=False, B=None, scale=1.0):
+        self.A = A
+        self.W = W
+        self.res = res
+
+        # the bias of every output, each injected into
+        # the tree alongside its row of weights
+        self.B = B
+
+        # results are multiplied by ``scale`` as they are
+        # written, before any Relu
+        self.scale = scale
+
+        # a fused Relu clamps the result as it is written
+        self.relu = relu
+
+    def sim(self):
+        logger.debug("EXECUTING GEMM")
+
+        # compute wide, the result is stored back in
+        # the output memory's dtype
+        dtype = compute_dtype(np.result_type(self.A.mem_ref.dtype, self.W.mem_ref.dtype))
+
+        A = self.A.get_data(dtype).reshape(-1)
+        W = self.W.get_data(dtype)
+        W = W.reshape(-1, A.shape[0])
+        logger.debug(f"A = \n{A}")
+        logger.debug(f"W = \n{W}")
+
+        res = W @ A
+        if self.B is not None:
+            res = res + self.B.get_data(dtype).reshape(-1)
+        if self.scale != 1:
+            res = res*self.scale
+        if self.relu:
+            res = np.maximum(res, 0)
+        self.res.write_data(res.reshape(self.res.debug().shape))
+
+        logger.debug(f"res = \n{self.res.debug()}")
+
+    def debug(self):
+        logger.debug(f"A_slice = {self.A.slice}")
+        logger.debug(f"A_raw = {self.A.get_data()}")
+        logger.debug(f"W_raw = {self.W.get_data()}")
+        logger.debug(f"res_raw = {self.res.debug()}")
+        logger.debug(f"self.scale  = {self.scale}")
@@ -6,5 +6,12 @@ class Input():
     def get_offset(self):
         raise NotImplementedError()
 
-    def get_data(self):
-        return self.mem_ref.data[self.slice]
+    def get_data(self, dtype=None):
+        """
+        Returns the data in the memory's own dtype, or as
+        ``dtype`` when given.
+        """
+        data = self.mem_ref.data[self.slice]
+        if dtype is None:
+            return data
+        return data.astype(dtype)
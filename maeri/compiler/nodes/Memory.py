@@ -1,7 +1,62 @@
+import numpy as np
+
+def compact_dtype(dtype):
+    """
+    Type a tensor of ``dtype`` is stored in. Integer tensors,
+    such as the int8 features and weights of a quantized
+    model, keep their own type and float tensors are held
+    in single precision.
+    """
+    dtype = np.dtype(dtype)
+    if dtype.kind == 'f':
+        return np.dtype(np.float32)
+    return dtype
+
+def accumulator_dtype(dtype):
+    """
+    Type partial sums of ``dtype`` values are kept in, wide
+    enough that summing products does not overflow.
+    """
+    dtype = compact_dtype(dtype)
+    if dtype.kind in 'iub':
+        return np.promote_types(dtype, np.int32)
+    return dtype
+
+def compute_dtype(dtype):
+    """
+    Type arithmetic on ``dtype`` values is carried out in
+    before being stored back.
+    """
+    if np.dtype(dtype).kind in 'iub':
+        return np.dtype(np.int64)
+    return np.dtype(np.float64)
+
 class Memory():
     def __init__(self, data):
         self.offset = None
         self.data = data # data is a Numpy array
+
+    @property
+    def dtype(self):
+        return self.data.dtype
+
+    def num_lines(self, b_in_line):
+        """
+        Number of device memory lines needed to hold
+        this memory, with each element taking the
+        bytes of the memory's dtype.
+        """
+        return -(-(self.data.size*self.dtype.itemsize)//b_in_line)
+
+    def device_bytes(self):
+        """
+        Contents of this memory as laid out on the device,
+        each element a little endian word of the memory's
+        dtype.
+        """
+        kind = {'b' : 'u'}.get(self.dtype.kind, self.dtype.kind)
+        word = np.dtype(f'<{kind}{self.dtype.itemsize}')
+        return np.ascontiguousarray(self.data, dtype=word).tobytes()
     
     def get_offset(self, tuple_of_slices, shape):
         """
@@ -0,0 +1,231 @@
+from .Conv2 import Conv2
+from .Add import Add
+from .Gemm import Gemm
+from .Relu import Relu
+from .Input import Input
+from .Output import Output
+
+import numpy as np
+
+# all operand boxes are padded out to this many dimensions,
+# memories with fewer dimensions are right aligned
+MAX_DIMS = 4
+
+# operand slots of every row
+NUM_OPERANDS = 5
+
+class OpTable():
+    """
+    Structure of arrays holding a whole op graph. Row ``i``
+    describes the ``i``th op:
+
+    kind:
+        op type, one of ``OpTable.CONV``, ``OpTable.ADD``,
+        ``OpTable.RELU`` or ``OpTable.GEMM``
+    mem:
+        index into ``memories`` of each of the five
+        operands, -1 when the op has no such operand.
+        Operands are ordered (X, W, res, bias, residual) for
+        Conv2, (A, B, C, -, -) for Add, (data, -, res, -, -)
+        for Relu and (A, W, res, bias, -) for Gemm
+    start, stop:
+        first and one past the last index of each
+        operand along each dimension
+    squeeze:
+        set where the operand was indexed with an int,
+        dropping that dimension
+    pad:
+        left, upper, right and bottom padding of Conv2 ops
+    relu:
+        set where a fused Relu clamps the result of a Conv2,
+        Add or Gemm op at zero as it is written
+    stride:
+        step between the windows of Conv2 ops, 1 for all
+        other ops
+    scale:
+        factor the result of a Conv2, Add or Gemm op is
+        multiplied by as it is written, before any Relu
+    """
+    CONV = 0
+    ADD = 1
+    RELU = 2
+    GEMM = 3
+
+    kinds = {Conv2 : CONV, Add : ADD, Relu : RELU, Gemm : GEMM}
+
+    column_names = ['kind', 'mem', 'start', 'stop', 'squeeze', 'pad', 'relu', 'stride', 'scale']
+
+    def __init__(self, memories, kind, mem, start, stop, squeeze, pad, relu, stride,
+            scale):
+        self.memories = memories
+        self.kind = kind
+        self.mem = mem
+        self.start = start
+        self.stop = stop
+        self.squeeze = squeeze
+        self.pad = pad
+        self.relu = relu
+        self.stride = stride
+        self.scale = scale
+
+    @staticmethod
+    def empty(memories, length=0):
+        return OpTable(memories,
+            kind = np.zeros([length], dtype=np.int8),
+            mem = np.full([length, NUM_OPERANDS], -1, dtype=np.int32),
+            start = np.zeros([length, NUM_OPERANDS, MAX_DIMS], dtype=np.int32),
+            stop = np.zeros([length, NUM_OPERANDS, MAX_DIMS], dtype=np.int32),
+            squeeze = np.zeros([length, NUM_OPERANDS, MAX_DIMS], dtype=bool),
+            pad = np.zeros([length, 4], dtype=np.int16),
+            relu = np.zeros([length], dtype=bool),
+            stride = np.ones([length], dtype=np.int16),
+            scale = np.ones([length], dtype=np.float32))
+
+    @staticmethod
+    def operands(op):
+        if type(op) is Conv2:
+            return [op.X, op.W, op.res, op.B, op.R]
+        if type(op) is Add:
+            return [op.A, op.B, op.C, None, None]
+        if type(op) is Relu:
+            return [op.data, None, op.res, None, None]
+        if type(op) is Gemm:
+            return [op.A, op.W, op.res, op.B, None]
+
+        raise NotImplementedError(f"Op table does not support {type(op).__name__}.")
+
+    @staticmethod
+    def from_ops(ops, memories=None):
+        """
+        Builds a table from a list of op objects. Memories
+        not already in ``memories`` are appended to it.
+        """
+        if memories is None:
+            memories = []
+        index_by_id = {id(memory) : index for index, memory in enumerate(memories)}
+
+        table = OpTable.empty(memories, len(ops))
+        for row, op in enumerate(ops):
+            table.kind[row] = OpTable.kinds[type(op)]
+            for position, operand in enumerate(OpTable.operands(op)):
+                if operand is None:
+                    continue
+
+                memory = operand.mem_ref
+                if id(memory) not in index_by_id:
+                    index_by_id[id(memory)] = len(memories)
+                    memories += [memory]
+                table.mem[row, position] = index_by_id[id(memory)]
+
+                shape = memory.data.shape
+                lead = MAX_DIMS - len(shape)
+                table.stop[row, position, :lead] = 1
+                table.squeeze[row, position, :lead] = True
+                for dim, (index, length) in enumerate(zip(operand.slice, shape)):
+                    if isinstance(index, slice):
+                        begin, end, step = index.indices(length)
+                        assert(step == 1)
+                    else:
+                        begin, end = int(index), int(index) + 1
+                        table.squeeze[row, position, lead + dim] = True
+                    table.start[row, position, lead + dim] = begin
+                    table.stop[row, position, lead + dim] = end
+
+            if type(op) is Conv2:
+                table.pad[row] = [op.pad_left, op.pad_upper, op.pad_right, op.pad_bottom]
+                table.stride[row] = op.stride
+            if type(op) in {Conv2, Add, Gemm}:
+                table.relu[row] = op.relu
+                table.scale[row] = op.scale
+
+        return table
+
+    def __len__(self):
+        return len(self.kind)
+
+    def select(self, rows):
+        """
+        Returns a new table made of ``rows``, which may be a
+        slice, a boolean mask or an array of row indices.
+        """
+        columns = [getattr(self, name)[rows] for name in self.column_names]
+        return OpTable(self.memories, *columns)
+
+    def repeat(self, counts):
+        """
+        Returns a new table in which row ``i`` appears
+        ``counts[i]`` times in a row, along with the index of
+        each new row within its group of copies.
+        """
+        columns = [np.repeat(getattr(self, name), counts, axis=0)
+            for name in self.column_names]
+        first = np.cumsum(counts) - counts
+        copy = np.arange(np.sum(counts)) - np.repeat(first, counts)
+        return OpTable(self.memories, *columns), copy
+
+    @staticmethod
+    def concat(tables):
+        """
+        Joins tables end to end. All tables must share the
+        same ``memories`` list.
+        """
+        memories = tables[0].memories
+        for table in tables:
+            assert(table.memories is memories)
+        columns = [np.concatenate([getattr(table, name) for table in tables])
+            for name in OpTable.column_names]
+        return OpTable(memories, *columns)
+
+    def extent(self, operand):
+        """
+        Length of each dimension of ``operand`` for every row.
+        """
+        return self.stop[:, operand] - self.start[:, operand]
+
+    def operand_slice(self, row, operand):
+        memory = self.memories[self.mem[row, operand]]
+        lead = MAX_DIMS - memory.data.ndim
+        slice_ = []
+        for dim in range(lead, MAX_DIMS):
+            begin = int(self.start[row, operand, dim])
+            if self.squeeze[row, operand, dim]:
+                slice_ += [begin]
+            else:
+                slice_ += [slice(begin, int(self.stop[row, operand, dim]))]
+        return tuple(slice_)
+
+    def __getitem__(self, row):
+        """
+        Materializes the op object held in ``row``.
+        """
+        def operand(position, cls):
+            if self.mem[row, position] < 0:
+                return None
+            memory = self.memories[self.mem[row, position]]
+            return cls(self.operand_slice(row, position), memory)
+
+        kind = self.kind[row]
+        if kind == OpTable.CONV:
+            return Conv2(operand(0, Input), operand(1, Input),
+                operand(2, Output), [int(pad) for pad in self.pad[row]],
+                relu=bool(self.relu[row]), B=operand(3, Input),
+                stride=int(self.stride[row]), scale=float(self.scale[row]),
+                R=operand(4, Input))
+        if kind == OpTable.ADD:
+            return Add(operand(0, Input), operand(1, Input), operand(2, Output),
+                relu=bool(self.relu[row]), scale=float(self.scale[row]))
+        if kind == OpTable.RELU:
+            return Relu(operand(0, Input), operand(2, Output))
+        if kind == OpTable.GEMM:
+            return Gemm(operand(0, Input), operand(1, Input), operand(2, Output),
+                relu=bool(self.relu[row]), B=operand(3, Input),
+                scale=float(self.scale[row]))
+
+        raise ValueError(f"Unknown op kind {kind}.")
+
+    def __iter__(self):
+        for row in range(len(self)):
+            yield self[row]
+
+    def to_ops(self):
+        return list(self)
@@ -1,3 +1,5 @@
+import numpy as np
+
 class Output():
     def __init__(self, slice_, mem_ref):
         self.slice = slice_
@@ -7,7 +9,13 @@ class Output():
         raise NotImplementedError()
 
     def write_data(self, data):
-        self.mem_ref.data[self.slice] = data
+        # results are stored in the memory's dtype, integer
+        # memories wrap like the fixed width hardware and
+        # scaled results round to the nearest integer
+        data = np.asarray(data)
+        if (data.dtype.kind == 'f') and (self.mem_ref.dtype.kind in 'iu'):
+            data = np.rint(data)
+        self.mem_ref.data[self.slice] = data.astype(self.mem_ref.dtype)
 
     def debug(self):
         return self.mem_ref.data[self.slice]
@@ -1,4 +1,9 @@
 class Relu():
+    """
+    Clamps ``data`` at zero into ``res``. Lowering fuses
+    every Relu into the op feeding it, so this only names
+    the ``OpTable.RELU`` rows of hand built tables.
+    """
     def __init__(self, data, res):
         self.data = data
         self.res = res
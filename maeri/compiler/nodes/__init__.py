@@ -1,17 +1,21 @@
 from .Add import Add
 from .Conv2 import Conv2
+from .Gemm import Gemm
 from .Input import Input
 from .Memory import Memory
 from .Output import Output
 from .Relu import Relu
 from .Root import Root
 from .Result import Result
+from .OpTable import OpTable
 
 __all__ = [
     "Add",
     "Conv2",
+    "Gemm",
     "Input",
     "Memory",
+    "OpTable",
     "Output",
     "Relu"
-    ]
\ No newline at end of file
+    ]
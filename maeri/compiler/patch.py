@@ -0,0 +1,165 @@
+"""
+Swaps the weights of a compiled model for those of a
+retrained model of the same topology, without solving,
+planning or mapping it again.
+
+Every constant memory of the lowered model, the memories
+no op writes, is compared byte for byte with its device
+image, and only the lines that differ are rewritten.
+"""
+from maeri.common.logger import LogIndent, logger
+from maeri.compiler.nodes import OpTable
+from maeri.compiler.assembler.mapper import mapping_index, remap
+
+import numpy as np
+import hashlib
+
+# operand positions of Conv2 and Gemm rows in an op table
+W, OUT, BIAS = 1, 2, 3
+
+def topology(op_graph, memories):
+    """
+    Fingerprint of a lowered op graph that ignores the
+    contents of its memories, so that two models with the
+    same topology but different weights share it.
+    """
+    table = OpTable.from_ops(op_graph, list(memories))
+    digest = hashlib.sha256()
+    for name in OpTable.column_names:
+        digest.update(np.ascontiguousarray(getattr(table, name)).tobytes())
+    for memory in table.memories:
+        digest.update(f"{memory.data.shape}{memory.dtype.str};".encode())
+    return digest.hexdigest()
+
+def constants(op_graph, memories, entrypoint):
+    """
+    Indices of the memories of ``op_graph`` that are never
+    written, other than the ``entrypoint`` the host writes,
+    its weights and other constants.
+    """
+    table = OpTable.from_ops(op_graph, list(memories))
+    written = set(table.mem[:, OUT].tolist())
+    return [index for index, memory in enumerate(table.memories)
+        if (index not in written) and (memory is not entrypoint.mem_ref)]
+
+def dirty_runs(old, new, b_in_line):
+    """
+    Yields the ``(first, last)`` lines, last exclusive, of
+    every run of lines that differ between the byte
+    strings ``old`` and ``new``.
+    """
+    lines = -(-len(new)//b_in_line)
+    old = np.frombuffer(old, dtype=np.uint8)
+    new = np.frombuffer(new, dtype=np.uint8)
+    changed = np.zeros([lines*b_in_line], dtype=bool)
+    changed[:len(new)] = old != new
+    changed = np.any(changed.reshape(lines, b_in_line), axis=1)
+
+    edges = np.diff(np.concatenate([[0], changed.astype(np.int8), [0]]))
+    yield from zip(np.nonzero(edges == 1)[0].tolist(), np.nonzero(edges == -1)[0].tolist())
+
+class WeightPatch():
+    """
+    Device writes bringing an uploaded program up to date
+    with new weights.
+
+    writes:
+        ``(byte address, bytes)`` of every run of changed
+        memory lines
+    mappings:
+        indices of the tree configurations whose weights
+        changed, and must be emitted again
+    config_bytes:
+        bytes of the weights of those configurations
+    """
+    def __init__(self, b_in_line):
+        self.b_in_line = b_in_line
+        self.memories = []
+        self.writes = []
+        self.mappings = []
+        self.config_bytes = 0
+
+    @property
+    def num_bytes(self):
+        return sum(len(data) for _, data in self.writes)
+
+    def report(self, total_bytes):
+        print(f"Changed memories : {len(self.memories)}")
+        print(f"Bytes to rewrite : {self.num_bytes} of {total_bytes} " +\
+            f"in {len(self.writes)} writes")
+        if self.mappings:
+            print(f"Tree configurations to emit : {len(self.mappings)} " +\
+                f"({self.config_bytes} weight bytes)")
+
+def patch_weights(compiled, model_path):
+    """
+    Loads the weights of the model at ``model_path`` into
+    ``compiled``, a solved model whose memories are
+    planned. Weights are cast to the type the compiled
+    model holds them in, quantized weights in the scales
+    found when it was compiled.
+
+    Returns the ``WeightPatch`` of device writes.
+    """
+    if getattr(compiled, 'plan', None) is None:
+        raise RuntimeError("Weights can only be patched into a model " +\
+            "whose memories are planned, call bake_offsets first.")
+
+    quantizer = getattr(compiled, 'quantizer', None)
+    memories, op_graph, entrypoint, _ = compiled.lower(model_path, quantizer,
+        keep_scales=True)
+    if topology(op_graph, memories) != compiled.topology:
+        raise ValueError(f"{model_path} does not have the topology " +\
+            "of the compiled model.")
+
+    b_in_line = compiled.plan.b_in_line
+    patch = WeightPatch(b_in_line)
+    total_bytes = 0
+
+    logger.debug("PATCHING WEIGHTS")
+    with LogIndent():
+        # lowering is deterministic, so the memories of the
+        # new model line up with the leading memories of the
+        # compiled one, ahead of any the solver added
+        for index in constants(op_graph, memories, entrypoint):
+            memory = compiled.memories[index]
+            data = np.asarray(memories[index].data).astype(memory.dtype)
+            old = memory.device_bytes()
+            memory.data = data
+            new = memory.device_bytes()
+            total_bytes += len(new)
+
+            base = memory.offset*b_in_line
+            runs = list(dirty_runs(old, new, b_in_line))
+            for first, last in runs:
+                patch.writes += [(base + first*b_in_line,
+                    new[first*b_in_line:last*b_in_line])]
+            if runs:
+                patch.memories += [memory]
+                logger.debug(f"Memory {index} : {len(runs)} changed runs")
+
+        # configurations hold their own copy of the weights,
+        # only those of ops reading a changed memory are
+        # built again
+        mappings = getattr(compiled, 'mappings', None)
+        if mappings and patch.memories:
+            table = compiled.op_graph
+            index = getattr(compiled, 'mapping_index', None)
+            if index is None:
+                index = mapping_index(mappings, len(table))
+            changed = [position for position, memory in enumerate(table.memories)
+                if any(memory is other for other in patch.memories)]
+            reads = np.isin(table.mem[:, W], changed) | np.isin(table.mem[:, BIAS], changed)
+            affected = np.unique(index[reads])
+            for position in affected[affected >= 0].tolist():
+                old = mappings[position]
+                new = remap(table, old)
+                if np.any(old.weights != new.weights):
+                    patch.mappings += [position]
+                    patch.config_bytes += new.weight_bytes
+                mappings[position] = new
+            logger.debug(f"Remapped {np.count_nonzero(affected >= 0)} of " +\
+                f"{len(mappings)} configurations")
+
+    patch.report(total_bytes)
+    return patch
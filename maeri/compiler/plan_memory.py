@@ -0,0 +1,147 @@
+from maeri.common.logger import LogIndent, logger
+from maeri.compiler.nodes import OpTable
+
+import numpy as np
+
+def compute_lifetimes(op_graph, memories, pinned):
+    """
+    Returns a dict mapping each memory to the inclusive
+    interval ``[first, last]`` of op indices during which
+    its contents must be preserved.
+
+    Memories that are never written by an op hold data
+    uploaded by the host, and ``pinned`` memories are
+    read back by the host, so both extend to the ends of
+    the program.
+    """
+    if isinstance(op_graph, OpTable):
+        table = op_graph
+    else:
+        table = OpTable.from_ops(op_graph, list(memories))
+
+    end = max(len(table) - 1, 0)
+    count = len(table.memories)
+    first_use = np.full([count], end + 1, dtype=np.int64)
+    last_use = np.full([count], -1, dtype=np.int64)
+
+    rows = np.arange(len(table))
+    for position in range(table.mem.shape[1]):
+        used = table.mem[:, position] >= 0
+        np.minimum.at(first_use, table.mem[used, position], rows[used])
+        np.maximum.at(last_use, table.mem[used, position], rows[used])
+    written = set(np.unique(table.mem[:, 2]).tolist())
+
+    index_by_id = {id(memory) : index for index, memory in enumerate(table.memories)}
+
+    lifetimes = {}
+    for memory in memories:
+        index = index_by_id.get(id(memory))
+        if index is None or last_use[index] < 0:
+            first, last = 0, end
+        else:
+            first, last = int(first_use[index]), int(last_use[index])
+
+        if index not in written:
+            first = 0
+        if memory in pinned:
+            first = 0
+            last = end
+
+        lifetimes[memory] = (first, last)
+
+    return lifetimes
+
+class MemoryPlan():
+    def __init__(self, b_in_line, m_depth, base, zeros):
+        self.b_in_line = b_in_line
+        self.m_depth = m_depth
+        self.base = base
+        self.zeros = zeros
+
+        # all offsets and sizes are in memory lines
+        self.lifetimes = {}
+        self.lines = {}
+        self.peak = base
+        self.unshared = base
+
+    def fits(self):
+        return (self.m_depth is None) or (self.peak <= self.m_depth)
+
+    def report(self):
+        print(f"Memory plan peak : {self.peak} lines " +\
+            f"({self.peak*self.b_in_line} bytes)")
+        print(f"Memory without reuse : {self.unshared} lines " +\
+            f"({self.unshared*self.b_in_line} bytes)")
+        if self.m_depth is not None:
+            print(f"Device m_depth : {self.m_depth} lines " +\
+                f"({100*self.peak/self.m_depth:.1f}% used)")
+
+def place(lines, lifetime, placed):
+    """
+    Returns the lowest offset at which ``lines`` lines fit
+    without colliding with any already placed memory whose
+    lifetime overlaps ``lifetime``.
+    """
+    first, last = lifetime
+    conflicts = []
+    for other_offset, other_lines, (other_first, other_last) in placed:
+        if (other_first <= last) and (first <= other_last):
+            conflicts += [(other_offset, other_offset + other_lines)]
+    conflicts.sort()
+
+    offset = 0
+    for begin, end in conflicts:
+        if (offset + lines) <= begin:
+            break
+        offset = max(offset, end)
+
+    return offset
+
+def plan_memory(op_graph, memories, zeros, pinned=(), b_in_line=4,
+        m_depth=None, base=0):
+    """
+    Assigns a line offset to every memory in ``memories``.
+    Memories whose lifetimes do not overlap share the same
+    lines, and every memory starts on a line boundary.
+
+    ``zeros`` is the shared zero page, placed at ``base``
+    and live for the whole program. Each memory takes as
+    many bytes an element as its own dtype.
+    """
+    plan = MemoryPlan(b_in_line, m_depth, base, zeros)
+
+    logger.debug("PLANNING MEMORY")
+    with LogIndent():
+        lifetimes = compute_lifetimes(op_graph, memories, set(pinned))
+        plan.lifetimes = lifetimes
+
+        zeros.offset = base
+        plan.lines[zeros] = zeros.num_lines(b_in_line)
+        arena_base = base + plan.lines[zeros]
+
+        # largest and longest lived memories first
+        ordered = sorted(memories, key=lambda memory: (
+            -memory.num_lines(b_in_line),
+            lifetimes[memory][0]))
+
+        placed = []
+        arena_peak = 0
+        for memory in ordered:
+            lines = memory.num_lines(b_in_line)
+            offset = place(lines, lifetimes[memory], placed)
+            placed += [(offset, lines, lifetimes[memory])]
+
+            memory.offset = arena_base + offset
+            plan.lines[memory] = lines
+            arena_peak = max(arena_peak, offset + lines)
+            logger.debug(f"{lines} lines at {memory.offset} live over {lifetimes[memory]}")
+
+        plan.peak = arena_base + arena_peak
+        plan.unshared = arena_base + sum(plan.lines[memory] for memory in memories)
+
+    plan.report()
+    if not plan.fits():
+        raise RuntimeError(f"Model requires {plan.peak} lines but device " +\
+            f"only has m_depth of {m_depth} lines.")
+
+    return plan
@@ -0,0 +1,310 @@
+"""
+Post-training quantization of a sanitized model to the 8
+bit signed values the tree computes with.
+
+A batch of calibration inputs is run through a vectorized
+numpy reference of the model to find the range of every
+tensor. Each tensor is then held as ``scale*q`` for an
+int8 ``q``, convolution weights with a scale per output
+channel or per tensor, and biases as int32 in the scale of
+the products they are added to. Every layer records the
+factors that requantize its accumulators into the scale of
+its output as a ``requant`` attribute, which lowering folds
+into the scale its ops write with.
+"""
+from maeri.common.logger import LogIndent, logger
+from maeri.compiler.schedule import schedule
+from maeri.compiler.build_graph.build_memories import load_initializer
+from maeri.compiler.build_graph.build_conv import get_pads, get_stride, get_group
+from maeri.compiler.attributes import get_attribute
+from maeri.compiler.build_graph.build_pool import get_kernel
+
+from numpy.lib.stride_tricks import sliding_window_view
+from onnx import TensorProto, numpy_helper
+from onnx.helper import make_attribute
+import numpy as np
+import onnx
+
+# largest magnitude of a signed 8 bit value
+QMAX = 127
+
+# ops whose second input is a matrix of weights, and whose
+# optional third input is a bias
+WEIGHTED = {"Conv", "Gemm", "MatMul"}
+
+def windows(x, kernel, pad, stride):
+    """
+    Every ``kernel`` by ``kernel`` window of the batch of
+    feature maps ``x``, padded by ``pad`` on every side,
+    that a stride of ``stride`` keeps.
+    """
+    x = np.pad(x, ((0, 0), (0, 0), (pad, pad), (pad, pad)))
+    view = sliding_window_view(x, (kernel, kernel), axis=(2, 3))
+    return view[:, :, ::stride, ::stride]
+
+def reference_conv(node, x, W, B=None):
+    group = get_group(node)
+    pad = (get_pads(node) or [0])[0]
+    view = windows(x, W.shape[-1], pad, get_stride(node))
+    batch, channels, height, width = view.shape[:4]
+    view = view.reshape((batch, group, channels//group) + view.shape[2:])
+    W = W.reshape((group, W.shape[0]//group) + W.shape[1:])
+    res = np.einsum('bgchwij,gocij->bgohw', view, W).reshape(batch, -1, height, width)
+    if B is not None:
+        res = res + B.reshape(1, -1, 1, 1)
+    return res
+
+def reference_average_pool(node, x):
+    kernel = get_kernel(node)[0]
+    pad = (get_pads(node) or [0])[0]
+    return windows(x, kernel, pad, get_stride(node)).mean(axis=(-2, -1))
+
+def reference_gemm(node, A, B, C=None):
+    if get_attribute(node, 'transA', 0):
+        A = A.T
+    if get_attribute(node, 'transB', 0):
+        B = B.T
+    res = get_attribute(node, 'alpha', 1.0)*(A @ B)
+    if C is not None:
+        res = res + get_attribute(node, 'beta', 1.0)*C
+    return res
+
+# vectorized reference of each supported op_type, run on
+# a whole batch of inputs along the model's batch axis
+references = {
+    "Conv" : reference_conv,
+    "Relu" : lambda node, x : np.maximum(x, 0),
+    "Add" : lambda node, a, b : a + b,
+    "AveragePool" : reference_average_pool,
+    "GlobalAveragePool" : lambda node, x : x.mean(axis=(2, 3), keepdims=True),
+    "Flatten" : lambda node, x : x.reshape(x.shape[0], -1),
+    "Gemm" : reference_gemm,
+    "MatMul" : lambda node, A, B : A @ B,
+    }
+
+def reference(model, data, base_dir=None):
+    """
+    Runs ``data``, inputs stacked along a new leading
+    dimension, through ``model`` in double precision.
+    Returns every tensor by name, activations holding the
+    batch along their first axis.
+    """
+    inits = {init.name : np.asarray(load_initializer(init, base_dir), dtype=np.float64)
+        for init in model.graph.initializer}
+    root = [input_ for input_ in model.graph.input if input_.name not in inits][0]
+    shape = [dim.dim_value for dim in root.type.tensor_type.shape.dim]
+
+    tensors = dict(inits)
+    tensors[root.name] = np.asarray(data, dtype=np.float64).reshape([-1] + shape[1:])
+    for node in schedule(model):
+        if node.op_type not in references:
+            raise NotImplementedError(f"Quantization does not yet support " +\
+                f"{node.op_type} nodes.")
+        inputs = [tensors[name] for name in node.input if name]
+        tensors[node.output[0]] = references[node.op_type](node, *inputs)
+
+    return tensors
+
+class Quantizer():
+    """
+    Quantizes sanitized models from the ranges their tensors
+    take over ``calibration``, a batch of inputs stacked
+    along a new leading dimension. Convolution weights get a
+    scale per output channel when ``per_channel`` is set,
+    Gemm weights a single scale as their op writes every
+    output with the same factor.
+
+    scales:
+        scale of every tensor, real values being ``scale*q``,
+        with an array of a scale per output channel for per
+        channel weights
+    requant:
+        factors the accumulators of every layer, named by
+        the tensor it writes, are multiplied by as they are
+        written, a factor per output channel or a single one
+    """
+    def __init__(self, calibration, per_channel=True):
+        self.calibration = calibration
+        self.per_channel = per_channel
+        self.scales = {}
+        self.requant = {}
+        self.input = None
+        self.output = None
+
+    def same_scale(self, nodes, names):
+        """
+        Groups tensors that must share a scale, the operands
+        of an Add and either side of ops that leave values
+        untouched. Returns the group of every name.
+        """
+        parent = {name : name for name in names}
+        def find(name):
+            while parent[name] != name:
+                name = parent[name]
+            return name
+
+        for node in nodes:
+            if node.op_type == "Add":
+                pairs = [(node.input[0], node.input[1])]
+            elif node.op_type in {"Relu", "Flatten"}:
+                pairs = [(node.input[0], node.output[0])]
+            else:
+                continue
+            for first, second in pairs:
+                parent[find(first)] = find(second)
+
+        return {name : find(name) for name in names}
+
+    def weight_scale(self, node, W):
+        magnitude = np.abs(W)
+        if self.per_channel and (node.op_type == "Conv"):
+            peak = magnitude.reshape(W.shape[0], -1).max(axis=1)
+        else:
+            peak = np.array(magnitude.max())
+        return np.where(peak > 0, peak, QMAX)/QMAX
+
+    def quantize(self, model, base_dir=None, keep_scales=False):
+        """
+        Returns a copy of ``model`` with int8 weights and
+        activations, int32 biases and the ``requant``
+        factors of every layer. Initializers with external
+        data are found relative to ``base_dir``.
+
+        With ``keep_scales`` every tensor keeps the scale an
+        earlier quantization gave it, so the weights of a
+        retrained model of the same topology quantize to the
+        same requantization factors, clipping any weight
+        beyond the old range.
+        """
+        logger.debug("QUANTIZING MODEL")
+        with LogIndent():
+            if keep_scales:
+                tensors = {init.name : np.asarray(load_initializer(init, base_dir),
+                    dtype=np.float64) for init in model.graph.initializer}
+            else:
+                tensors = reference(model, self.calibration, base_dir)
+
+            quantized = onnx.ModelProto()
+            quantized.CopyFrom(model)
+            nodes = schedule(quantized)
+            inits = {init.name for init in quantized.graph.initializer}
+
+            weights = {node.input[1] for node in nodes if node.op_type in WEIGHTED}
+            biases = {node.input[2] for node in nodes
+                if (node.op_type in WEIGHTED) and (len(node.input) == 3) and node.input[2]}
+            values = [name for name in tensors if name not in weights | biases]
+
+            if keep_scales:
+                names = {name for node in nodes for name in node.input if name} |\
+                    {node.output[0] for node in nodes}
+                missing = sorted(names - set(self.scales))
+                if missing:
+                    raise ValueError(f"Tensor {missing[0]} has no scale from an " +\
+                        "earlier quantization.")
+
+            # activations of a group share the scale of
+            # its widest member
+            if not keep_scales:
+                group = self.same_scale(nodes, values)
+                peak = {}
+                for name in values:
+                    peak[group[name]] = max(peak.get(group[name], 0),
+                        np.max(np.abs(tensors[name])))
+                for name in values:
+                    self.scales[name] = (peak[group[name]] or QMAX)/QMAX
+
+            data = {}
+            for node in nodes:
+                y = self.scales[node.output[0]]
+                factors = None
+
+                if node.op_type in WEIGHTED:
+                    x = self.scales[node.input[0]]
+                    W = tensors[node.input[1]]
+                    if keep_scales:
+                        w = self.scales[node.input[1]]
+                    else:
+                        w = self.weight_scale(node, W)
+                    self.scales[node.input[1]] = w
+                    shape = (-1,) + (1,)*(W.ndim - 1) if w.ndim else ()
+                    if np.any(np.abs(W/w.reshape(shape)) > QMAX + 0.5):
+                        logger.warning(f"Weights of {node.input[1]} clipped to " +\
+                            "the range of their previous scale")
+                    data[node.input[1]] = self.to_int(W/w.reshape(shape), np.int8)
+
+                    # the bias is summed with the products, in
+                    # their scale, before alpha scales the sum
+                    alpha = get_attribute(node, 'alpha', 1.0)
+                    if (len(node.input) == 3) and node.input[2]:
+                        beta = get_attribute(node, 'beta', 1.0)
+                        bias = tensors[node.input[2]]*beta/alpha
+                        self.scales[node.input[2]] = x*w
+                        data[node.input[2]] = self.to_int(bias/(x*w), np.int32)
+                        if node.op_type == "Gemm":
+                            self.set_attribute(node, 'beta', alpha)
+                    factors = x*w/y
+
+                elif node.op_type in {"AveragePool", "GlobalAveragePool", "Add"}:
+                    factors = self.scales[node.input[0]]/y
+
+                if factors is not None:
+                    factors = np.atleast_1d(factors).astype(np.float32)
+                    self.requant[node.output[0]] = factors
+                    self.set_attribute(node, 'requant', factors.tolist())
+                    logger.debug(f"{node.op_type} writing {node.output[0]} requantized " +\
+                        f"by {factors.min():.3g} to {factors.max():.3g}")
+
+            # any other constants, such as the operand of an
+            # Add, take the scale of their group
+            for name in inits - weights - biases:
+                data[name] = self.to_int(tensors[name]/self.scales[name], np.int8)
+
+            self.rewrite(quantized, data)
+
+            root = [input_.name for input_ in quantized.graph.input if input_.name not in inits]
+            self.input = self.scales[root[0]]
+            self.output = self.scales[quantized.graph.output[0].name]
+
+        return quantized
+
+    @staticmethod
+    def to_int(values, dtype):
+        info = np.iinfo(dtype)
+        return np.clip(np.rint(values), info.min, info.max).astype(dtype)
+
+    @staticmethod
+    def set_attribute(node, name, value):
+        for attribute in node.attribute:
+            if attribute.name == name:
+                node.attribute.remove(attribute)
+                break
+        node.attribute.append(make_attribute(name, value))
+
+    @staticmethod
+    def rewrite(model, data):
+        """
+        Replaces the initializers of ``model`` with ``data``
+        and types every tensor as its quantized dtype.
+        """
+        initializers = [numpy_helper.from_array(data[init.name], init.name)
+            for init in model.graph.initializer]
+        del model.graph.initializer[:]
+        model.graph.initializer.extend(initializers)
+
+        int32 = {init.name for init in initializers if init.data_type == TensorProto.INT32}
+        for value in list(model.graph.input) + list(model.graph.value_info) +\
+                list(model.graph.output):
+            value.type.tensor_type.elem_type =\
+                TensorProto.INT32 if value.name in int32 else TensorProto.INT8
+
+    def quantize_input(self, x):
+        """
+        Quantizes real inputs into the int8 the host writes.
+        """
+        return self.to_int(np.asarray(x)/self.input, np.int8)
+
+    def dequantize_output(self, y):
+        """
+        Real values of the int8 outputs the host reads back.
+        """
+        return np.asarray(y)*self.output
@@ -0,0 +1,185 @@
+from maeri.common.logger import LogIndent, logger
+from maeri.compiler.cost_model import config_keys, reconfigures
+from maeri.compiler.nodes.OpTable import MAX_DIMS
+
+import numpy as np
+import heapq
+
+# operand position of the result in an op table
+OUT = 2
+
+def box_cells(start, stop):
+    """
+    Splits a memory along the edges of the boxes ``start,
+    stop`` accessing it into cells no box partly covers.
+    Returns the cells each box covers.
+    """
+    edges = [np.unique(np.concatenate([start[:, dim], stop[:, dim]]))
+        for dim in range(start.shape[1])]
+    first = np.stack([np.searchsorted(edge, start[:, dim]) for dim, edge in enumerate(edges)], axis=1)
+    last = np.stack([np.searchsorted(edge, stop[:, dim]) for dim, edge in enumerate(edges)], axis=1)
+    shape = [max(len(edge) - 1, 1) for edge in edges]
+
+    cells = []
+    for box_first, box_last in zip(first.tolist(), last.tolist()):
+        ranges = np.ix_(*[np.arange(begin, end) for begin, end in zip(box_first, box_last)])
+        cells += [np.ravel_multi_index(ranges, shape).reshape(-1).tolist()]
+    return cells, int(np.prod(shape))
+
+def dependencies(table):
+    """
+    Returns the ``(earlier, later)`` row pairs of ``table``
+    that must keep their order, because the later row
+    reads, or either row overwrites, data the other writes.
+
+    Accesses are swept in row order, every cell of a
+    written memory keeping its last writer and the readers
+    since, so a row only waits on the latest rows it
+    conflicts with. Conflicts with rows before those follow
+    from the pairs, whose number grows with the rows rather
+    than with their square.
+    """
+    rows = np.arange(len(table))
+    written = np.unique(table.mem[:, OUT])
+
+    access_rows, access_cells, access_writes = [], [], []
+    num_cells = 0
+    for memory in written[written >= 0].tolist():
+        accessors, starts, stops, writes = [], [], [], []
+        for position in range(table.mem.shape[1]):
+            readers = rows[table.mem[:, position] == memory]
+            accessors += [readers]
+            starts += [table.start[readers, position]]
+            stops += [table.stop[readers, position]]
+            writes += [np.full([len(readers)], position == OUT)]
+
+        bounds = np.concatenate([np.concatenate(starts), np.concatenate(stops)], axis=1)
+        boxes, box = np.unique(bounds, axis=0, return_inverse=True)
+        cells, count = box_cells(boxes[:, :MAX_DIMS], boxes[:, MAX_DIMS:])
+        cells = [[cell + num_cells for cell in box_cells_] for box_cells_ in cells]
+        num_cells += count
+
+        access_rows += accessors
+        access_cells += [cells[index] for index in box.reshape(-1).tolist()]
+        access_writes += writes
+
+    # the reads of a row come before its write
+    access_rows = np.concatenate(access_rows + [np.zeros([0], dtype=np.int64)])
+    access_writes = np.concatenate(access_writes + [np.zeros([0], dtype=bool)])
+    order = np.lexsort((access_writes, access_rows))
+
+    last_writer = [-1]*num_cells
+    readers = [[] for _ in range(num_cells)]
+    earlier, later = [], []
+    for index, row, write in zip(order.tolist(), access_rows[order].tolist(),
+            access_writes[order].tolist()):
+        for cell in access_cells[index]:
+            writer = last_writer[cell]
+            if (writer >= 0) and (writer != row):
+                earlier += [writer]
+                later += [row]
+            if write:
+                earlier += readers[cell]
+                later += [row]*len(readers[cell])
+                last_writer[cell] = row
+                readers[cell] = []
+            else:
+                readers[cell] += [row]
+
+    pairs = np.stack([np.array(earlier, dtype=np.int64), np.array(later, dtype=np.int64)],
+        axis=1).reshape(-1, 2)
+    pairs = np.unique(pairs[pairs[:, 0] != pairs[:, 1]], axis=0)
+    return pairs[:, 0], pairs[:, 1]
+
+def config_loads(table):
+    return int(np.count_nonzero(reconfigures(table)))
+
+def list_schedule(table, rank, config=None, pairs=None):
+    """
+    Orders the rows of ``table`` within their dependencies,
+    always issuing the ready row of lowest ``rank``. When
+    ``config`` labels the tree configuration of every row,
+    the schedule sticks with the current configuration
+    while any ready row runs on it. ``pairs`` are the
+    ``dependencies`` of ``table`` when already known.
+
+    Returns the order of the rows.
+    """
+    if config is None:
+        config = np.zeros([len(table)], dtype=np.int64)
+        sticky = False
+    else:
+        sticky = True
+
+    earlier, later = dependencies(table) if pairs is None else pairs
+    logger.debug(f"{len(earlier)} dependencies between {len(table)} ops")
+
+    waiting = np.bincount(later, minlength=len(table))
+    successors = np.split(later[np.argsort(earlier, kind='stable')],
+        np.cumsum(np.bincount(earlier, minlength=len(table)))[:-1])
+    rank = rank.tolist()
+
+    # ready rows by configuration, and all ready rows,
+    # kept as heaps of (rank, row)
+    ready_by_config = {}
+    ready = []
+    for row in np.nonzero(waiting == 0)[0].tolist():
+        ready_by_config.setdefault(config[row], []).append((rank[row], row))
+        ready += [(rank[row], row)]
+    heapq.heapify(ready)
+    for bucket in ready_by_config.values():
+        heapq.heapify(bucket)
+
+    order = []
+    scheduled = np.zeros([len(table)], dtype=bool)
+    current = None
+    while len(order) < len(table):
+        # scheduled rows are dropped from the heaps lazily
+        bucket = ready_by_config.get(current, []) if sticky else []
+        while bucket and scheduled[bucket[0][1]]:
+            heapq.heappop(bucket)
+        if not bucket:
+            while scheduled[ready[0][1]]:
+                heapq.heappop(ready)
+            current = config[ready[0][1]]
+            bucket = ready_by_config[current]
+            while scheduled[bucket[0][1]]:
+                heapq.heappop(bucket)
+        _, row = heapq.heappop(bucket)
+
+        scheduled[row] = True
+        order += [row]
+        for successor in successors[row].tolist():
+            waiting[successor] -= 1
+            if waiting[successor] == 0:
+                entry = (rank[successor], successor)
+                heapq.heappush(ready_by_config.setdefault(config[successor], []), entry)
+                heapq.heappush(ready, entry)
+
+    return np.array(order, dtype=np.int64)
+
+def reorder(table):
+    """
+    Reorders the rows of a solved ``table`` so that rows
+    running on the same tree configuration follow each
+    other, keeping every dependency between rows.
+
+    Rows are scheduled as they become ready. The schedule
+    sticks with the current configuration while any ready
+    row runs on it and otherwise moves to the earliest
+    ready row, so independent work stays in roughly its
+    original order.
+
+    Returns the reordered table and the order of its rows.
+    """
+    logger.debug("REORDERING OPS")
+    with LogIndent():
+        _, config = np.unique(config_keys(table), axis=0, return_inverse=True)
+        order = list_schedule(table, np.arange(len(table)), config.reshape(-1))
+        reordered = table.select(order)
+
+        before, after = config_loads(table), config_loads(reordered)
+        logger.debug(f"Configuration loads {before} -> {after}")
+
+    print(f"Configuration loads : {before} -> {after} ({before - after} saved)")
+    return reordered, order
@@ -36,9 +36,21 @@ def explicit_pad_pass(node, extended_model):
     if dims[0] != dims[1]:
         raise NotImplementedError("Currently only supporting square filters.")
 
-    # TODO : check  if padding even
-    
-    pad_length = int((dims[0] - 1)/2)
+    strides = [1, 1]
+    for attribute in ordered_attributes:
+        if attribute.name == 'strides':
+            strides = list(attribute.ints)
+
+    # SAME_UPPER keeps ceil(input/stride) outputs, padding
+    # just enough for the last window to fit
+    input_width = lookup_ref_dims_by_name(node.input[0], extended_model)[-1]
+    outputs = -(-input_width//strides[0])
+    total = max((outputs - 1)*strides[0] + dims[0] - input_width, 0)
+    if total % 2:
+        raise NotImplementedError(f"`SAME_UPPER` padding of {total} " +\
+            "can not be split evenly.")
+
+    pad_length = total//2
     node.attribute.remove(auto_pad_attribute)
     node.attribute.append(make_attribute('pads', [pad_length]*4))
     logger.debug(f"FINISHED {explicit_pad_pass.__name__} pass")
\ No newline at end of file
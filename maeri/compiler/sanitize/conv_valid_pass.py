@@ -15,6 +15,25 @@ def conv_valid_pass(node, extended_model):
         ordered_names += [attribute.name]
         ordered_attributes += [attribute]
 
+    # strides may differ from 1, but must be the same
+    # along both dimensions
+    for index, name in enumerate(ordered_names):
+        if name == 'strides':
+            strides = list(ordered_attributes[index].ints)
+            if (len(strides) != 2) or (strides[0] != strides[1]) or (strides[0] < 1):
+                raise NotImplementedError("Currently only supporting " +\
+                    f"equal strides along both dimensions, not {strides}")
+
+    # groups must split the input channels evenly
+    for index, name in enumerate(ordered_names):
+        if name == 'group':
+            group = ordered_attributes[index].i
+            channels = lookup_ref_dims_by_name(node.input[0], extended_model)[1]
+            filters = lookup_ref_dims_by_name(node.input[1], extended_model)[0]
+            if (group < 1) or (channels % group) or (filters % group):
+                raise NotImplementedError(f"Can not split {channels} channels " +\
+                    f"and {filters} filters into {group} groups.")
+
     # check that node has auto_pad attribute
     dilation_attribute = None
     for index, name in enumerate(ordered_names):
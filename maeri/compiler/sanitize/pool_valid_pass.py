@@ -0,0 +1,50 @@
+import onnx
+
+from maeri.common.logger import logger
+
+def pool_valid_pass(node, extended_model):
+    """
+    Check that an AveragePool node has only attributes that
+    can be lowered onto the tree, square windows whose
+    every element counts towards the average.
+    """
+    attributes = {attribute.name : attribute for attribute in node.attribute}
+
+    kernel = list(attributes['kernel_shape'].ints)
+    if (len(kernel) != 2) or (kernel[0] != kernel[1]):
+        raise NotImplementedError(f"Currently only supporting square pools, not {kernel}")
+
+    if 'strides' in attributes:
+        strides = list(attributes['strides'].ints)
+        if (len(strides) != 2) or (strides[0] != strides[1]) or (strides[0] < 1):
+            raise NotImplementedError("Currently only supporting " +\
+                f"equal strides along both dimensions, not {strides}")
+
+    if 'dilations' in attributes:
+        dilations = list(attributes['dilations'].ints)
+        if dilations != [1, 1]:
+            raise NotImplementedError("Currently only supporting " +\
+                f"dilations of size [1,1] not {dilations}")
+
+    if ('ceil_mode' in attributes) and attributes['ceil_mode'].i:
+        raise NotImplementedError("Currently only supporting pools with `ceil_mode` off.")
+
+    if 'auto_pad' in attributes:
+        auto_pad = attributes['auto_pad'].s.decode("utf-8")
+        if auto_pad not in {"NOTSET", "VALID"}:
+            raise NotImplementedError(f"Currently only supporting explicit pool " +\
+                f"padding, not {auto_pad}.")
+
+    # windows overlapping the padding must still average
+    # over every element, padding included
+    pads = list(attributes['pads'].ints) if 'pads' in attributes else [0]*4
+    if any(pads):
+        if len(set(pads)) != 1:
+            raise NotImplementedError(f"Currently only supporting uniform padding, not {pads}")
+        count_include_pad = ('count_include_pad' in attributes) and\
+            attributes['count_include_pad'].i
+        if not count_include_pad:
+            raise NotImplementedError("Currently only supporting padded pools " +\
+                "with `count_include_pad` set.")
+
+    logger.debug(f"FINISHED {pool_valid_pass.__name__} pass")
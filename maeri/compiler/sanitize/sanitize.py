@@ -3,12 +3,51 @@ from maeri.common.logger import logger, LogIndent
 
 from maeri.compiler.sanitize.conv_pad_pass import explicit_pad_pass
 from maeri.compiler.sanitize.conv_valid_pass import conv_valid_pass
+from maeri.compiler.sanitize.pool_valid_pass import pool_valid_pass
 
 import onnx
 import onnx.utils
-from onnx import optimizer
+from onnx import optimizer, TensorProto
+from onnx.external_data_helper import load_external_data_for_tensor
+
+def fused_initializers(model):
+    """
+    Names of the initializers whose data the optimizer
+    passes read, folding them into other initializers: the
+    operands of a BatchNormalization along with the weights
+    and bias of the Conv feeding it, and the pads of a Pad.
+    """
+    producers = {output : node for node in model.graph.node for output in node.output}
+    names = set()
+    for node in model.graph.node:
+        if node.op_type == 'BatchNormalization':
+            names |= set(node.input[1:])
+            conv = producers.get(node.input[0])
+            if (conv is not None) and (conv.op_type == 'Conv'):
+                names |= set(conv.input[1:])
+        elif node.op_type == 'Pad':
+            names |= set(node.input[1:])
+    return names
+
+def sanitize(model, base_dir=None):
+    # the optimizer passes fold some initializers into
+    # others, so their external data found in ``base_dir``
+    # is loaded into the model first. Every other external
+    # initializer stays a reference for build_memories to
+    # memory map
+    fused = fused_initializers(model)
+    external = [init for init in model.graph.initializer
+        if (init.data_location == TensorProto.EXTERNAL) and (init.name in fused)]
+    if external:
+        if base_dir is None:
+            raise ValueError(f"Initializer {external[0].name} has external data but " +\
+                "the model directory is unknown.")
+        logger.debug(f"Loading external data of {len(external)} initializers")
+        for init in external:
+            load_external_data_for_tensor(init, base_dir)
+            init.data_location = TensorProto.DEFAULT
+            del init.external_data[:]
 
-def sanitize(model):
     # compiler currently unable to reason about
     # batch normalization, fusing helps
     passes = ['fuse_bn_into_conv', 'fuse_pad_into_conv']
@@ -28,6 +67,8 @@ def sanitize(model):
                 if node.op_type == 'Conv':
                     conv_valid_pass(node, extended_model)
                     explicit_pad_pass(node, extended_model)
+                elif node.op_type == 'AveragePool':
+                    pool_valid_pass(node, extended_model)
                 else:
                     logger.debug("No passes applied.")
 
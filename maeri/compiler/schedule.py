@@ -1,26 +1,91 @@
 from maeri.common.logger import LogIndent, logger
+from collections import deque
+import heapq
 import onnx
 
-def schedule(model):
-    schedule = []
-    collected_outputs = []
+def schedule(model, priority=None):
+    """
+    Topologically orders ``model.graph.node`` using Kahn's
+    algorithm. Runs in O(V+E) and leaves ``model`` untouched.
+
+    ``priority`` is an optional callable taking a node and
+    returning a sortable key. When given, ties between nodes
+    that are ready at the same time go to the node with the
+    smallest key, otherwise ties keep graph order.
+
+    Raises ``RuntimeError`` listing any nodes whose inputs
+    can never be satisfied.
+    """
+    nodes = list(model.graph.node)
+
+    collected_inputs = {_.name for _ in model.graph.input}
+    collected_inputs |= {_.name for _ in model.graph.initializer}
 
-    collected_inputs = [_.name for _ in model.graph.input]
-    collected_inputs += [_.name for _ in model.graph.initializer]
-    collected_inputs = list(set(collected_inputs))
+    # map each reference to the nodes consuming it and count
+    # how many references each node is still waiting on
+    consumers = {}
+    waiting_on = []
+    for index, node in enumerate(nodes):
+        pending = {input_ for input_ in node.input if input_ not in collected_inputs}
+        # optional inputs are encoded as empty names
+        pending.discard("")
+        waiting_on += [len(pending)]
+        for input_ in pending:
+            consumers.setdefault(input_, []).append(index)
+
+    # ready queue, ordered by graph position or priority
+    if priority is None:
+        ready = deque(index for index, count in enumerate(waiting_on) if count == 0)
+        push = ready.append
+        pop = ready.popleft
+    else:
+        ready = [(priority(nodes[index]), index) for index, count in enumerate(waiting_on) if count == 0]
+        heapq.heapify(ready)
+        push = lambda index: heapq.heappush(ready, (priority(nodes[index]), index))
+        pop = lambda: heapq.heappop(ready)[1]
+
+    schedule = []
+    produced = set()
 
     logger.debug("NOW SCHEDULING")
 
     with LogIndent():
-        while len(model.graph.node) > 0:
-            for node in model.graph.node:
-                combined_references = collected_inputs + collected_outputs
-                inputs_satisfied = all([input_ in combined_references for input_ in node.input])
-                if inputs_satisfied:
-                    model.graph.node.remove(node)
-                    collected_outputs += list(node.output)
-                    schedule += [node]
-                    logger.debug(node.name)
-                    break
-    
-    return schedule
\ No newline at end of file
+        while ready:
+            index = pop()
+            node = nodes[index]
+            schedule += [node]
+            logger.debug(node.name)
+
+            for output in node.output:
+                # a reference only satisfies its consumers once
+                if output in produced:
+                    continue
+                produced.add(output)
+
+                for consumer in consumers.get(output, []):
+                    waiting_on[consumer] -= 1
+                    if waiting_on[consumer] == 0:
+                        push(consumer)
+
+    if len(schedule) != len(nodes):
+        unsatisfiable = [node.name or node.op_type for node, count
+            in zip(nodes, waiting_on) if count > 0]
+        raise RuntimeError(f"Unable to schedule nodes {unsatisfiable}, " +\
+            "their inputs can never be satisfied.")
+
+    return schedule
+
+
+def weight_reuse(model):
+    """
+    Builds a ``priority`` for ``schedule`` keyed on the weights
+    a node consumes, so that ready nodes sharing initializers
+    are placed next to each other.
+    """
+    init_names = {_.name for _ in model.graph.initializer}
+
+    def priority(node):
+        weights = sorted(input_ for input_ in node.input if input_ in init_names)
+        return tuple(weights)
+
+    return priority
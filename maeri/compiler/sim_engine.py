@@ -0,0 +1,359 @@
+from maeri.common.logger import LogIndent, logger
+from maeri.compiler.nodes import OpTable
+from maeri.compiler.nodes.OpTable import MAX_DIMS
+from maeri.compiler.nodes.Memory import compute_dtype
+
+from numpy.lib.stride_tricks import sliding_window_view
+import numpy as np
+
+# operand positions in an op table
+IN_0, IN_1, OUT, BIAS, RESIDUAL = 0, 1, 2, 3, 4
+
+# padding columns
+LEFT, UPPER, RIGHT, BOTTOM = 0, 1, 2, 3
+
+# rows of the hazard check are compared in blocks of
+# this many rows to bound memory use
+BLOCK = 256
+
+def signatures(table):
+    """
+    Rows sharing a signature can be computed together by
+    one vectorized kernel. For Conv2 rows the signature
+    holds the padded input shape, the filter shape and the
+    stride, for Gemm rows the input and weight shapes.
+    """
+    pad = table.pad.astype(np.int64)
+    extent = table.extent(IN_0).astype(np.int64)
+    extent[:, 2] += pad[:, UPPER] + pad[:, BOTTOM]
+    extent[:, 3] += pad[:, LEFT] + pad[:, RIGHT]
+
+    weighted = np.isin(table.kind, [OpTable.CONV, OpTable.GEMM])[:, np.newaxis]
+    filters = np.where(weighted, table.extent(IN_1), 0)
+
+    return np.concatenate([table.kind[:, np.newaxis], extent, filters,
+        table.stride[:, np.newaxis]], axis=1)
+
+def reads(kind):
+    if kind == OpTable.RELU:
+        return [IN_0]
+    if kind == OpTable.CONV:
+        return [IN_0, IN_1, BIAS, RESIDUAL]
+    if kind == OpTable.GEMM:
+        return [IN_0, IN_1, BIAS]
+    return [IN_0, IN_1]
+
+def overlaps(start, stop, other_start, other_stop):
+    """
+    Pairwise overlap of boxes ``start, stop`` with boxes
+    ``other_start, other_stop``.
+    """
+    return np.all((start[:, np.newaxis] < other_stop[np.newaxis]) &
+        (other_start[np.newaxis] < stop[:, np.newaxis]), axis=2)
+
+def last_conflicts(table, begin, end):
+    """
+    For each row of ``table[begin:end]`` returns the last
+    earlier row of the range it must wait for, either
+    because it reads or overwrites data that row writes.
+    Rows without such a conflict get -1.
+    """
+    kind = table.kind[begin]
+    rows = np.arange(begin, end)
+    conflicts = np.full([end - begin], -1, dtype=np.int64)
+
+    written = table.mem[begin:end, OUT]
+    accesses = [(table.mem[begin:end, position], position)
+        for position in reads(kind) + [OUT]]
+
+    for memory in np.unique(written):
+        writers = rows[written == memory]
+        w_start = table.start[writers, OUT]
+        w_stop = table.stop[writers, OUT]
+
+        for mems, position in accesses:
+            readers = rows[mems == memory]
+            for index in range(0, len(readers), BLOCK):
+                block = readers[index:index + BLOCK]
+                hits = overlaps(table.start[block, position], table.stop[block, position],
+                    w_start, w_stop)
+                hits &= writers[np.newaxis] < block[:, np.newaxis]
+                last = np.max(np.where(hits, writers[np.newaxis], -1), axis=1)
+                np.maximum.at(conflicts, block - begin, last)
+
+    return conflicts
+
+class Kernel():
+    def __init__(self, kind, signature, begin, end):
+        self.kind = kind
+        self.signature = signature
+        self.begin = begin
+        self.end = end
+
+class SimEngine():
+    """
+    Functional simulator for an op graph. Consecutive ops
+    of the same shape that do not depend on each other are
+    fused into a kernel and computed with a single numpy
+    call, and every kernel runs over a batch of inputs at
+    once. Every memory keeps its own dtype, results being
+    computed wide and stored back in it.
+    """
+    def __init__(self, op_graph, entrypoint, exitpoint):
+        self.entrypoint = entrypoint
+        self.exitpoint = exitpoint
+
+        if isinstance(op_graph, OpTable):
+            table = op_graph
+        else:
+            table = OpTable.from_ops(op_graph)
+        self.table = table
+
+        # memories holding per image data carry a batch
+        # dimension, all others are shared by the batch
+        self.memories = list(table.memories)
+        self.index_by_id = {id(memory) : index for index, memory in enumerate(self.memories)}
+        for point in [entrypoint, exitpoint]:
+            if id(point.mem_ref) not in self.index_by_id:
+                self.index_by_id[id(point.mem_ref)] = len(self.memories)
+                self.memories += [point.mem_ref]
+
+        self.batched = set(np.unique(table.mem[:, OUT]).tolist())
+        self.batched.add(self.index_by_id[id(entrypoint.mem_ref)])
+
+        self.kernels = self.build_kernels(table)
+        logger.debug(f"Fused {len(table)} ops into {len(self.kernels)} kernels")
+
+    def build_kernels(self, table):
+        kernels = []
+        if len(table) == 0:
+            return kernels
+
+        sigs = signatures(table)
+        changes = np.any(sigs[1:] != sigs[:-1], axis=1)
+        bounds = [0] + (np.nonzero(changes)[0] + 1).tolist() + [len(table)]
+
+        for begin, end in zip(bounds[:-1], bounds[1:]):
+            kind = table.kind[begin]
+            signature = tuple(sigs[begin].tolist())
+
+            # split runs where a row depends on an earlier row
+            conflicts = last_conflicts(table, begin, end)
+            start = begin
+            for row in (np.nonzero(conflicts >= 0)[0] + begin).tolist():
+                if conflicts[row - begin] >= start:
+                    kernels += [Kernel(kind, signature, start, row)]
+                    start = row
+            kernels += [Kernel(kind, signature, start, end)]
+
+        return kernels
+
+    def state_4d(self, state, index):
+        """
+        Returns the state of memory ``index`` as a batch
+        dimension followed by ``MAX_DIMS`` dimensions.
+        """
+        data = state[index]
+        if index not in self.batched:
+            data = data[np.newaxis]
+        lead = MAX_DIMS - (data.ndim - 1)
+        return data.reshape(data.shape[:1] + (1,)*lead + data.shape[1:])
+
+    def indices(self, rows, position, shape, pad_lo=None):
+        """
+        Index arrays selecting a window of ``shape`` for each
+        row, starting ``pad_lo`` before the operand's box,
+        along with a mask of which elements fall in the box.
+        """
+        start = self.table.start[rows, position].astype(np.int64)
+        stop = self.table.stop[rows, position].astype(np.int64)
+        if pad_lo is not None:
+            start = start - pad_lo
+
+        index = []
+        valid = True
+        for dim, length in enumerate(shape):
+            view = [len(rows)] + [1]*len(shape)
+            view[dim + 1] = length
+            dim_index = start[:, dim, np.newaxis] + np.arange(length)
+            dim_valid = (dim_index >= self.table.start[rows, position, dim, np.newaxis]) & \
+                (dim_index < stop[:, dim, np.newaxis])
+            index += [dim_index.reshape(view)]
+            valid = valid & dim_valid.reshape(view)
+
+        return index, valid
+
+    def gather(self, state, rows, position, shape, pad_lo=None):
+        """
+        Gathers a window of ``shape`` from operand ``position``
+        of every row in ``rows``, returning an array with a
+        batch dimension then a row dimension. Elements outside
+        the operand's box, such as padding, read as zero.
+        """
+        mems = self.table.mem[rows, position]
+        batch = max([self.batch if memory in self.batched else 1
+            for memory in np.unique(mems).tolist()])
+
+        # values are widened so that sums do not overflow
+        # the memories' compact dtypes
+        dtype = compute_dtype(np.result_type(*[self.memories[memory].dtype
+            for memory in np.unique(mems).tolist()]))
+        out = np.zeros((batch, len(rows)) + tuple(shape), dtype=dtype)
+
+        for memory in np.unique(mems).tolist():
+            members = np.nonzero(mems == memory)[0]
+            data = self.state_4d(state, memory)
+            index, valid = self.indices(rows[members], position, shape,
+                None if pad_lo is None else pad_lo[members])
+
+            # clip so that padding indexes a valid element,
+            # which the mask then zeroes
+            index = [np.clip(dim_index, 0, length - 1)
+                for dim_index, length in zip(index, data.shape[1:])]
+            out[:, members] = data[(slice(None),) + tuple(index)] * valid
+
+        return out
+
+    def scatter(self, state, rows, values):
+        mems = self.table.mem[rows, OUT]
+        shape = self.table.extent(OUT)[rows[0]]
+        values = values.reshape(values.shape[:2] + tuple(shape))
+
+        # results are scaled, then fused Relus clamp them,
+        # as they are written
+        scale = self.table.scale[rows]
+        if np.any(scale != 1):
+            values = values*scale.reshape((1, -1) + (1,)*MAX_DIMS)
+        relu = self.table.relu[rows]
+        if np.any(relu):
+            values[:, relu] = np.maximum(values[:, relu], 0)
+
+        for memory in np.unique(mems).tolist():
+            members = np.nonzero(mems == memory)[0]
+            data = self.state_4d(state, memory)
+            index, valid = self.indices(rows[members], OUT, shape)
+            written = values[:, members]
+            # scaled results round to the nearest integer,
+            # and saturate as the collectors write them
+            if (written.dtype.kind == 'f') and (data.dtype.kind in 'iu'):
+                written = np.rint(written)
+            if data.dtype.kind in 'iu':
+                info = np.iinfo(data.dtype)
+                written = np.clip(written, info.min, info.max)
+            data[(slice(None),) + tuple(index)] = written
+
+    def run_conv(self, state, kernel, rows):
+        _, e0, e1, height, width, w0, w1, kh, kw, stride = kernel.signature
+        channels = e0*e1
+
+        pad = self.table.pad[rows].astype(np.int64)
+        pad_lo = np.zeros([len(rows), MAX_DIMS], dtype=np.int64)
+        pad_lo[:, 2] = pad[:, UPPER]
+        pad_lo[:, 3] = pad[:, LEFT]
+
+        X = self.gather(state, rows, IN_0, (e0, e1, height, width), pad_lo)
+        W = self.gather(state, rows, IN_1, (w0, w1, kh, kw))
+
+        # im2col over the windows every row keeps, then
+        # one batched matmul
+        X = X.reshape([-1, len(rows), channels, height, width])
+        windows = sliding_window_view(X, (kh, kw), axis=(3, 4))
+        windows = windows[:, :, :, ::stride, ::stride]
+        batch, count, _, out_h, out_w = windows.shape[:5]
+        cols = windows.transpose(0, 1, 3, 4, 2, 5, 6)
+        cols = cols.reshape([batch, count, out_h*out_w, channels*kh*kw])
+        W = W.reshape([-1, count, channels*kh*kw, 1])
+        res = np.matmul(cols, W)
+
+        # the bias of each row is added to all its outputs
+        biased = self.table.mem[rows, BIAS] >= 0
+        if np.any(biased):
+            bias = self.gather(state, rows[biased], BIAS, (1,)*MAX_DIMS)
+            res = res.astype(np.result_type(res, bias))
+            res[:, biased] += bias.reshape(bias.shape[:2] + (1, 1))
+
+        # a fused residual is summed into every output
+        residual = self.table.mem[rows, RESIDUAL] >= 0
+        if np.any(residual):
+            shape = self.table.extent(OUT)[rows[0]]
+            R = self.gather(state, rows[residual], RESIDUAL, shape)
+            res = np.broadcast_to(res, (max(res.shape[0], R.shape[0]),) + res.shape[1:])
+            res = res.astype(np.result_type(res, R))
+            res[:, residual] += R.reshape(R.shape[:2] + (-1, 1))
+
+        self.scatter(state, rows, res)
+
+    def run_gemm(self, state, kernel, rows):
+        _, e0, e1, e2, e3, w0, w1, outputs, inputs, _ = kernel.signature
+
+        # every row is a matrix vector product, of the
+        # weights of its outputs by its slice of the input
+        A = self.gather(state, rows, IN_0, (e0, e1, e2, e3))
+        W = self.gather(state, rows, IN_1, (w0, w1, outputs, inputs))
+        A = A.reshape([-1, len(rows), inputs, 1])
+        W = W.reshape([-1, len(rows), outputs, inputs])
+        res = np.matmul(W, A)
+
+        biased = self.table.mem[rows, BIAS] >= 0
+        if np.any(biased):
+            shape = self.table.extent(BIAS)[rows[biased][0]]
+            bias = self.gather(state, rows[biased], BIAS, shape)
+            res = res.astype(np.result_type(res, bias))
+            res[:, biased] += bias.reshape(bias.shape[:2] + (outputs, 1))
+
+        self.scatter(state, rows, res)
+
+    def run_add(self, state, kernel, rows):
+        shape = kernel.signature[1:5]
+        A = self.gather(state, rows, IN_0, shape)
+        B = self.gather(state, rows, IN_1, shape)
+        self.scatter(state, rows, A + B)
+
+    def run_relu(self, state, kernel, rows):
+        shape = kernel.signature[1:5]
+        data = self.gather(state, rows, IN_0, shape)
+        self.scatter(state, rows, np.maximum(data, 0))
+
+    def point_view(self, state, point):
+        data = state[self.index_by_id[id(point.mem_ref)]]
+        return data[(slice(None),) + tuple(point.slice)]
+
+    def run(self, data):
+        """
+        Runs the op graph on ``data``, which is either a
+        single input or a batch of inputs stacked along a
+        new leading dimension.
+        """
+        root = self.entrypoint
+        root_shape = root.mem_ref.data[tuple(root.slice)].shape
+        data = np.asarray(data)
+
+        single = (data.shape == root_shape)
+        if single:
+            data = data[np.newaxis]
+        self.batch = batch = data.shape[0]
+
+        state = []
+        for index, memory in enumerate(self.memories):
+            if index in self.batched:
+                shape = (batch,) + memory.data.shape
+                state += [np.broadcast_to(memory.data, shape).astype(memory.dtype)]
+            else:
+                state += [memory.data]
+
+        self.point_view(state, root)[...] = data
+
+        runners = {
+            OpTable.CONV : self.run_conv,
+            OpTable.ADD : self.run_add,
+            OpTable.RELU : self.run_relu,
+            OpTable.GEMM : self.run_gemm,
+            }
+        for kernel in self.kernels:
+            rows = np.arange(kernel.begin, kernel.end)
+            runners[kernel.kind](state, kernel, rows)
+
+        result = self.point_view(state, self.exitpoint)
+        if single:
+            return result[0]
+        return result
@@ -1,7 +1,12 @@
 from .solve_conv import solve_conv
 from .solve_add import solve_add
+from .solve_gemm import solve_gemm
+from .solve_graph import solve_graph, solve_table
 
 __all__ = [
     "solve_conv",
-    "solve_add"
+    "solve_add",
+    "solve_gemm",
+    "solve_graph",
+    "solve_table"
     ]
@@ -1,77 +1,97 @@
 from maeri.common.logger import LogIndent, logger
+from maeri.compiler.nodes import OpTable
 
-def solve_for_buff_lengths(nodes, buff_length):
-    solution = []
+import numpy as np
 
-    for node in nodes:
-        solution += node.split_to_buff_lengths(buff_length)
+# operand positions of Add rows in an op table
+A, B, C = 0, 1, 2
 
-    return solution
+def split_dim(table, rows, dim, chunk):
+    """
+    Splits every operand of the rows selected by ``rows``
+    into chunks of at most ``chunk`` along ``dim``.
+    """
+    length = table.extent(A)[:, dim]
+    counts = np.where(rows, -(-length//chunk), 1)
+    table, copy = table.repeat(counts)
+    split = np.repeat(rows, counts)
+    length = np.repeat(length, counts)
 
-def solve_for_port_depth(nodes, ports):
-    solution = []
+    offset_begin = copy*chunk
+    offset_end = np.minimum((copy + 1)*chunk, length)
+    for operand in [A, B, C]:
+        begin = table.start[:, operand, dim]
+        table.stop[split, operand, dim] = (begin + offset_end)[split]
+        table.start[split, operand, dim] = (begin + offset_begin)[split]
 
-    for node in nodes:
-        solution += node.split_to_ports(ports)
+    return table
 
-    return solution
+def solve_for_buff_lengths(table, buff_length):
+    add = table.kind == OpTable.ADD
+    length_A = table.extent(A)[:, 3]
+    length_B = table.extent(B)[:, 3]
 
-def debug_buff_lengths(nodes, buff_length):
+    # sanity check, this should really never be violated
+    assert(np.all((length_A == length_B)[add]))
+
+    # we may not need to do any splitting
+    return split_dim(table, add & (length_A > buff_length), 3, buff_length)
+
+def solve_for_port_depth(table, ports):
+    add = table.kind == OpTable.ADD
+    depth_A = table.extent(A)[:, 2]
+    depth_B = table.extent(B)[:, 2]
+
+    # sanity check, this should really never be violated
+    assert(np.all((depth_A == depth_B)[add]))
+
+    # each row of an add needs a port for each operand
+    effective_ports = ports//2
+    return split_dim(table, add & ((depth_A*2) > ports), 2, effective_ports)
+
+def debug_buff_lengths(table, buff_length):
     logger.debug("CHECKING BUFFER LENGTHS")
-    conditions_list = []
-    for node in nodes:
-        input_width = (node.A.slice[3].stop - node.A.slice[3].start)
-        conditions_list += [input_width <= buff_length]
+    add = table.kind == OpTable.ADD
+    satisfied = (table.extent(A)[:, 3] <= buff_length)[add]
     
     with LogIndent():
-        logger.debug(conditions_list)
-
-#def debug_buff_lengths(nodes, buff_length):
-#    logger.debug("CHECKING PORT DEPTHS SATISFIED")
-#    conditions_list = []
-#    for node in nodes:
-#        input_width = (node.A.slice[3].stop - node.A.slice[3].start)
-#        conditions_list += [input_width <= buff_length]
-#    
-#    with LogIndent():
-#        logger.debug(conditions_list)
-
-def verify_buff_length_satisfed(nodes, buff_length):
-    for node in nodes:
-        input_width_A = (node.A.slice[3].stop - node.A.slice[3].start)
-        input_width_B = (node.B.slice[3].stop - node.B.slice[3].start)
-        assert(input_width_A == input_width_B)
-        if not (input_width_A <= buff_length):
-            print(input_width_A)
-            print(nodes)
-        assert(input_width_A <= buff_length)
-        assert(input_width_B <= buff_length)
-
-def verify_port_depth_satisfied(nodes, ports):
-    for node in nodes:
-        input_depth_A = (node.A.slice[2].stop - node.A.slice[2].start)
-        input_depth_B = (node.B.slice[2].stop - node.B.slice[2].start)
-        assert(input_depth_A == input_depth_B)
-        assert(input_depth_A*2 <= ports)
-        assert(input_depth_B*2 <= ports)
-
-def solve_add(node, buff_length, ports):
-    logger.debug("ADD NODE")
-    node_list = [node]
+        logger.debug(f"{np.count_nonzero(satisfied)} of {len(satisfied)} satisfied")
+
+def verify_buff_length_satisfed(table, buff_length):
+    add = table.kind == OpTable.ADD
+    input_width_A = table.extent(A)[add, 3]
+    input_width_B = table.extent(B)[add, 3]
+    assert(np.all(input_width_A == input_width_B))
+    assert(np.all(input_width_A <= buff_length))
+    assert(np.all(input_width_B <= buff_length))
+
+def verify_port_depth_satisfied(table, ports):
+    add = table.kind == OpTable.ADD
+    input_depth_A = table.extent(A)[add, 2]
+    input_depth_B = table.extent(B)[add, 2]
+    assert(np.all(input_depth_A == input_depth_B))
+    assert(np.all(input_depth_A*2 <= ports))
+    assert(np.all(input_depth_B*2 <= ports))
+
+def solve_add(table, buff_length, ports):
+    """
+    Solves every Add row of ``table`` for the hardware
+    constraints, leaving all other rows untouched.
+    """
+    logger.debug("ADD NODES")
     with LogIndent():
 
         logger.debug("BEFORE SOLVING ADD")
-        debug_buff_lengths(node_list, buff_length)
+        debug_buff_lengths(table, buff_length)
 
         logger.debug("SOLVING FOR BUFFER LENGTH CONSTRAINT")
-        solved_ops = solve_for_buff_lengths(node_list, buff_length)
-        verify_buff_length_satisfed(solved_ops, buff_length)
+        table = solve_for_buff_lengths(table, buff_length)
+        verify_buff_length_satisfed(table, buff_length)
 
         logger.debug("SOLVING FOR BUFFER NUM PORTS CONSTRAINT")
-        solved_ops = solve_for_port_depth(solved_ops, ports)
-        verify_port_depth_satisfied(solved_ops, ports)
-
-        debug_buff_lengths(solved_ops, buff_length)
+        table = solve_for_port_depth(table, ports)
+        verify_port_depth_satisfied(table, ports)
 
+        debug_buff_lengths(table, buff_length)
 
-        return solved_ops
\ No newline at end of file
+        return table
@@ -1,64 +1,528 @@
 from maeri.common.logger import LogIndent, logger
+from maeri.compiler.nodes import Memory, OpTable
+from maeri.compiler.nodes.Memory import accumulator_dtype
+from maeri.compiler.cost_model import DeviceConfig, phase_cycles
+from maeri.compiler.assembler.mapper import neuron_fits, verify_tree
 
-def solve_for_buff_lengths(nodes, buff_length):
-    solution = []
-    for index in range(len(nodes)):
-        node = nodes[index]
-        input_width = (node.X.slice[3].stop - node.X.slice[3].start) + node.pad_left + node.pad_right
-        if input_width > buff_length:
-            solution += solve_for_buff_lengths(node.split_left_right(), buff_length)
-        else:
-            solution += [node]
-    
-    return solution
+import numpy as np
+
+# operand positions of Conv2 rows in an op table
+X, W, RES, BIAS, RESIDUAL = 0, 1, 2, 3, 4
+
+# padding columns
+LEFT, UPPER, RIGHT, BOTTOM = 0, 1, 2, 3
+
+def bias_lanes(table):
+    """
+    Mults, and ports, a Conv2 row needs beyond its filter,
+    one to inject its bias and one to inject its residual
+    when it has them.
+    """
+    return (table.mem[:, BIAS] >= 0).astype(np.int64) +\
+        (table.mem[:, RESIDUAL] >= 0).astype(np.int64)
+
+def input_widths(table):
+    pad = table.pad.astype(np.int64)
+    return table.extent(X)[:, 3] + pad[:, LEFT] + pad[:, RIGHT]
+
+def output_widths(table):
+    """
+    Outputs along the width of every Conv2 row, one per
+    window the stride keeps.
+    """
+    filter_width = table.extent(W)[:, 3].astype(np.int64)
+    stride = table.stride.astype(np.int64)
+    return (input_widths(table) - filter_width)//stride + 1
+
+def tile_count(device, streams, padded_width, filter_width, buff_length, stride=1):
+    """
+    Picks how many tiles to split the output row of a
+    convolution into. Every tile must fit its input window
+    in ``buff_length``, and each extra tile reloads a halo
+    of ``filter_width - stride`` columns on every stream
+    and pays for its own instructions, so the count with
+    the fewest predicted cycles wins.
+    """
+    out = (padded_width - filter_width)//stride + 1
+    longest = (buff_length - filter_width)//stride + 1
+    if longest < 1:
+        raise RuntimeError(f"filter_width : {filter_width} is wider than " +\
+            f"buff_length : {buff_length}")
+
+    fewest = -(-out//longest)
+    best = None
+    for tiles in range(fewest, min(out, 2*fewest) + 1):
+        copy = np.arange(tiles)
+        widths = ((copy + 1)*out)//tiles - (copy*out)//tiles
+        phases = phase_cycles(device, streams, (widths - 1)*stride + filter_width, 1,
+            widths, copy == 0, stride=stride)
+        cycles = sum(int(np.sum(phase)) for phase in phases[:-1])
+        if (best is None) or (cycles < best[0]):
+            best = (cycles, tiles)
+
+    return best[1]
+
+def split_tiles(table, tiles, rows):
+    """
+    Splits each Conv2 row ``i`` selected by ``rows`` into
+    ``tiles[i]`` tiles along its output width, balanced to
+    within one column of each other. Each tile, even a
+    single one, reads only the input columns and padding
+    its windows cover, so the trailing columns a strided
+    filter never reaches are dropped.
+    """
+    table, copy = table.repeat(tiles)
+    split = np.repeat(rows, tiles)
+    tiles = np.repeat(tiles, tiles)
+
+    filter_width = table.extent(W)[:, 3].astype(np.int64)
+    stride = table.stride.astype(np.int64)
+    x_begin = table.start[:, X, 3].astype(np.int64)
+    input_width = table.extent(X)[:, 3].astype(np.int64)
+    pad_left = table.pad[:, LEFT].astype(np.int64)
+    out = output_widths(table)
+    assert(np.all((table.extent(RES)[:, 3] == out)[split]))
+
+    # tile ``copy`` produces outputs [first, last), whose
+    # windows cover padded columns
+    # [first*stride, (last - 1)*stride + filter_width)
+    first = (copy*out)//tiles
+    last = ((copy + 1)*out)//tiles
+    window_begin = first*stride
+    window_end = (last - 1)*stride + filter_width
+
+    begin = np.maximum(window_begin, pad_left) - pad_left
+    end = np.minimum(window_end, pad_left + input_width) - pad_left
+    if np.any((end <= begin)[split]):
+        raise RuntimeError("Tiling leaves a tile reading only padding.")
+
+    table.start[split, X, 3] = (x_begin + begin)[split]
+    table.stop[split, X, 3] = (x_begin + end)[split]
+    table.pad[split, LEFT] = np.maximum(pad_left - window_begin, 0)[split]
+    table.pad[split, RIGHT] = np.maximum(window_end - pad_left - input_width, 0)[split]
+
+    # a residual is read in step with the result
+    for operand in [RES, RESIDUAL]:
+        present = split & (table.mem[:, operand] >= 0)
+        res_begin = table.start[:, operand, 3].astype(np.int64)
+        table.start[present, operand, 3] = (res_begin + first)[present]
+        table.stop[present, operand, 3] = (res_begin + last)[present]
+
+    return table
+
+def split_to_ports(table, rows):
+    """
+    Splits each Conv2 row selected by ``rows`` into one row
+    per output row, each reading only the input rows and
+    padding its window covers. Rows between the windows of
+    a strided filter are never read.
+    """
+    pad_upper = table.pad[:, UPPER].astype(np.int64)
+    pad_bottom = table.pad[:, BOTTOM].astype(np.int64)
+    filter_depth = table.extent(W)[:, 2]
+    input_depth = table.extent(X)[:, 2]
+    stride = table.stride.astype(np.int64)
+    output_depth = (pad_upper + input_depth + pad_bottom - filter_depth)//stride + 1
+    assert(np.all((output_depth >= 1)[rows]))
+
+    counts = np.where(rows, output_depth, 1)
+    table, copy = table.repeat(counts)
+    split = np.repeat(rows, counts)
+
+    pad_upper = np.repeat(pad_upper, counts)
+    pad_bottom = np.repeat(pad_bottom, counts)
+    filter_depth = np.repeat(filter_depth, counts)
+    input_depth = np.repeat(input_depth, counts)
+
+    # the window of output row ``copy`` covers padded rows
+    # [copy*stride, copy*stride + filter_depth), of which
+    # the input field occupies [pad_upper, pad_upper + input_depth)
+    window = copy*table.stride.astype(np.int64)
+    begin = np.maximum(window, pad_upper) - pad_upper
+    end = np.minimum(window + filter_depth, pad_upper + input_depth) - pad_upper
+    x_begin = table.start[:, X, 2] + begin
+    x_end = table.start[:, X, 2] + end
+    table.start[split, X, 2] = x_begin[split]
+    table.stop[split, X, 2] = x_end[split]
+
+    table.pad[split, UPPER] = np.maximum(pad_upper - window, 0)[split]
+    table.pad[split, BOTTOM] = np.maximum(window + filter_depth - pad_upper - input_depth, 0)[split]
+
+    for operand in [RES, RESIDUAL]:
+        present = split & (table.mem[:, operand] >= 0)
+        res_row = table.start[:, operand, 2] + copy
+        table.start[present, operand, 2] = res_row[present]
+        table.stop[present, operand, 2] = res_row[present] + 1
+        table.squeeze[present, operand, 2] = True
+
+    return table
+
+def filter_passes(channels, depth, width, lanes, mults, ports):
+    """
+    Picks how to split a ``channels`` x ``depth`` x ``width``
+    filter, with ``lanes`` bias and residual lanes, across
+    passes of the tree when it does not fit as one neuron.
+    Every pass reloads the weights and needs an extra Add
+    to accumulate its partial sums, so the split with the
+    fewest passes wins, preferring whole filter rows on a
+    tie.
+
+    Returns the number of channel groups and of row groups.
+    """
+    # wider rows were split by split_filter_columns
+    assert(neuron_fits(1, width, lanes, mults, ports))
+
+    best = None
+    for rows in range(depth, 0, -1):
+        group = min(channels, ports//rows)
+        while (group > 0) and not neuron_fits(group*rows, width, lanes, mults, ports):
+            group -= 1
+        if group == 0:
+            continue
+        passes = -(-channels//group)*-(-depth//rows)
+        if (best is None) or (passes < best[0]):
+            best = (passes, -(-channels//group), -(-depth//rows))
+
+    return best[1], best[2]
+
+def scratch_memory(table, memory):
+    """
+    Appends a memory for partial sums of Conv2 rows writing
+    to ``memory``. Like the buffer of ``build_conv``, it holds
+    a single output channel, in a dtype wide enough for
+    partial sums.
+    """
+    shape = list(table.memories[memory].data.shape)
+    shape[1] = 1
+    dtype = accumulator_dtype(table.memories[memory].dtype)
+    table.memories += [Memory(np.zeros(shape, dtype=dtype))]
+    return len(table.memories) - 1
+
+def split_filters(table, mults, ports):
+    """
+    Splits Conv2 rows whose filter does not fit the tree as
+    one neuron, laid out as the mapper lays it over
+    ``mults`` mults and ``ports`` ports, into several passes
+    over groups of channels and filter rows. The first pass writes the result, every
+    later pass writes a scratch memory which an Add then
+    accumulates into the result. Results narrower than
+    their partial sums, such as int8, are accumulated in a
+    second scratch memory instead, which the last Add sums
+    into the result. A bias or residual is injected on its
+    own lane by the first pass, and every pass of the
+    filter leaves room for it.
+    """
+    conv = table.kind == OpTable.CONV
+    filter_extent = table.extent(W)
+    lanes = bias_lanes(table)
+
+    # same shaped filters split the same way
+    channel_groups = np.ones([len(table)], dtype=np.int64)
+    row_groups = np.ones([len(table)], dtype=np.int64)
+    shapes = np.concatenate([filter_extent[:, 1:], lanes[:, None]], axis=1)
+    shapes, inverse = np.unique(shapes[conv], axis=0, return_inverse=True)
+    for index, (channels, depth, width, lane) in enumerate(shapes.tolist()):
+        if neuron_fits(channels*depth, width, lane, mults, ports):
+            continue
+        groups = filter_passes(channels, depth, width, lane, mults, ports)
+        logger.debug(f"{channels}x{depth}x{width} filter split into " +\
+            f"{groups[0]} channel groups of {groups[1]} row groups")
+        rows = np.nonzero(conv)[0][inverse.reshape(-1) == index]
+        channel_groups[rows], row_groups[rows] = groups
+
+    return split_passes(table, channel_groups, row_groups, np.ones([len(table)], dtype=np.int64))
+
+def column_groups(width, lanes, buff_length, mults, ports):
+    """
+    Fewest groups to split the columns of a filter ``width``
+    weights wide into so that a row of each group fits both
+    a port's buffer and the tree, with ``lanes`` bias and
+    residual lanes.
+    """
+    for groups in range(1, width + 1):
+        chunk = -(-width//groups)
+        if (chunk <= buff_length) and neuron_fits(1, chunk, lanes, mults, ports):
+            return groups
+    raise RuntimeError(f"Filter row of {width} weights too large for " +\
+        f"{mults} mults on {ports} ports.")
+
+def split_filter_columns(table, buff_length, mults, ports):
+    """
+    Splits Conv2 rows whose filter rows are wider than a
+    port's buffer or than the tree holds, such as that of
+    a global average pool over a wide map, into passes over
+    groups of filter columns, accumulated as the passes of
+    ``split_filters`` are.
+    """
+    conv = table.kind == OpTable.CONV
+    width = table.extent(W)[:, 3].astype(np.int64)
+    lanes = bias_lanes(table)
+
+    groups = np.ones([len(table)], dtype=np.int64)
+    shapes, inverse = np.unique(np.stack([width, lanes], axis=1)[conv], axis=0,
+        return_inverse=True)
+    for index, (filter_width, lane) in enumerate(shapes.tolist()):
+        count = column_groups(filter_width, lane, buff_length, mults, ports)
+        if count > 1:
+            logger.debug(f"Filter rows of {filter_width} weights split into {count} column groups")
+        groups[np.nonzero(conv)[0][inverse.reshape(-1) == index]] = count
 
-def solve_for_port_depth(nodes, ports):
-    solution = []
+    ones = np.ones([len(table)], dtype=np.int64)
+    return split_passes(table, ones, ones, groups)
 
-    for node in nodes:
-        solution += node.split_to_ports(ports)
+def split_passes(table, channel_groups, row_groups, column_groups):
+    """
+    Splits every Conv2 row ``i`` into passes over
+    ``channel_groups[i]`` groups of channels, each of
+    ``row_groups[i]`` groups of filter rows, each of
+    ``column_groups[i]`` groups of filter columns, as
+    described in ``split_filters``.
+    """
+    too_long = (channel_groups*row_groups*column_groups) > 1
+    if not np.any(too_long):
+        return table
 
-    return solution
+    # scratch is added in order of first use, so solving
+    # in chunks adds it in the same order
+    scratch = np.full([len(table)], -1, dtype=np.int64)
+    accumulator = np.full([len(table)], -1, dtype=np.int64)
+    targets, first_use = np.unique(table.mem[too_long, RES], return_index=True)
+    for memory in targets[np.argsort(first_use)].tolist():
+        rows = too_long & (table.mem[:, RES] == memory)
+        scratch[rows] = scratch_memory(table, memory)
+        dtype = table.memories[memory].dtype
+        if accumulator_dtype(dtype).itemsize > dtype.itemsize:
+            accumulator[rows] = scratch_memory(table, memory)
 
-def debug_buff_lengths(nodes, buff_length):
+    # each pass after the first is followed by its Add
+    passes = channel_groups*row_groups*column_groups
+    counts = 2*passes - 1
+    table, copy = table.repeat(counts)
+    split = np.repeat(too_long, counts)
+    channel_groups = np.repeat(channel_groups, counts)
+    row_groups = np.repeat(row_groups, counts)
+    column_groups = np.repeat(column_groups, counts)
+    scratch = np.repeat(scratch, counts)
+    accumulator = np.repeat(accumulator, counts)
+    last = copy == np.repeat(counts, counts) - 1
+
+    pass_index = (copy + 1)//2
+    is_add = split & (copy > 0) & (copy % 2 == 0)
+    is_pass = split & ~is_add
+
+    channel_group = pass_index//(row_groups*column_groups)
+    row_group = (pass_index//column_groups) % row_groups
+    column_group = pass_index % column_groups
+
+    res_start = table.start[:, RES].copy()
+    res_stop = table.stop[:, RES].copy()
+    res_squeeze = table.squeeze[:, RES].copy()
+    res_mem = table.mem[:, RES].copy()
+
+    # channels of this pass, shared by input and filter
+    channels = table.extent(W)[:, 1].astype(np.int64)
+    chunk = -(-channels//channel_groups)
+    begin = np.minimum(channel_group*chunk, channels)
+    end = np.minimum(begin + chunk, channels)
+    for operand in [X, W]:
+        start = table.start[:, operand, 1].astype(np.int64)
+        table.stop[is_pass, operand, 1] = (start + end)[is_pass]
+        table.start[is_pass, operand, 1] = (start + begin)[is_pass]
+
+    # filter rows of this pass, which read the window of
+    # padded input rows [first, first + length)
+    pad_upper = table.pad[:, UPPER].astype(np.int64)
+    pad_bottom = table.pad[:, BOTTOM].astype(np.int64)
+    depth = table.extent(W)[:, 2].astype(np.int64)
+    input_depth = table.extent(X)[:, 2].astype(np.int64)
+    stride = table.stride.astype(np.int64)
+    output_depth = (pad_upper + input_depth + pad_bottom - depth)//stride + 1
+
+    chunk = -(-depth//row_groups)
+    first = np.minimum(row_group*chunk, depth)
+    rows = np.minimum(first + chunk, depth) - first
+    length = (output_depth - 1)*stride + rows
+
+    x_begin = np.maximum(first, pad_upper) - pad_upper
+    x_end = np.minimum(first + length, pad_upper + input_depth) - pad_upper
+    if np.any((x_end <= x_begin)[is_pass]):
+        raise RuntimeError("Filter split leaves a pass reading only padding.")
+
+    x_start = table.start[:, X, 2].astype(np.int64)
+    table.start[is_pass, X, 2] = (x_start + x_begin)[is_pass]
+    table.stop[is_pass, X, 2] = (x_start + x_end)[is_pass]
+    w_start = table.start[:, W, 2].astype(np.int64)
+    table.start[is_pass, W, 2] = (w_start + first)[is_pass]
+    table.stop[is_pass, W, 2] = (w_start + first + rows)[is_pass]
+    table.pad[is_pass, UPPER] = np.maximum(pad_upper - first, 0)[is_pass]
+    table.pad[is_pass, BOTTOM] = np.maximum(first + length - pad_upper - input_depth, 0)[is_pass]
+
+    # filter columns of this pass, which read the window of
+    # padded input columns [first, first + length)
+    pad_left = table.pad[:, LEFT].astype(np.int64)
+    width = table.extent(W)[:, 3].astype(np.int64)
+    input_width = table.extent(X)[:, 3].astype(np.int64)
+    output_width = output_widths(table)
+
+    chunk = -(-width//column_groups)
+    first = np.minimum(column_group*chunk, width)
+    columns = np.minimum(first + chunk, width) - first
+    length = (output_width - 1)*stride + columns
+
+    x_begin = np.maximum(first, pad_left) - pad_left
+    x_end = np.minimum(first + length, pad_left + input_width) - pad_left
+    if np.any((x_end <= x_begin)[is_pass]):
+        raise RuntimeError("Filter split leaves a pass reading only padding.")
+
+    x_start = table.start[:, X, 3].astype(np.int64)
+    table.start[is_pass, X, 3] = (x_start + x_begin)[is_pass]
+    table.stop[is_pass, X, 3] = (x_start + x_end)[is_pass]
+    w_start = table.start[:, W, 3].astype(np.int64)
+    table.start[is_pass, W, 3] = (w_start + first)[is_pass]
+    table.stop[is_pass, W, 3] = (w_start + first + columns)[is_pass]
+    table.pad[is_pass, LEFT] = np.maximum(pad_left - first, 0)[is_pass]
+    table.pad[is_pass, RIGHT] = np.maximum(first + length - pad_left - input_width, 0)[is_pass]
+
+    # later passes write a single channel of scratch
+    partial = is_pass & (pass_index > 0)
+    table.mem[partial, RES] = scratch[partial]
+    table.start[partial, RES, 1] = 0
+    table.stop[partial, RES, 1] = 1
+
+    # narrow results are accumulated in a channel of the
+    # accumulator, from the first pass up to the last Add
+    accumulated = split & (accumulator >= 0)
+    acc_mem = np.where(accumulated, accumulator, res_mem)
+    first_pass = accumulated & is_pass & (pass_index == 0)
+    table.mem[first_pass, RES] = accumulator[first_pass]
+    table.start[first_pass, RES, 1] = 0
+    table.stop[first_pass, RES, 1] = 1
+
+    # a fused Relu only clamps, and a scale only scales,
+    # the fully accumulated result written by the last Add
+    partial_write = split & ~last
+    table.relu[partial_write] = False
+    table.scale[partial_write] = 1
+
+    # the bias and residual are summed once, by the first
+    # pass
+    table.mem[split & (copy > 0), BIAS] = -1
+    table.mem[split & (copy > 0), RESIDUAL] = -1
+
+    # res += scratch, or acc += scratch and the last Add
+    # res = acc + scratch
+    table.kind[is_add] = OpTable.ADD
+    table.pad[is_add] = 0
+    out_mem = np.where(last, res_mem, acc_mem)
+    table.mem[is_add, :RES + 1] = np.stack([acc_mem, scratch, out_mem], axis=1)[is_add]
+    for operand in [X, W, RES]:
+        table.start[is_add, operand] = res_start[is_add]
+        table.stop[is_add, operand] = res_stop[is_add]
+        table.squeeze[is_add, operand] = res_squeeze[is_add]
+    table.start[is_add, W, 1] = 0
+    table.stop[is_add, W, 1] = 1
+    table.start[is_add & accumulated, X, 1] = 0
+    table.stop[is_add & accumulated, X, 1] = 1
+    narrow_partial = is_add & accumulated & ~last
+    table.start[narrow_partial, RES, 1] = 0
+    table.stop[narrow_partial, RES, 1] = 1
+
+    logger.debug(f"Split {np.count_nonzero(too_long)} filters into " +\
+        f"{np.count_nonzero(is_pass)} passes")
+
+    return table
+
+def solve_for_buff_lengths(table, buff_length, device):
+    conv = table.kind == OpTable.CONV
+    rows = conv & (input_widths(table) > buff_length)
+
+    # rows of the same shape are tiled the same way
+    tiles = np.ones([len(table)], dtype=np.int64)
+    filter_extent = table.extent(W).astype(np.int64)
+    shapes = np.stack([input_widths(table), filter_extent[:, 3],
+        filter_extent[:, 1]*filter_extent[:, 2], table.stride], axis=1)
+    shapes, inverse = np.unique(shapes[rows], axis=0, return_inverse=True)
+    for index, (padded_width, filter_width, streams, stride) in enumerate(shapes.tolist()):
+        count = tile_count(device, streams, padded_width, filter_width, buff_length, stride)
+        logger.debug(f"Row of {padded_width} columns split into {count} tiles")
+        tiles[np.nonzero(rows)[0][inverse.reshape(-1) == index]] = count
+
+    return split_tiles(table, tiles, conv)
+
+def verify_square_padding(table):
+    # only square filters, and by extension square
+    # padding, are supported. Filter splitting later
+    # crops the padding of each pass
+    conv = table.kind == OpTable.CONV
+    assert(np.all((table.pad[:, UPPER] == table.pad[:, BOTTOM])[conv]))
+
+def solve_for_port_depth(table, ports):
+    conv = table.kind == OpTable.CONV
+
+    # every channel summed in the tree streams its own
+    # rows of the window, padding rows coming from the
+    # shared zero page, a bias its own row of ones and a
+    # residual its own row of the residual
+    filter_depth = table.extent(W)[:, 2]
+    channels = table.extent(W)[:, 1]
+    assert(np.all((channels*filter_depth + bias_lanes(table) <= ports)[conv]))
+
+    return split_to_ports(table, conv)
+
+def debug_buff_lengths(table, buff_length):
     logger.debug("CHECKING BUFFER LENGTHS")
-    conditions_list = []
-    for node in nodes:
-        input_width = (node.X.slice[3].stop - node.X.slice[3].start)
-        conditions_list += [input_width <= buff_length]
+    conv = table.kind == OpTable.CONV
+    satisfied = (table.extent(X)[:, 3] <= buff_length)[conv]
     
     with LogIndent():
-        logger.debug(conditions_list)
-
-def verify_buff_Lengths(nodes, buff_length):
-    for node in nodes:
-        input_width = (node.X.slice[3].stop - node.X.slice[3].start) + node.pad_left + node.pad_right
-        assert(input_width <= buff_length)
-
-def verify_weight_lengths(nodes, mults):
-    for node in nodes:
-        weight_length = len(node.W.get_data().flatten())
-        if not (weight_length <= mults):
-            raise RuntimeError(f"Weight length {weight_length} too large. Compiler does not support" +\
-                " splitting weights.")
-
-def solve_conv(node, buff_length, ports, mults):
-    logger.debug("CONV NODE")
+        logger.debug(f"{np.count_nonzero(satisfied)} of {len(satisfied)} satisfied")
+
+def verify_buff_Lengths(table, buff_length):
+    conv = table.kind == OpTable.CONV
+    assert(np.all((input_widths(table) <= buff_length)[conv]))
+
+def verify_weight_lengths(table, mults):
+    conv = table.kind == OpTable.CONV
+    weight_lengths = np.prod(table.extent(W), axis=1) + bias_lanes(table)
+    too_long = conv & (weight_lengths > mults)
+    if np.any(too_long):
+        weight_length = weight_lengths[np.argmax(too_long)]
+        raise RuntimeError(f"Weight length {weight_length} too large for {mults} mults.")
+
+def solve_conv(table, buff_length, ports, mults, b_in_line=4):
+    """
+    Solves every Conv2 row of ``table`` for the hardware
+    constraints, leaving all other rows untouched. Tilings
+    are weighed on a device with ``b_in_line`` bytes in
+    each memory line.
+    """
+    verify_tree(mults, ports)
+    device = DeviceConfig(b_in_line, ports, mults)
+
+    logger.debug("CONV NODES")
     with LogIndent():
 
         logger.debug("BEFORE SOLVING CONV")
-        debug_buff_lengths([node], buff_length)
+        debug_buff_lengths(table, buff_length)
+
+        logger.debug("SOLVING FOR FILTER WIDTH CONSTRAINT")
+        table = split_filter_columns(table, buff_length, mults, ports)
 
         logger.debug("SOLVING FOR BUFFER LENGTH CONSTRAINT")
-        solved_ops = solve_for_buff_lengths([node], buff_length)
+        table = solve_for_buff_lengths(table, buff_length, device)
+
+        verify_square_padding(table)
+
+        logger.debug("SOLVING FOR MULTIPLIER CONSTRAINT")
+        table = split_filters(table, mults, ports)
 
         logger.debug("SOLVING FOR BUFFER NUM PORTS CONSTRAINT")
-        solved_ops = solve_for_port_depth(solved_ops, ports)
+        table = solve_for_port_depth(table, ports)
 
         logger.debug("AFTER SOLVING CONV")
-        debug_buff_lengths(solved_ops, buff_length)
+        debug_buff_lengths(table, buff_length)
 
-        verify_buff_Lengths(solved_ops, buff_length)
-        verify_weight_lengths(solved_ops, mults)
+        verify_buff_Lengths(table, buff_length)
+        verify_weight_lengths(table, mults)
 
-        return solved_ops
\ No newline at end of file
+        return table
@@ -0,0 +1,217 @@
+from maeri.common.logger import LogIndent, logger
+from maeri.compiler.nodes import Memory, OpTable
+from maeri.compiler.nodes.OpTable import MAX_DIMS
+from maeri.compiler.nodes.Memory import accumulator_dtype
+from maeri.compiler.assembler.mapper import verify_tree
+
+import numpy as np
+
+# operand positions of Gemm rows in an op table
+A, W, RES, BIAS = 0, 1, 2, 3
+
+# dimensions of the weights holding outputs and inputs,
+# the result and the bias hold outputs along their last
+N_DIM, K_DIM = 2, 3
+LAST = MAX_DIMS - 1
+
+def k_dims(table):
+    """
+    Dimension of the input vector of every row holding its
+    elements, the longest dimension of its memory.
+    """
+    dims = np.zeros([len(table.memories)], dtype=np.int64)
+    for index, memory in enumerate(table.memories):
+        shape = memory.data.shape
+        if len(shape):
+            dims[index] = MAX_DIMS - len(shape) + int(np.argmax(shape))
+    return dims[np.maximum(table.mem[:, A], 0)]
+
+def neuron_span(k, lanes, mults, ports):
+    """
+    Mults taken by a neuron summing ``k`` products. Its
+    weights are laid as a single chain ending at the mult a
+    port injects into, so it spans whole groups of
+    ``mults//ports`` mults, with one more group for the
+    lane of a bias.
+    """
+    interval = mults//ports
+    return (-(-k//interval) + lanes)*interval
+
+def gemm_tiles(k, n, lanes, buff_length, ports, mults):
+    """
+    Picks the ``(k_tiles, n_tiles)`` a Gemm of ``n`` dot
+    products of length ``k`` is split into. Every neuron
+    streams its slice of the input through a chain of
+    mults, so a slice must fit both the chain and a port's
+    buffer. The neurons of a pass, one per collector, then
+    share the mults.
+    """
+    interval = mults//ports
+    longest = min(buff_length, mults - lanes*interval)
+    if longest < 1:
+        raise RuntimeError(f"No room for a Gemm neuron in {mults} mults.")
+
+    k_tiles = -(-k//longest)
+    k_chunk = -(-k//k_tiles)
+    per_pass = mults//neuron_span(k_chunk, lanes, mults, ports)
+    return k_tiles, -(-n//per_pass)
+
+def scratch_memory(table, memory):
+    """
+    Appends a memory the partial sums of the Gemm writing
+    ``memory`` are accumulated from, in a dtype wide enough
+    for them.
+    """
+    shape = table.memories[memory].data.shape
+    dtype = accumulator_dtype(table.memories[memory].dtype)
+    table.memories += [Memory(np.zeros(shape, dtype=dtype))]
+    return len(table.memories) - 1
+
+def split_gemms(table, buff_length, ports, mults):
+    """
+    Splits every Gemm row into tree passes. The outputs are
+    split into groups of neurons that fit on the tree
+    together, a collector each, and the inputs into slices
+    that fit a chain of mults. The first slice of every
+    group writes the result and every later slice writes a
+    scratch memory an Add then accumulates into the
+    result. Results narrower than their partial sums are
+    accumulated in a second scratch memory instead, which
+    the last Add sums into the result. The bias is
+    injected by the first slice, and the result is only
+    scaled and clamped by the last write.
+    """
+    gemm = table.kind == OpTable.GEMM
+    if not np.any(gemm):
+        return table
+
+    lanes = (table.mem[:, BIAS] >= 0).astype(np.int64)
+    n = table.extent(W)[:, N_DIM].astype(np.int64)
+    k = table.extent(W)[:, K_DIM].astype(np.int64)
+
+    k_tiles = np.ones([len(table)], dtype=np.int64)
+    n_tiles = np.ones([len(table)], dtype=np.int64)
+    shapes = np.stack([k, n, lanes], axis=1)
+    shapes, inverse = np.unique(shapes[gemm], axis=0, return_inverse=True)
+    for index, shape in enumerate(shapes.tolist()):
+        tiles = gemm_tiles(*shape, buff_length, ports, mults)
+        logger.debug(f"{shape[1]}x{shape[0]} Gemm split into {tiles[1]} " +\
+            f"groups of outputs over {tiles[0]} input slices")
+        rows = np.nonzero(gemm)[0][inverse.reshape(-1) == index]
+        k_tiles[rows], n_tiles[rows] = tiles
+
+    scratch = np.full([len(table)], -1, dtype=np.int64)
+    accumulator = np.full([len(table)], -1, dtype=np.int64)
+    targets, first_use = np.unique(table.mem[gemm & (k_tiles > 1), RES], return_index=True)
+    for memory in targets[np.argsort(first_use)].tolist():
+        rows = gemm & (k_tiles > 1) & (table.mem[:, RES] == memory)
+        scratch[rows] = scratch_memory(table, memory)
+        dtype = table.memories[memory].dtype
+        if accumulator_dtype(dtype).itemsize > dtype.itemsize:
+            accumulator[rows] = scratch_memory(table, memory)
+
+    # each group of outputs takes a pass per slice, every
+    # pass after the first followed by its Add
+    group_length = 2*k_tiles - 1
+    counts = n_tiles*group_length
+    table, copy = table.repeat(counts)
+    split = np.repeat(gemm, counts)
+    k_tiles = np.repeat(k_tiles, counts)
+    n_tiles = np.repeat(n_tiles, counts)
+    group_length = np.repeat(group_length, counts)
+    scratch = np.repeat(scratch, counts)
+    accumulator = np.repeat(accumulator, counts)
+    k_dim = k_dims(table)
+
+    group = copy//group_length
+    within = copy % group_length
+    pass_index = (within + 1)//2
+    is_add = split & (within > 0) & (within % 2 == 0)
+    is_pass = split & ~is_add
+
+    # outputs of this group, shared by weights, result
+    # and bias
+    n = table.extent(W)[:, N_DIM].astype(np.int64)
+    chunk = -(-n//n_tiles)
+    n_begin = np.minimum(group*chunk, n)
+    n_end = np.minimum(n_begin + chunk, n)
+    for operand, dim in [(W, N_DIM), (RES, LAST), (BIAS, LAST)]:
+        start = table.start[:, operand, dim].astype(np.int64)
+        table.stop[split, operand, dim] = (start + n_end)[split]
+        table.start[split, operand, dim] = (start + n_begin)[split]
+
+    # inputs of this pass, shared by the input vector
+    # and the weights
+    k = table.extent(W)[:, K_DIM].astype(np.int64)
+    chunk = -(-k//k_tiles)
+    k_begin = np.minimum(pass_index*chunk, k)
+    k_end = np.minimum(k_begin + chunk, k)
+    rows = np.nonzero(is_pass)[0]
+    start = table.start[rows, A, k_dim[rows]].astype(np.int64)
+    table.stop[rows, A, k_dim[rows]] = start + k_end[rows]
+    table.start[rows, A, k_dim[rows]] = start + k_begin[rows]
+    start = table.start[:, W, K_DIM].astype(np.int64)
+    table.stop[is_pass, W, K_DIM] = (start + k_end)[is_pass]
+    table.start[is_pass, W, K_DIM] = (start + k_begin)[is_pass]
+
+    res_start = table.start[:, RES].copy()
+    res_stop = table.stop[:, RES].copy()
+    res_squeeze = table.squeeze[:, RES].copy()
+    res_mem = table.mem[:, RES].copy()
+
+    # later passes write scratch
+    partial = is_pass & (pass_index > 0)
+    table.mem[partial, RES] = scratch[partial]
+
+    # narrow results are accumulated from the first pass
+    # up to the last Add
+    last = within == group_length - 1
+    accumulated = split & (accumulator >= 0)
+    acc_mem = np.where(accumulated, accumulator, res_mem)
+    first_pass = accumulated & is_pass & (pass_index == 0)
+    table.mem[first_pass, RES] = accumulator[first_pass]
+
+    # only the last write of every output is scaled and
+    # clamped, and the bias is summed by the first pass
+    partial_write = split & ~last
+    table.relu[partial_write] = False
+    table.scale[partial_write] = 1
+    table.mem[split & (pass_index > 0), BIAS] = -1
+
+    # res += scratch, or acc += scratch and the last Add
+    # res = acc + scratch
+    table.kind[is_add] = OpTable.ADD
+    out_mem = np.where(last, res_mem, acc_mem)
+    table.mem[is_add, :RES + 1] = np.stack([acc_mem, scratch, out_mem], axis=1)[is_add]
+    for operand in [A, W, RES]:
+        table.start[is_add, operand] = res_start[is_add]
+        table.stop[is_add, operand] = res_stop[is_add]
+        table.squeeze[is_add, operand] = res_squeeze[is_add]
+
+    logger.debug(f"Split {np.count_nonzero(gemm)} Gemms into " +\
+        f"{np.count_nonzero(is_pass)} passes")
+
+    return table
+
+def verify_gemm_fits(table, buff_length, ports, mults):
+    gemm = table.kind == OpTable.GEMM
+    lanes = (table.mem[:, BIAS] >= 0).astype(np.int64)
+    n = table.extent(W)[:, N_DIM].astype(np.int64)
+    k = table.extent(W)[:, K_DIM].astype(np.int64)
+    assert(np.all((k <= buff_length)[gemm]))
+    assert(np.all((n*neuron_span(k, lanes, mults, ports) <= mults)[gemm]))
+
+def solve_gemm(table, buff_length, ports, mults):
+    """
+    Solves every Gemm row of ``table`` for the hardware
+    constraints, leaving all other rows untouched.
+    """
+    verify_tree(mults, ports)
+
+    logger.debug("GEMM NODES")
+    with LogIndent():
+        logger.debug("SOLVING FOR MULTIPLIER AND COLLECTOR CONSTRAINTS")
+        table = split_gemms(table, buff_length, ports, mults)
+        verify_gemm_fits(table, buff_length, ports, mults)
+
+        return table
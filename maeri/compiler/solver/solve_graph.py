@@ -0,0 +1,156 @@
+from maeri.common.logger import LogIndent, logger
+from maeri.compiler.nodes import Memory, OpTable
+from .solve_conv import solve_conv
+from .solve_add import solve_add
+from .solve_gemm import solve_gemm
+from maeri.compiler.assembler.mapper import verify_tree
+
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pickle
+import io
+
+def solve_table(table, buff_length, ports, mults, b_in_line=4):
+    verify_tree(mults, ports)
+    table = solve_conv(table, buff_length, ports, mults, b_in_line)
+    table = solve_gemm(table, buff_length, ports, mults)
+    table = solve_add(table, buff_length, ports)
+    return table
+
+class MemoryPickler(pickle.Pickler):
+    """
+    Pickles memories as their index into ``memories`` so
+    that their data never crosses the process boundary.
+    """
+    def __init__(self, file, memories):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.index_by_id = {id(memory) : index for index, memory in enumerate(memories)}
+
+    def persistent_id(self, obj):
+        if type(obj) is Memory:
+            return self.index_by_id.get(id(obj))
+        return None
+
+class MemoryUnpickler(pickle.Unpickler):
+    def __init__(self, file, memories):
+        super().__init__(file)
+        self.memories = memories
+
+    def persistent_load(self, index):
+        return self.memories[index]
+
+def dumps(obj, memories):
+    file = io.BytesIO()
+    MemoryPickler(file, memories).dump(obj)
+    return file.getvalue()
+
+def loads(data, memories):
+    return MemoryUnpickler(io.BytesIO(data), memories).load()
+
+# state of each worker process, set by init_worker
+worker_memories = None
+worker_params = None
+
+def init_worker(layouts, params):
+    """
+    Workers only see the shape of each memory, backed by
+    a single broadcast zero, which is all the solver needs.
+    """
+    global worker_memories, worker_params
+    worker_memories = [Memory(np.broadcast_to(np.zeros((), dtype), shape))
+        for shape, dtype in layouts]
+    worker_params = params
+
+def scratch_target(table, index, num_memories):
+    """
+    Memory the Adds reading scratch memory ``index`` of
+    ``table`` finally write, following scratch memories
+    that only feed another scratch memory, such as the
+    partial sums summed into the accumulator of a narrow
+    result.
+    """
+    add = table.kind == OpTable.ADD
+    seen = set()
+    while index >= num_memories:
+        assert(index not in seen), f"Scratch memory {index} only feeds itself."
+        seen.add(index)
+        reads = add & np.any(table.mem[:, :2] == index, axis=1)
+        writes = table.mem[reads, 2]
+        writes = writes[writes != index]
+        assert(len(writes) > 0), f"Scratch memory {index} is never summed into a result."
+        outside = writes[writes < num_memories]
+        index = outside[0] if len(outside) else writes[0]
+    return index
+
+def solve_chunk(data):
+    """
+    Solves one chunk of rows. Scratch memories the solver
+    adds for partial sums are sent back as layouts, along
+    with the memory the Adds reading each one finally
+    write, and are recreated by the parent.
+    """
+    table = loads(data, worker_memories)
+    table.memories = list(worker_memories)
+    solved = solve_table(table, *worker_params)
+
+    added = []
+    for index in range(len(worker_memories), len(solved.memories)):
+        memory = solved.memories[index]
+        target = scratch_target(solved, index, len(worker_memories))
+        added += [(memory.data.shape, memory.data.dtype, int(target))]
+    solved.memories = worker_memories
+    return dumps((solved, added), worker_memories)
+
+def solve_graph(op_graph, buff_length, ports, mults, memories=None, processes=None,
+        b_in_line=4):
+    """
+    Solves every op in ``op_graph`` and returns the result
+    as an ``OpTable`` indexing into ``memories``. When
+    ``processes`` is given, rows are solved on a pool of that
+    many processes and reassembled in their original order,
+    giving the same result as the serial path.
+    """
+    verify_tree(mults, ports)
+    params = (buff_length, ports, mults, b_in_line)
+
+    if isinstance(op_graph, OpTable):
+        table = op_graph
+    else:
+        table = OpTable.from_ops(op_graph, memories)
+
+    if not processes:
+        return solve_table(table, *params)
+
+    memories = table.memories
+    layouts = [(memory.data.shape, memory.data.dtype) for memory in memories]
+
+    # a few chunks per process keeps the pool balanced
+    chunk_length = max(1, -(-len(table)//(processes*4)))
+    chunks = [dumps(table.select(slice(index, index + chunk_length)), memories)
+        for index in range(0, len(table), chunk_length)]
+
+    logger.debug(f"Solving {len(chunks)} chunks on {processes} processes")
+    solved = []
+    scratch = {}
+    with ProcessPoolExecutor(processes, initializer=init_worker,
+            initargs=(layouts, params)) as pool:
+        for data in pool.map(solve_chunk, chunks):
+            chunk, added = loads(data, memories)
+
+            # chunks writing the same memory share its scratch
+            # memories, as they do when solving serially, which
+            # are always added in the same order
+            remap = np.arange(len(layouts) + len(added))
+            for index, (shape, dtype, target) in enumerate(added):
+                key = (target, [added_[2] for added_ in added[:index]].count(target))
+                if key not in scratch:
+                    scratch[key] = len(memories)
+                    memories += [Memory(np.zeros(shape, dtype))]
+                remap[len(layouts) + index] = scratch[key]
+            used = chunk.mem >= 0
+            chunk.mem[used] = remap[chunk.mem[used]]
+
+            chunk.memories = memories
+            solved += [chunk]
+
+    return OpTable.concat(solved)
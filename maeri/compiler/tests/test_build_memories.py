@@ -0,0 +1,80 @@
+from maeri.compiler.build_graph.build_memories import build_memories
+from maeri.compiler.compile import Compile
+from onnx.helper import make_graph, make_model, make_node, make_tensor, make_tensor_value_info
+from onnx.external_data_helper import convert_model_to_external_data
+from onnx import TensorProto, numpy_helper
+import numpy as np
+import tempfile
+import onnx
+import os
+
+W = np.arange(2*3*3*3, dtype=np.float32).reshape([2, 3, 3, 3]) - 20
+b = np.arange(2, dtype=np.float32)
+
+def model_with(initializers):
+    x = make_tensor_value_info('x', TensorProto.FLOAT, [1, 3, 4, 4])
+    y = make_tensor_value_info('y', TensorProto.FLOAT, [1, 2, 2, 2])
+    graph = make_graph([], 'test', [x], [y], initializer=initializers)
+    return make_model(graph)
+
+# weights stored in float_data and in raw_data
+model = model_with([
+    make_tensor('W', TensorProto.FLOAT, W.shape, W.flatten()),
+    make_tensor('b', TensorProto.FLOAT, b.shape, b.tobytes(), raw=True)])
+name_v_mem = build_memories(model)
+assert(np.all(name_v_mem['W'].data == W))
+assert(np.all(name_v_mem['b'].data == b))
+
+# raw data is viewed in place rather than copied
+assert(not name_v_mem['b'].data.flags.owndata)
+
+# weights stored in an external data file are memory mapped
+with tempfile.TemporaryDirectory() as directory:
+    model = model_with([make_tensor('W', TensorProto.FLOAT, W.shape, W.tobytes(), raw=True)])
+    convert_model_to_external_data(model, location='weights.bin', size_threshold=0)
+    path = os.path.join(directory, 'test.onnx')
+    onnx.save(model, path)
+
+    model = onnx.load(path, load_external_data=False)
+    name_v_mem = build_memories(model, base_dir=directory)
+    assert(isinstance(name_v_mem['W'].data, np.memmap))
+    assert(np.all(name_v_mem['W'].data == W))
+    del name_v_mem
+
+# a model with external weights compiles and simulates as
+# the same model holding them inline, from any directory
+x = np.arange(3*4*4, dtype=np.float32).reshape([1, 3, 4, 4]) % 5
+conv = make_node('Conv', inputs=['x', 'W', 'b'], outputs=['y'], kernel_shape=[3, 3],
+    strides=[1, 1], pads=[0]*4)
+graph = make_graph([conv], 'test', [make_tensor_value_info('x', TensorProto.FLOAT, [1, 3, 4, 4])],
+    [make_tensor_value_info('y', TensorProto.FLOAT, [1, 2, 2, 2])],
+    initializer=[numpy_helper.from_array(W, 'W'), numpy_helper.from_array(b, 'b')])
+with tempfile.TemporaryDirectory() as directory:
+    path = os.path.join(directory, 'inline.onnx')
+    onnx.save(make_model(graph), path)
+    inline = Compile(path, buff_length=8, ports=16, mults=32)
+
+    model = make_model(graph)
+    convert_model_to_external_data(model, location='w.bin', size_threshold=0)
+    path = os.path.join(directory, 'external.onnx')
+    onnx.save(model, path)
+    external = Compile(path, buff_length=8, ports=16, mults=32)
+
+    # the weights stay memory mapped through sanitizing
+    mapped = [memory for memory in external.memories if isinstance(memory.data, np.memmap)]
+    assert(sorted(memory.data.shape for memory in mapped) == [b.shape, W.shape])
+    assert(np.all(external.sim(x) == inline.sim(x)))
+    external.solve()
+    assert(np.all(external.sim(x) == inline.sim(x)))
+    del inline, external
+
+# tensors without data are rejected rather than zero filled
+empty = TensorProto(name='W', data_type=TensorProto.FLOAT, dims=W.shape)
+model = model_with([empty])
+try:
+    build_memories(model)
+    raise AssertionError("expected ValueError")
+except ValueError:
+    pass
+
+print("DONE")
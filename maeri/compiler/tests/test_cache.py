@@ -0,0 +1,111 @@
+from onnx.helper import make_node, make_graph, make_model
+from onnx.helper import make_tensor_value_info
+from onnx.external_data_helper import convert_model_to_external_data
+from onnx import TensorProto, numpy_helper
+import tempfile
+import shutil
+import onnx
+import numpy as np
+import os
+
+from maeri.compiler import cache as cache_module
+from maeri.compiler.cache import CompileCache, cached_compile
+
+def save_model(path, W):
+    node = make_node('Conv', inputs=['x', 'W'], outputs=['y'],
+        kernel_shape=[3, 3], strides=[1, 1], pads=[1]*4)
+    graph = make_graph(
+        nodes=[node],
+        name='test_cache',
+        inputs=[make_tensor_value_info('x', TensorProto.FLOAT, [1, 2, 6, 6]),
+            make_tensor_value_info('W', TensorProto.FLOAT, list(W.shape))],
+        initializer=[numpy_helper.from_array(W, 'W')],
+        outputs=[make_tensor_value_info('y', TensorProto.FLOAT, [1, 2, 6, 6])])
+    model = make_model(graph, producer_name='onnx-example')
+    if os.path.exists('test_cache.bin'):
+        os.remove('test_cache.bin')
+    convert_model_to_external_data(model, location='test_cache.bin', size_threshold=0)
+    onnx.save(model, path)
+
+def entries(path):
+    return sorted(name for name in os.listdir(path) if name.endswith('.maeri'))
+
+np.random.seed(0)
+x = np.random.randint(0, 4, [1, 2, 6, 6]).astype(np.float32)
+W = np.random.randint(-2, 3, [2, 2, 3, 3]).astype(np.float32)
+save_model('test_cache.onnx', W)
+
+path = tempfile.mkdtemp()
+cache = CompileCache(path, max_entries=3)
+params = dict(buff_length=8, ports=16, mults=32, cache=cache)
+
+# a second identical compile is a hit
+first = cached_compile('test_cache.onnx', **params)
+assert(len(entries(path)) == 1)
+first_entry = entries(path)[0]
+second = cached_compile('test_cache.onnx', **params)
+assert(second is not first)
+assert(entries(path) == [first_entry])
+assert(np.all(second.sim(x) == first.sim(x)))
+
+# editing the external weights alone misses
+model_bytes = open('test_cache.onnx', 'rb').read()
+save_model('test_cache.onnx', W + 1)
+assert(open('test_cache.onnx', 'rb').read() == model_bytes)
+retrained = cached_compile('test_cache.onnx', **params)
+assert(len(entries(path)) == 2)
+assert(np.any(retrained.sim(x) != first.sim(x)))
+
+# as does a change of quantization parameters
+calibration = np.random.randint(0, 4, [4, 1, 2, 6, 6]).astype(np.float32)
+cached_compile('test_cache.onnx', calibration=calibration, **params)
+assert(len(entries(path)) == 3)
+cached_compile('test_cache.onnx', calibration=calibration, **params)
+assert(len(entries(path)) == 3)
+
+# a fourth entry evicts the least recently used, the first
+os.utime(os.path.join(path, first_entry), (0, 0))
+cached_compile('test_cache.onnx', calibration=calibration, per_channel=False, **params)
+assert(len(entries(path)) == 3)
+assert(first_entry not in entries(path))
+
+# entries hold only data, loading without unpickling
+with np.load(os.path.join(path, entries(path)[0]), allow_pickle=False) as archive:
+    assert('manifest' in archive.files)
+
+# editing the compiler sources misses every entry, as
+# does editing the modules they import
+_, sources = cache_module.compiler_sources()
+assert(any(source.endswith(os.path.join('maeri', 'common', 'logger.py')) for source in sources))
+assert(not any(os.sep + 'tests' + os.sep in source for source in sources))
+version = cache_module._compiler_version
+cache_module._compiler_version = 'edited'
+before = set(entries(path))
+cached_compile('test_cache.onnx', **params)
+assert(len(set(entries(path)) - before) == 1)
+cache_module._compiler_version = version
+
+# a failed write leaves neither an entry nor its temporary,
+# nor is a compile holding objects written at all
+broken = cached_compile('test_cache.onnx', **params)
+broken.memories[0].data = np.array([None, 1], dtype=object)
+before = set(os.listdir(path))
+try:
+    cache.put('broken', broken)
+    assert(False)
+except ValueError:
+    pass
+assert(set(os.listdir(path)) == before)
+assert(not any(name.endswith('.tmp') for name in os.listdir(path)))
+
+# and an unreadable entry is discarded
+with open(cache.entry_path('corrupt'), 'wb') as entry:
+    entry.write(b'not a compile')
+assert(cache.get('corrupt') is None)
+assert(not os.path.exists(cache.entry_path('corrupt')))
+
+print("DONE")
+
+shutil.rmtree(path)
+os.remove('test_cache.onnx')
+os.remove('test_cache.bin')
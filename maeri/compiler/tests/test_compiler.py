@@ -103,6 +103,10 @@ res_2 = sess.sim(x)
 
 # check the output is still the same
 assert((res - res_2).sum() == 0)
+
+# simulate a batch of inputs in one call
+res_3 = sess.sim(np.stack([x, x]))
+assert(all((res - res_3[index]).sum() == 0 for index in range(2)))
 print("DONE")
 
 # delete generated model
@@ -0,0 +1,64 @@
+from onnx.helper import make_node, make_graph, make_model
+from onnx.helper import make_tensor, make_tensor_value_info
+from onnx import TensorProto
+from scipy.signal import correlate2d
+import onnx
+import numpy as np
+
+from maeri.compiler.compile import Compile
+from maeri.compiler.assembler.mapper import TreeMapping
+
+np.random.seed(0)
+x = np.random.randint(-4, 4, [1, 4, 10, 10]).astype(np.float32)
+W = np.random.randint(-2, 3, [2, 4, 3, 3]).astype(np.float32)
+b = np.array([-20, 5], dtype=np.float32)
+
+nodes = [make_node('Conv', inputs=['x', 'W', 'b'], outputs=['z'],
+        kernel_shape=[3, 3], strides=[1, 1], pads=[1]*4),
+    make_node('Relu', inputs=['z'], outputs=['y'])]
+graph = make_graph(
+    nodes=nodes,
+    name='test_conv_bias',
+    inputs=[make_tensor_value_info('x', TensorProto.FLOAT, list(x.shape)),
+        make_tensor_value_info('W', TensorProto.FLOAT, list(W.shape)),
+        make_tensor_value_info('b', TensorProto.FLOAT, list(b.shape))],
+    initializer=[make_tensor('W', TensorProto.FLOAT, list(W.shape), W.flatten()),
+        make_tensor('b', TensorProto.FLOAT, list(b.shape), b)],
+    outputs=[make_tensor_value_info('y', TensorProto.FLOAT, [1, 2, 10, 10])])
+onnx.save(make_model(graph, producer_name='onnx-example'), 'test_conv_bias.onnx')
+
+x_padded = np.pad(x[0], ((0, 0), (1, 1), (1, 1)))
+expected = np.stack([sum(correlate2d(x_padded[channel], W[output, channel], mode='valid')
+    for channel in range(4)) + b[output] for output in range(2)])[np.newaxis]
+expected = np.maximum(expected, 0)
+
+sess = Compile('test_conv_bias.onnx', buff_length=8, ports=16, mults=32)
+assert(np.all(sess.sim(x) == expected))
+
+# the bias is summed once, by the first pass of each
+# split filter, before the relu of the last Add
+sess.solve()
+assert(np.all(sess.sim(x) == expected))
+
+# every neuron sums its bias on a lane of its own, fed
+# by the shared row of ones
+sess = Compile('test_conv_bias.onnx', buff_length=8, ports=16, mults=64)
+sess.solve()
+assert(np.all(sess.sim(x) == expected))
+for mapping in sess.map():
+    lanes = [stream for stream in mapping.ports if stream and stream[1] is None]
+    assert(len(lanes) == len(mapping.rows))
+sess.bake_offsets()
+assert(np.all(sess.ones.data == 1))
+
+# the bias lane adds its weight to every sum
+filter_ = np.random.randint(-3, 4, [1, 3, 3])
+mapping = TreeMapping([0], 6, 16, [filter_], biases=[7])
+port_data = np.random.randint(-4, 5, [16, 12])
+unbiased = TreeMapping([0], 6, 16, [filter_]).run(port_data)
+assert(np.all(mapping.run(port_data) == unbiased + 7))
+
+print("DONE")
+
+import os
+os.remove('test_conv_bias.onnx')
@@ -0,0 +1,40 @@
+from maeri.compiler.nodes import Memory, Input, Output, Conv2, OpTable
+from maeri.compiler.solver import solve_table
+from maeri.compiler.cost_model import DeviceConfig, estimate_cost
+import numpy as np
+
+# the config as the driver reads it back from the board
+config = '{"b_in_packet": 32, "b_in_line": 4, "m_depth": 256, "ports": 16, "no.mults": 32}'
+device = DeviceConfig.from_config(config)
+assert(device.num_nodes == 63)
+assert(device.tree_depth == 6)
+
+def solved(buff_length):
+    x_mem = Memory(np.zeros([1, 2, 16, 16], dtype=np.int8))
+    W_mem = Memory(np.zeros([1, 2, 3, 3], dtype=np.int8))
+    y_mem = Memory(np.zeros([1, 1, 16, 16], dtype=np.int8))
+    memories = [x_mem, W_mem, y_mem]
+
+    X = Input((0, slice(0, 2), slice(0, 16), slice(0, 16)), x_mem)
+    W = Input((0, slice(0, 2), slice(0, 3), slice(0, 3)), W_mem)
+    res = Output((0, 0, slice(0, 16), slice(0, 16)), y_mem)
+    table = OpTable.from_ops([Conv2(X, W, res, [1]*4)], memories)
+    return solve_table(table, buff_length, device.ports, device.mults)
+
+table = solved(8)
+estimate = estimate_cost(table, device)
+assert(len(estimate.cycles) == len(table))
+assert(estimate.total_cycles == sum(estimate.summary(rows)['cycles']
+    for rows in estimate.layers()))
+
+# every row runs the same filter, so the tree is only
+# configured once
+assert(np.count_nonzero(estimate.configure) == 1)
+assert(np.sum(estimate.macs) == 2*3*3*16*16)
+
+# fewer, wider tiles take fewer cycles
+assert(estimate_cost(solved(32), device).total_cycles < estimate.total_cycles)
+
+estimate.report()
+
+print("DONE")
@@ -0,0 +1,49 @@
+from maeri.compiler.nodes import Memory, Input, Output, Conv2, OpTable
+from maeri.compiler.solver import solve_table
+from maeri.compiler.sim_engine import SimEngine
+from maeri.compiler.cost_model import DeviceConfig, estimate_cost
+from maeri.compiler.dataflow import DATAFLOWS, dataflow_rank, select_dataflows
+from maeri.compiler.reorder import list_schedule
+import numpy as np
+
+device = DeviceConfig(b_in_line=4, ports=16, mults=32)
+
+def layer(channels, outputs, width, buff_length):
+    np.random.seed(0)
+    x = np.random.randint(-4, 4, [1, channels, width, width]).astype(np.float32)
+    W = np.random.randint(-2, 3, [outputs, channels, 3, 3]).astype(np.float32)
+    x_mem = Memory(x)
+    W_mem = Memory(W)
+    y_mem = Memory(np.zeros([1, outputs, width, width], dtype=np.float32))
+    memories = [x_mem, W_mem, y_mem]
+
+    op_graph = []
+    for channel in range(outputs):
+        X = Input((0, slice(0, channels), slice(0, width), slice(0, width)), x_mem)
+        W_in = Input((channel, slice(0, channels), slice(0, 3), slice(0, 3)), W_mem)
+        res = Output((0, channel, slice(0, width), slice(0, width)), y_mem)
+        op_graph += [Conv2(X, W_in, res, [1]*4)]
+
+    table = solve_table(OpTable.from_ops(op_graph, memories), buff_length, 16, 32)
+    engine = lambda table: SimEngine(table, Input((slice(None),)*4, x_mem),
+        Input((slice(None),)*4, y_mem))
+    return table, x, engine
+
+# a filter streaming many rows that fits in one pass
+# keeps its inputs in place, a filter split into passes
+# over small tiles keeps its weights in place
+for shape, expected in [((3, 4, 12, 32), 'input_stationary'),
+        ((4, 2, 28, 8), 'weight_stationary')]:
+    table, x, engine = layer(*shape)
+    ordered, picked = select_dataflows(table, device)
+    assert(picked == [expected])
+
+    # the pick moves the least data of every dataflow
+    traffic = lambda table: np.sum(estimate_cost(table, device).bytes_moved)
+    for dataflow in DATAFLOWS:
+        order = list_schedule(table, dataflow_rank(table, dataflow))
+        assert(traffic(ordered) <= traffic(table.select(order)))
+
+    assert(np.all(engine(ordered).run(x) == engine(table).run(x)))
+
+print("DONE")
@@ -0,0 +1,41 @@
+from maeri.compiler.nodes import Memory, Input, Output, Conv2, OpTable
+from maeri.compiler.solver import solve_table
+from maeri.compiler.sim_engine import SimEngine
+from scipy.signal import correlate2d
+import numpy as np
+
+# an 8 bit layer, with a 7x7 filter split over two passes
+np.random.seed(0)
+x = np.random.randint(-16, 16, [1, 1, 12, 12]).astype(np.int8)
+W = np.random.randint(-2, 3, [1, 1, 7, 7]).astype(np.int8)
+pad = 3
+
+x_mem = Memory(x)
+W_mem = Memory(W)
+y_mem = Memory(np.zeros([1, 1, 12, 12], dtype=np.int8))
+memories = [x_mem, W_mem, y_mem]
+
+X = Input((0, 0, slice(0, 12), slice(0, 12)), x_mem)
+W_in = Input((0, 0, slice(0, 7), slice(0, 7)), W_mem)
+res = Output((0, 0, slice(0, 12), slice(0, 12)), y_mem)
+op_graph = [Conv2(X, W_in, res, [pad]*4)]
+
+table = solve_table(OpTable.from_ops(op_graph, memories), 16, 16, 32)
+
+# partial sums are kept wider than the features
+assert(memories[-1].dtype == np.int32)
+
+engine = SimEngine(table, Input((slice(None),)*4, x_mem), Input((slice(None),)*4, y_mem))
+result = engine.run(x)
+assert(result.dtype == np.int8)
+
+# results saturate to 8 bits like the hardware's
+# collectors
+expected = correlate2d(np.pad(x[0, 0].astype(np.int64), pad), W[0, 0], mode='valid')
+assert(np.any(np.abs(expected) > 127))
+assert(np.all(result[0, 0] == np.clip(expected, -128, 127)))
+
+# simulating does not touch the memories
+assert(np.all(y_mem.data == 0))
+
+print("DONE")
@@ -0,0 +1,60 @@
+from onnx.helper import make_node, make_graph, make_model
+from onnx.helper import make_tensor, make_tensor_value_info
+from onnx import TensorProto
+from scipy.signal import correlate2d
+import onnx
+import numpy as np
+
+from maeri.compiler.compile import Compile
+from maeri.compiler.nodes import OpTable
+
+# a conv over enough channels to be split into passes,
+# feeding a relu
+np.random.seed(0)
+x = np.random.randint(-4, 4, [1, 4, 10, 10]).astype(np.float32)
+W = np.random.randint(-2, 3, [2, 4, 3, 3]).astype(np.float32)
+
+nodes = [make_node('Conv', inputs=['x', 'W'], outputs=['z'],
+        kernel_shape=[3, 3], strides=[1, 1], pads=[1]*4),
+    make_node('Relu', inputs=['z'], outputs=['y'])]
+graph = make_graph(
+    nodes=nodes,
+    name='test_fuse_relu',
+    inputs=[make_tensor_value_info('x', TensorProto.FLOAT, list(x.shape)),
+        make_tensor_value_info('W', TensorProto.FLOAT, list(W.shape))],
+    initializer=[make_tensor('W', TensorProto.FLOAT, list(W.shape), W.flatten())],
+    outputs=[make_tensor_value_info('y', TensorProto.FLOAT, [1, 2, 10, 10])])
+onnx.save(make_model(graph, producer_name='onnx-example'), 'test_fuse_relu.onnx')
+
+x_padded = np.pad(x[0], ((0, 0), (1, 1), (1, 1)))
+expected = np.stack([sum(correlate2d(x_padded[channel], W[output, channel], mode='valid')
+    for channel in range(4)) for output in range(2)])[np.newaxis]
+expected = np.maximum(expected, 0)
+
+# the relu costs no op of its own
+sess = Compile('test_fuse_relu.onnx', buff_length=8, ports=16, mults=32)
+assert(all(op.relu for op in sess.op_graph))
+assert(np.all(sess.sim(x) == expected))
+
+# split into passes, only the last write of every
+# output is clamped
+sess.solve()
+table = sess.op_graph
+assert(not np.any(table.kind == OpTable.RELU))
+assert(np.any(table.relu) and not np.all(table.relu))
+assert(not np.any(table.relu[table.kind == OpTable.CONV]))
+assert(np.all(sess.sim(x) == expected))
+
+# with room for the whole filter the collectors of
+# every neuron clamp its sum
+sess = Compile('test_fuse_relu.onnx', buff_length=8, ports=16, mults=64)
+sess.solve()
+assert(np.all(sess.op_graph.relu))
+assert(np.all(sess.sim(x) == expected))
+for mapping in sess.map():
+    assert(mapping.relus == [True]*len(mapping.rows) + [False]*(16 - len(mapping.rows)))
+
+print("DONE")
+
+import os
+os.remove('test_fuse_relu.onnx')
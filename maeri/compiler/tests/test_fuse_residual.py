@@ -0,0 +1,90 @@
+from onnx.helper import make_node, make_graph, make_model
+from onnx.helper import make_tensor, make_tensor_value_info
+from onnx import TensorProto
+from scipy.signal import correlate2d
+import onnx
+import numpy as np
+
+from maeri.compiler.compile import Compile
+from maeri.compiler.nodes import OpTable
+from maeri.compiler.assembler.mapper import TreeMapping
+
+# a residual block, the skip connection added to the
+# result of its second conv
+np.random.seed(0)
+x = np.random.randint(-4, 4, [1, 4, 8, 8]).astype(np.float32)
+W1 = np.random.randint(-2, 3, [4, 4, 3, 3]).astype(np.float32)
+b1 = np.random.randint(-8, 8, [4]).astype(np.float32)
+W2 = np.random.randint(-2, 3, [4, 4, 3, 3]).astype(np.float32)
+
+nodes = [make_node('Conv', inputs=['x', 'W1', 'b1'], outputs=['a'],
+        kernel_shape=[3, 3], strides=[1, 1], pads=[1]*4),
+    make_node('Relu', inputs=['a'], outputs=['r']),
+    make_node('Conv', inputs=['r', 'W2'], outputs=['z'],
+        kernel_shape=[3, 3], strides=[1, 1], pads=[1]*4),
+    make_node('Add', inputs=['x', 'z'], outputs=['s']),
+    make_node('Relu', inputs=['s'], outputs=['y'])]
+graph = make_graph(
+    nodes=nodes,
+    name='test_fuse_residual',
+    inputs=[make_tensor_value_info('x', TensorProto.FLOAT, list(x.shape))],
+    initializer=[make_tensor('W1', TensorProto.FLOAT, list(W1.shape), W1.flatten()),
+        make_tensor('b1', TensorProto.FLOAT, list(b1.shape), b1),
+        make_tensor('W2', TensorProto.FLOAT, list(W2.shape), W2.flatten())],
+    outputs=[make_tensor_value_info('y', TensorProto.FLOAT, list(x.shape))])
+onnx.save(make_model(graph, producer_name='onnx-example'), 'test_fuse_residual.onnx')
+
+def conv(x, W, b=None):
+    x_padded = np.pad(x[0], ((0, 0), (1, 1), (1, 1)))
+    res = np.stack([sum(correlate2d(x_padded[channel], W[output, channel], mode='valid')
+        for channel in range(W.shape[1])) for output in range(W.shape[0])])[np.newaxis]
+    if b is not None:
+        res = res + b.reshape(1, -1, 1, 1)
+    return res
+
+r = np.maximum(conv(x, W1, b1), 0)
+expected = np.maximum(conv(r, W2) + x, 0)
+
+# the add and the relu after it cost no ops of their own,
+# the second conv reads the input as its residual
+sess = Compile('test_fuse_residual.onnx', buff_length=8, ports=16, mults=32)
+table = OpTable.from_ops(sess.op_graph, list(sess.memories))
+assert(not np.any(table.kind == OpTable.ADD))
+residual = table.mem[:, 4] >= 0
+assert(np.count_nonzero(residual) == 4)
+assert(np.all(table.mem[residual, 4] == table.memories.index(sess.entrypoint.mem_ref)))
+assert(np.all(table.relu))
+assert(np.all(sess.sim(x) == expected))
+
+# split into passes, the residual is summed once by the
+# first pass of each filter
+sess.solve()
+table = sess.op_graph
+residual = table.mem[:, 4] >= 0
+assert(np.any(table.kind == OpTable.ADD))
+assert(np.all(table.kind[residual] == OpTable.CONV))
+assert(np.all(sess.sim(x) == expected))
+
+# with room for the whole filter every neuron sums its
+# residual on a lane of its own
+sess = Compile('test_fuse_residual.onnx', buff_length=8, ports=16, mults=64)
+sess.solve()
+assert(np.all(sess.sim(x) == expected))
+for mapping in sess.map():
+    lanes = [stream for stream in mapping.ports if stream and stream[2] == 'residual']
+    assert(len(lanes) == sum(mapping.residuals))
+assert(any(any(mapping.residuals) for mapping in sess.mappings))
+
+# the residual lane adds its stream to every sum, on
+# the cycle the sum is collected
+filter_ = np.random.randint(-3, 4, [1, 3, 3])
+mapping = TreeMapping([0], 6, 16, [filter_], residuals=[True])
+port_data = np.random.randint(-4, 5, [16, 12])
+lane = mapping.ports.index((0, None, 'residual'))
+alone = TreeMapping([0], 6, 16, [filter_]).run(port_data)
+assert(np.all(mapping.run(port_data) == alone + port_data[lane]))
+
+print("DONE")
+
+import os
+os.remove('test_fuse_residual.onnx')
@@ -0,0 +1,89 @@
+from onnx.helper import make_node, make_graph, make_model
+from onnx.helper import make_tensor, make_tensor_value_info
+from onnx import TensorProto
+from numpy.lib.stride_tricks import sliding_window_view
+import onnx
+import numpy as np
+
+from maeri.compiler.compile import Compile
+from maeri.compiler.nodes import OpTable
+from maeri.compiler.cost_model import DeviceConfig, estimate_cost
+
+# features pooled and flattened into a classifier head
+np.random.seed(0)
+x = np.random.randint(-4, 4, [1, 2, 4, 4]).astype(np.float32)
+W = np.random.randint(-2, 3, [40, 2, 3, 3]).astype(np.float32)
+B = np.random.randint(-2, 3, [10, 40]).astype(np.float32)
+C = np.random.randint(-8, 8, [10]).astype(np.float32)
+
+nodes = [make_node('Conv', inputs=['x', 'W'], outputs=['z'],
+        kernel_shape=[3, 3], strides=[1, 1], pads=[1]*4),
+    make_node('GlobalAveragePool', inputs=['z'], outputs=['p']),
+    make_node('Flatten', inputs=['p'], outputs=['f']),
+    make_node('Gemm', inputs=['f', 'B', 'C'], outputs=['y'], transB=1, alpha=0.5)]
+graph = make_graph(
+    nodes=nodes,
+    name='test_gemm',
+    inputs=[make_tensor_value_info('x', TensorProto.FLOAT, list(x.shape))],
+    initializer=[make_tensor('W', TensorProto.FLOAT, list(W.shape), W.flatten()),
+        make_tensor('B', TensorProto.FLOAT, list(B.shape), B.flatten()),
+        make_tensor('C', TensorProto.FLOAT, list(C.shape), C)],
+    outputs=[make_tensor_value_info('y', TensorProto.FLOAT, [1, 10])])
+onnx.save(make_model(graph, producer_name='onnx-example'), 'test_gemm.onnx')
+
+x_padded = np.pad(x[0], ((0, 0), (1, 1), (1, 1)))
+z = np.einsum('chwij,ocij->ohw', sliding_window_view(x_padded, (3, 3), axis=(1, 2)), W)
+expected = (0.5*(B @ z.mean(axis=(1, 2)) + 2*C))[np.newaxis]
+
+# the flatten shares the pool's memory, and the head is
+# a single Gemm op
+sess = Compile('test_gemm.onnx', buff_length=8, ports=16, mults=32)
+table = OpTable.from_ops(sess.op_graph)
+assert(np.count_nonzero(table.kind == OpTable.GEMM) == 1)
+assert(np.allclose(sess.sim(x), expected))
+
+# inputs are sliced to fit a port's buffer, and outputs
+# grouped to fit the tree
+sess.solve()
+table = sess.op_graph
+gemm = table.kind == OpTable.GEMM
+assert(np.all(table.extent(1)[gemm, 3] <= 8))
+assert(np.all(table.extent(1)[gemm, 2] <= 3))
+assert(np.count_nonzero(table.scale == np.float32(0.5)) == 4)
+assert(np.allclose(sess.sim(x), expected))
+
+estimate = estimate_cost(table, DeviceConfig(4, 16, 32))
+assert(np.sum(estimate.macs[gemm]) == B.size)
+
+# every neuron of a pass streams its slice of the input
+# through a chain of mults, the sum collected once the
+# whole slice is in
+mappings = [mapping for mapping in sess.map() if gemm[mapping.rows[0]]]
+assert(len(mappings) == np.count_nonzero(gemm))
+a = np.random.randint(-4, 5, [40])
+for mapping in mappings:
+    row = mapping.rows[0]
+    if table.relu[row] or (table.scale[row] != 1):
+        continue
+    begin, end = table.start[row, 1, 2:], table.stop[row, 1, 2:]
+    port_data = np.zeros([16, end[1] - begin[1]], dtype=np.int64)
+    port_data[:] = a[begin[1]:end[1]]
+    sums = mapping.run(port_data)[:, -1]
+    # beta/alpha of the bias is folded into it
+    bias = 2*C[begin[0]:end[0]] if table.mem[row, 3] >= 0 else 0
+    assert(np.all(sums == B[begin[0]:end[0], begin[1]:end[1]] @ a[begin[1]:end[1]] + bias))
+
+# more ports than mults is an error rather than a zero
+# sized group of mults a port
+from maeri.compiler.solver import solve_gemm
+head = Compile('test_gemm.onnx', buff_length=8, ports=16, mults=32)
+try:
+    solve_gemm(OpTable.from_ops(head.op_graph, list(head.memories)), 8, 64, 32)
+    assert(False)
+except ValueError:
+    pass
+
+print("DONE")
+
+import os
+os.remove('test_gemm.onnx')
@@ -0,0 +1,62 @@
+from onnx.helper import make_node, make_graph, make_model
+from onnx.helper import make_tensor, make_tensor_value_info
+from onnx import TensorProto
+from numpy.lib.stride_tricks import sliding_window_view
+import onnx
+import numpy as np
+
+from maeri.compiler.compile import Compile
+from maeri.compiler.nodes import OpTable
+from maeri.compiler.cost_model import DeviceConfig, estimate_cost
+
+def save_model(path, x, W, group):
+    node = make_node('Conv', inputs=['x', 'W'], outputs=['y'],
+        kernel_shape=list(W.shape[2:]), strides=[1, 1], pads=[1]*4, group=group)
+    graph = make_graph(
+        nodes=[node],
+        name='test_groups',
+        inputs=[make_tensor_value_info('x', TensorProto.FLOAT, list(x.shape)),
+            make_tensor_value_info('W', TensorProto.FLOAT, list(W.shape))],
+        initializer=[make_tensor('W', TensorProto.FLOAT, list(W.shape), W.flatten())],
+        outputs=[make_tensor_value_info('y', TensorProto.FLOAT,
+            [1, W.shape[0]] + list(x.shape[2:]))])
+    onnx.save(make_model(graph, producer_name='onnx-example'), path)
+
+def reference(x, W, group):
+    x_padded = np.pad(x[0], ((0, 0), (1, 1), (1, 1)))
+    windows = sliding_window_view(x_padded, W.shape[2:], axis=(1, 2))
+    channels, outputs = W.shape[1], W.shape[0]//group
+    return np.concatenate([np.einsum('chwij,ocij->ohw',
+        windows[index*channels:(index + 1)*channels], W[index*outputs:(index + 1)*outputs])
+        for index in range(group)])[np.newaxis]
+
+np.random.seed(0)
+x = np.random.randint(-4, 4, [1, 4, 10, 10]).astype(np.float32)
+
+# a conv of two groups of two channels, and a depthwise conv
+for group in [2, 4]:
+    W = np.random.randint(-2, 3, [4, 4//group, 3, 3]).astype(np.float32)
+    expected = reference(x, W, group)
+    save_model('test_groups.onnx', x, W, group)
+
+    sess = Compile('test_groups.onnx', buff_length=16, ports=16, mults=32)
+    assert(np.all(sess.sim(x) == expected))
+
+    sess.solve()
+    table = sess.op_graph
+    assert(np.all(sess.sim(x) == expected))
+
+    # every filter only multiplies the channels of its group
+    assert(np.all(table.extent(1)[:, 1] == 4//group))
+    estimate = estimate_cost(table, DeviceConfig(4, 16, 32))
+    assert(np.sum(estimate.macs) == expected.size*W[0].size)
+
+# single channel filters of a depthwise conv leave room
+# for several neurons on the tree
+for mapping in sess.map():
+    assert(len(mapping.rows) > 1)
+
+print("DONE")
+
+import os
+os.remove('test_groups.onnx')
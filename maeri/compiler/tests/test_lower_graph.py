@@ -0,0 +1,83 @@
+from onnx.helper import make_node, make_graph, make_model
+from onnx.helper import make_tensor, make_tensor_value_info
+from onnx import TensorProto
+from scipy.signal import correlate2d
+import onnx
+import numpy as np
+
+from maeri.compiler.compile import Compile
+from maeri.compiler.nodes import OpTable
+
+# a conv block, a residual block and an add of both,
+# every Relu fused into the op feeding it
+np.random.seed(0)
+x = np.random.randint(-4, 4, [1, 4, 8, 8]).astype(np.float32)
+W1 = np.random.randint(-2, 3, [4, 4, 3, 3]).astype(np.float32)
+b1 = np.random.randint(-8, 8, [4]).astype(np.float32)
+W2 = np.random.randint(-2, 3, [4, 4, 3, 3]).astype(np.float32)
+
+nodes = [make_node('Conv', inputs=['x', 'W1', 'b1'], outputs=['a'],
+        kernel_shape=[3, 3], strides=[1, 1], pads=[1]*4),
+    make_node('Relu', inputs=['a'], outputs=['r']),
+    make_node('Conv', inputs=['r', 'W2'], outputs=['c'],
+        kernel_shape=[3, 3], strides=[1, 1], pads=[1]*4),
+    make_node('Add', inputs=['c', 'x'], outputs=['s']),
+    make_node('Relu', inputs=['s'], outputs=['t']),
+    make_node('Add', inputs=['t', 'r'], outputs=['u']),
+    make_node('Relu', inputs=['u'], outputs=['y'])]
+inits = [make_tensor('W1', TensorProto.FLOAT, list(W1.shape), W1.flatten()),
+    make_tensor('b1', TensorProto.FLOAT, list(b1.shape), b1),
+    make_tensor('W2', TensorProto.FLOAT, list(W2.shape), W2.flatten())]
+graph = make_graph(
+    nodes=nodes,
+    name='test_lower_graph',
+    inputs=[make_tensor_value_info('x', TensorProto.FLOAT, list(x.shape))],
+    initializer=inits,
+    outputs=[make_tensor_value_info('y', TensorProto.FLOAT, list(x.shape))])
+onnx.save(make_model(graph, producer_name='onnx-example'), 'test_lower_graph.onnx')
+
+def conv(x, W, b=None):
+    x_padded = np.pad(x[0], ((0, 0), (1, 1), (1, 1)))
+    res = np.stack([sum(correlate2d(x_padded[channel], W[output, channel], mode='valid')
+        for channel in range(W.shape[1])) for output in range(W.shape[0])])[np.newaxis]
+    if b is not None:
+        res = res + b.reshape(1, -1, 1, 1)
+    return res
+
+r = np.maximum(conv(x, W1, b1), 0)
+t = np.maximum(conv(r, W2) + x, 0)
+expected = np.maximum(t + r, 0)
+
+# the last add reads two tensors read elsewhere, so it
+# stays an op of its own, clamping what it writes
+sess = Compile('test_lower_graph.onnx', buff_length=8, ports=16, mults=32)
+table = OpTable.from_ops(sess.op_graph, list(sess.memories))
+assert(not np.any(table.kind == OpTable.RELU))
+assert(np.count_nonzero(table.kind == OpTable.ADD) == 4)
+assert(np.all(table.relu))
+assert(np.all(sess.sim(x) == expected))
+
+sess.solve()
+assert(not np.any(sess.op_graph.kind == OpTable.RELU))
+assert(np.all(sess.sim(x) == expected))
+
+# a Relu with no op to clamp for it is rejected
+graph = make_graph(
+    nodes=[make_node('Relu', inputs=['x'], outputs=['r']),
+        make_node('Conv', inputs=['r', 'W2'], outputs=['y'],
+            kernel_shape=[3, 3], strides=[1, 1], pads=[1]*4)],
+    name='test_lower_graph',
+    inputs=[make_tensor_value_info('x', TensorProto.FLOAT, list(x.shape))],
+    initializer=inits[2:],
+    outputs=[make_tensor_value_info('y', TensorProto.FLOAT, list(x.shape))])
+onnx.save(make_model(graph, producer_name='onnx-example'), 'test_lower_graph.onnx')
+try:
+    Compile('test_lower_graph.onnx', buff_length=8, ports=16, mults=32)
+    assert(False)
+except NotImplementedError:
+    pass
+
+print("DONE")
+
+import os
+os.remove('test_lower_graph.onnx')
@@ -0,0 +1,74 @@
+from maeri.compiler.nodes import Memory, Input, Output, Conv2, OpTable
+from maeri.compiler.solver import solve_table
+from maeri.compiler.assembler.mapper import TreeMapping, map_table
+from maeri.compiler.assembler import opcodes
+from maeri.compiler.assembler.states import InjectEn
+import numpy as np
+
+np.random.seed(0)
+depth, ports = 6, 16
+
+# two 3x3 neurons share the tree, each row of the filters
+# sliding along the row streamed into its port
+filters = [np.random.randint(-3, 4, [1, 3, 3]) for _ in range(2)]
+mapping = TreeMapping([0, 1], depth, ports, filters)
+assert(mapping.utilization == 18/32)
+assert(mapping.states[31:].count(InjectEn.on) == 6)
+
+port_data = np.random.randint(-4, 5, [ports, 12])
+sums = mapping.run(port_data)
+for neuron, filter_ in enumerate(filters):
+    expected = 0
+    for port, stream in enumerate(mapping.ports):
+        if (stream is not None) and (stream[0] == neuron):
+            _, channel, row = stream
+            expected = expected + np.correlate(port_data[port], filter_[channel, row], mode='valid')
+    assert(np.all(sums[neuron, 2:] == expected))
+
+# the configuration ops load the mapping
+opcodes.InitISA(_bytes_in_address=3, _num_nodes=63, _num_adders=31,
+    _num_mults=32, _input_width=8, _num_ports=ports)
+assert(len(mapping.instructions()) == 5)
+
+# float weights are not silently truncated
+fractional = TreeMapping([0], depth, ports, [filters[0] + 0.5])
+try:
+    fractional.instructions()
+    assert(False)
+except ValueError:
+    pass
+
+# a fused relu clamps what the collector writes
+relu_mapping = TreeMapping([0, 1], depth, ports, filters, relus=[True, False])
+assert(relu_mapping.relus[:2] == [True, False])
+relu_sums = relu_mapping.run(port_data)
+assert(np.all(relu_sums[0] == np.maximum(sums[0], 0)))
+assert(np.all(relu_sums[1] == sums[1]))
+assert(relu_mapping.instructions()[3].mask() == [1, 0])
+
+# consecutive output rows of a single channel 3x3 layer
+# are packed two to a configuration
+x_mem = Memory(np.zeros([1, 1, 8, 8], dtype=np.int8))
+W_mem = Memory(np.ones([1, 1, 3, 3], dtype=np.int8))
+y_mem = Memory(np.zeros([1, 1, 8, 8], dtype=np.int8))
+memories = [x_mem, W_mem, y_mem]
+
+X = Input((0, 0, slice(0, 8), slice(0, 8)), x_mem)
+W = Input((0, 0, slice(0, 3), slice(0, 3)), W_mem)
+res = Output((0, 0, slice(0, 8), slice(0, 8)), y_mem)
+table = solve_table(OpTable.from_ops([Conv2(X, W, res, [1]*4)], memories), 16, ports, 32)
+
+mappings = map_table(table, depth, ports)
+assert(len(table) == 8)
+assert(len(mappings) == 4)
+assert([mapping.rows for mapping in mappings][0] == [0, 1])
+
+# config blocks take whole lines of the target's width
+from maeri.compiler.assembler.assemble import assemble
+opcodes.InitISA(_bytes_in_address=3, _num_nodes=63, _num_adders=31,
+    _num_mults=32, _input_width=8, _num_ports=ports, _bytes_in_line=8)
+program = assemble(mapping.instructions(), as_bytes=True)
+assert(len(program) == 2*128*8)
+assert([program[4*op + 1] for op in range(5)] == [128, 136, 141, 143, 144])
+
+print("DONE")
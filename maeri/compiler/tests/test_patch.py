@@ -0,0 +1,132 @@
+from onnx.helper import make_node, make_graph, make_model
+from onnx.helper import make_tensor, make_tensor_value_info
+from onnx import TensorProto
+import onnx
+import numpy as np
+
+from maeri.compiler.compile import Compile
+
+def save_model(path, W, padding=1):
+    out_width = 12 + 2*padding - W.shape[2] + 1
+    node = make_node('Conv', inputs=['x', 'W'], outputs=['y'],
+        kernel_shape=list(W.shape[2:]), strides=[1, 1], pads=[padding]*4)
+    graph = make_graph(
+        nodes=[node],
+        name='test_patch',
+        inputs=[make_tensor_value_info('x', TensorProto.FLOAT, [1, 2, 12, 12]),
+            make_tensor_value_info('W', TensorProto.FLOAT, list(W.shape))],
+        initializer=[make_tensor('W', TensorProto.FLOAT, list(W.shape), W.flatten())],
+        outputs=[make_tensor_value_info('y', TensorProto.FLOAT,
+            [1, W.shape[0], out_width, out_width])])
+    onnx.save(make_model(graph, producer_name='onnx-example'), path)
+
+np.random.seed(0)
+x = np.random.randint(0, 4, [1, 2, 12, 12]).astype(np.float32)
+W = np.random.randint(-2, 3, [2, 2, 3, 3]).astype(np.float32)
+save_model('test_patch.onnx', W)
+
+sess = Compile('test_patch.onnx', buff_length=8, ports=16, mults=32)
+sess.solve()
+sess.bake_offsets()
+sess.map()
+
+# retrain a single weight of the second filter
+W_new = W.copy()
+W_new[1, 0, 2, 1] += 1
+save_model('test_patch_new.onnx', W_new)
+patch = sess.update_weights('test_patch_new.onnx')
+
+# only the line holding the weight is rewritten
+W_mem = patch.memories[0]
+assert(len(patch.memories) == 1)
+assert(len(patch.writes) == 1)
+element = np.ravel_multi_index((1, 0, 2, 1), W.shape)
+address, data = patch.writes[0]
+line = (element*W_mem.dtype.itemsize)//4
+assert(address == (W_mem.offset + line)*4)
+assert(data == W_mem.device_bytes()[line*4:(line + 1)*4])
+
+# and only configurations of the second filter change,
+# reloading a byte of weight per mult
+assert(len(patch.mappings) > 0)
+for index in patch.mappings:
+    for row in sess.mappings[index].rows:
+        assert(sess.op_graph.start[row, 1, 0] == 1)
+assert(patch.config_bytes == 32*len(patch.mappings))
+
+# configurations of ops reading no changed memory are
+# not built again
+def save_layers(path, W, V):
+    nodes = [make_node('Conv', inputs=['x', 'W'], outputs=['z'],
+            kernel_shape=[3, 3], pads=[1]*4),
+        make_node('Conv', inputs=['z', 'V'], outputs=['y'],
+            kernel_shape=[3, 3], pads=[1]*4)]
+    graph = make_graph(
+        nodes=nodes,
+        name='test_patch',
+        inputs=[make_tensor_value_info('x', TensorProto.FLOAT, [1, 2, 12, 12])],
+        initializer=[make_tensor('W', TensorProto.FLOAT, list(W.shape), W.flatten()),
+            make_tensor('V', TensorProto.FLOAT, list(V.shape), V.flatten())],
+        outputs=[make_tensor_value_info('y', TensorProto.FLOAT, [1, 2, 12, 12])])
+    onnx.save(make_model(graph, producer_name='onnx-example'), path)
+
+V = np.random.randint(-2, 3, [2, 2, 3, 3]).astype(np.float32)
+save_layers('test_patch_layers.onnx', W, V)
+layers = Compile('test_patch_layers.onnx', buff_length=8, ports=16, mults=32)
+layers.solve()
+layers.bake_offsets()
+layers.map()
+kept = list(layers.mappings)
+
+V_new = V.copy()
+V_new[0, 1, 0, 0] += 1
+save_layers('test_patch_layers_new.onnx', W, V_new)
+patch = layers.update_weights('test_patch_layers_new.onnx')
+V_mem = patch.memories[0]
+for old, new in zip(kept, layers.mappings):
+    reads_V = layers.op_graph.memories[layers.op_graph.mem[old.rows[0], 1]] is V_mem
+    assert((old is new) != reads_V)
+
+# the patched model computes as the retrained one
+fresh = Compile('test_patch_new.onnx', buff_length=8, ports=16, mults=32)
+assert(np.all(sess.sim(x) == fresh.sim(x)))
+
+# a model of another topology is refused
+save_model('test_patch_new.onnx', W_new, padding=0)
+try:
+    sess.update_weights('test_patch_new.onnx')
+    assert(False)
+except ValueError:
+    pass
+
+# a quantized model is patched with its retrained weights
+# in the scales it was compiled with
+save_model('test_patch.onnx', W)
+calibration = np.random.randint(0, 4, [8, 1, 2, 12, 12]).astype(np.float32)
+sess = Compile('test_patch.onnx', buff_length=8, ports=16, mults=32,
+    calibration=calibration)
+sess.solve()
+sess.bake_offsets()
+sess.map()
+x_q = sess.quantizer.quantize_input(x)
+before = sess.sim(x_q)
+
+W_new = W.copy()
+W_new[1, 0, 2, 1] -= np.sign(W[1, 0, 2, 1]) or 1
+save_model('test_patch_new.onnx', W_new)
+patch = sess.update_weights('test_patch_new.onnx')
+assert(len(patch.memories) == 1)
+assert(len(patch.writes) == 1)
+assert(0 < len(patch.mappings) < len(sess.mappings))
+
+scale = sess.quantizer.scales['W'].reshape(-1, 1, 1, 1)
+assert(np.all(patch.memories[0].data == np.rint(W_new/scale)))
+assert(np.any(sess.sim(x_q) != before))
+
+print("DONE")
+
+import os
+os.remove('test_patch.onnx')
+os.remove('test_patch_new.onnx')
+os.remove('test_patch_layers.onnx')
+os.remove('test_patch_layers_new.onnx')
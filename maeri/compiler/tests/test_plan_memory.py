@@ -0,0 +1,74 @@
+from maeri.compiler.nodes import Memory, Input, Output, Add
+from maeri.compiler.plan_memory import plan_memory
+import numpy as np
+
+# a chain of adds, each reading the previous
+# intermediate and writing the next one
+memories = [Memory(np.zeros([1, 1, 4, 4])) for _ in range(5)]
+slice_ = (0, 0, slice(0, 4), slice(0, 4))
+op_graph = []
+for index in range(4):
+    A = Input(slice_, memories[index])
+    B = Input(slice_, memories[index])
+    C = Output(slice_, memories[index + 1])
+    op_graph += [Add(A, B, C)]
+
+zeros = Memory(np.zeros([4, 8]))
+pinned = [memories[0], memories[-1]]
+plan = plan_memory(op_graph, memories, zeros, pinned=pinned, b_in_line=4)
+
+# the zero page always comes first
+assert(zeros.offset == 0)
+
+# memories live at the same time must not overlap
+for memory in memories:
+    for other in memories:
+        if memory is other:
+            continue
+        first, last = plan.lifetimes[memory]
+        other_first, other_last = plan.lifetimes[other]
+        if (first <= other_last) and (other_first <= last):
+            end = memory.offset + plan.lines[memory]
+            other_end = other.offset + plan.lines[other]
+            assert((end <= other.offset) or (other_end <= memory.offset))
+
+# intermediates with disjoint lifetimes share lines
+assert(plan.peak < plan.unshared)
+
+# models too large for the device are rejected
+try:
+    plan_memory(op_graph, memories, zeros, pinned=pinned, b_in_line=4, m_depth=8)
+    raise AssertionError("expected RuntimeError")
+except RuntimeError:
+    pass
+
+# an int32 scratch of partial sums next to the int8
+# tensors it is summed from takes four bytes an element
+features = Memory(np.arange(-8, 8, dtype=np.int8).reshape([1, 1, 4, 4]))
+scratch = Memory((np.arange(16, dtype=np.int32)*100003 - 800000).reshape([1, 1, 4, 4]))
+result = Memory(np.zeros([1, 1, 4, 4], dtype=np.int8))
+op_graph = [Add(Input(slice_, features), Input(slice_, features), Output(slice_, scratch)),
+    Add(Input(slice_, scratch), Input(slice_, features), Output(slice_, result))]
+zeros = Memory(np.zeros([4, 8], dtype=np.int8))
+plan = plan_memory(op_graph, [features, scratch, result], zeros,
+    pinned=[features, result], b_in_line=4)
+assert(plan.lines[features] == 4)
+assert(plan.lines[scratch] == 16)
+for memory, other in [(features, scratch), (features, result), (scratch, zeros)]:
+    end = memory.offset + plan.lines[memory]
+    other_end = other.offset + plan.lines[other]
+    assert((end <= other.offset) or (other_end <= memory.offset))
+
+# and every memory survives a round trip through the
+# device image in its own dtype
+image = bytearray(4*plan.peak)
+for memory in [zeros, features, scratch]:
+    data = memory.device_bytes()
+    assert(len(data) <= 4*plan.lines[memory])
+    image[4*memory.offset : 4*memory.offset + len(data)] = data
+for memory in [zeros, features, scratch]:
+    data = bytes(image[4*memory.offset : 4*memory.offset + memory.data.nbytes])
+    read = np.frombuffer(data, dtype=memory.dtype.newbyteorder('<'))
+    assert(np.all(read.reshape(memory.data.shape) == memory.data))
+
+print("DONE")
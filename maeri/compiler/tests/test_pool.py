@@ -0,0 +1,116 @@
+from onnx.helper import make_node, make_graph, make_model
+from onnx.helper import make_tensor, make_tensor_value_info
+from onnx import TensorProto
+from numpy.lib.stride_tricks import sliding_window_view
+import onnx
+import numpy as np
+
+from maeri.compiler.compile import Compile
+from maeri.compiler.nodes import OpTable
+from maeri.compiler.assembler.mapper import TreeMapping
+from maeri.compiler.assembler.opcodes import ConfigureScales
+
+# a conv feeding an average pool, then a global average
+# pool down to a value per channel
+np.random.seed(0)
+x = np.random.randint(-4, 4, [1, 2, 12, 12]).astype(np.float32)
+W = np.random.randint(-2, 3, [3, 2, 3, 3]).astype(np.float32)
+
+nodes = [make_node('Conv', inputs=['x', 'W'], outputs=['z'],
+        kernel_shape=[3, 3], strides=[1, 1], pads=[1]*4),
+    make_node('AveragePool', inputs=['z'], outputs=['p'],
+        kernel_shape=[2, 2], strides=[2, 2]),
+    make_node('GlobalAveragePool', inputs=['p'], outputs=['y'])]
+graph = make_graph(
+    nodes=nodes,
+    name='test_pool',
+    inputs=[make_tensor_value_info('x', TensorProto.FLOAT, list(x.shape)),
+        make_tensor_value_info('W', TensorProto.FLOAT, list(W.shape))],
+    initializer=[make_tensor('W', TensorProto.FLOAT, list(W.shape), W.flatten())],
+    outputs=[make_tensor_value_info('y', TensorProto.FLOAT, [1, 3, 1, 1])])
+onnx.save(make_model(graph, producer_name='onnx-example'), 'test_pool.onnx')
+
+x_padded = np.pad(x[0], ((0, 0), (1, 1), (1, 1)))
+z = np.einsum('chwij,ocij->ohw', sliding_window_view(x_padded, (3, 3), axis=(1, 2)), W)
+p = z.reshape(3, 6, 2, 6, 2).mean(axis=(2, 4))
+expected = p.mean(axis=(1, 2)).reshape(1, 3, 1, 1)
+
+# pools are Conv2 ops over a filter of ones, scaled by
+# the size of their window
+sess = Compile('test_pool.onnx', buff_length=8, ports=16, mults=32)
+table = OpTable.from_ops(sess.op_graph)
+pools = table.scale != 1
+assert(np.all(table.kind == OpTable.CONV))
+assert(np.count_nonzero(pools) == 2*3)
+assert(np.all(np.isin(table.scale[pools], [np.float32(1/4), np.float32(1/36)])))
+assert(np.allclose(sess.sim(x), expected))
+
+# the global pool is split into passes, only the last
+# write of every output is scaled
+sess.solve()
+table = sess.op_graph
+last = table.scale == np.float32(1/36)
+assert(np.count_nonzero(last) == 3)
+assert(np.all(table.kind[last] == OpTable.ADD))
+assert(np.allclose(sess.sim(x), expected))
+sess.map()
+
+# collectors scale by a fixed point multiplier and shift
+assert(ConfigureScales.fixed_point(1) == (128, 7))
+assert(ConfigureScales.fixed_point(1/4) == (128, 9))
+multiplier, shift = ConfigureScales.fixed_point(1/9)
+assert(abs(multiplier/2**shift - 1/9) < 1/2**(shift + 1))
+
+# small requantization factors keep their precision, and
+# those too small to move an int32 sum round to zero
+multiplier, shift = ConfigureScales.fixed_point(1e-6)
+assert(128 <= multiplier < 256)
+assert(abs(multiplier/2**shift - 1e-6) < 1/2**(shift + 1))
+assert(ConfigureScales.fixed_point(1e-12) == (0, ConfigureScales.MAX_SHIFT))
+
+filter_ = np.ones([1, 2, 2], dtype=np.int64)
+port_data = np.random.randint(-4, 5, [16, 8])
+unscaled = TreeMapping([0], 6, 16, [filter_]).run(port_data)
+scaled = TreeMapping([0], 6, 16, [filter_], scales=[1/4]).run(port_data)
+assert(np.all(scaled == unscaled//4))
+
+# a global pool over rows wider than the tree, or than a
+# port's buffer, sums groups of columns in passes
+def save_global_pool(path, shape):
+    graph = make_graph(
+        nodes=[make_node('GlobalAveragePool', inputs=['x'], outputs=['y'])],
+        name='test_pool_wide',
+        inputs=[make_tensor_value_info('x', TensorProto.FLOAT, shape)],
+        outputs=[make_tensor_value_info('y', TensorProto.FLOAT, shape[:2] + [1, 1])])
+    onnx.save(make_model(graph, producer_name='onnx-example'), path)
+
+wide = np.random.randint(-4, 4, [1, 2, 20, 20]).astype(np.float32)
+save_global_pool('test_pool_wide.onnx', list(wide.shape))
+expected = wide.mean(axis=(2, 3), keepdims=True)
+for buff_length, ports, mults in [(32, 16, 16), (8, 16, 32), (8, 4, 64)]:
+    sess = Compile('test_pool_wide.onnx', buff_length=buff_length, ports=ports, mults=mults)
+    sess.solve()
+    table = sess.op_graph
+    conv = table.kind == OpTable.CONV
+    assert(np.all(table.extent(1)[conv, 3] <= min(buff_length, mults)))
+    assert(np.all(table.extent(0)[conv, 3] <= buff_length))
+    assert(np.count_nonzero(table.scale != 1) == 2)
+    assert(np.allclose(sess.sim(wide), expected))
+    sess.map()
+
+# as does one of a quantized model
+calibration = np.random.randint(-4, 4, [4, 1, 2, 20, 20]).astype(np.float32)
+sess = Compile('test_pool_wide.onnx', buff_length=32, ports=16, mults=16,
+    calibration=calibration)
+x_q = sess.quantizer.quantize_input(wide)
+unsolved = sess.sim(x_q)
+sess.solve()
+assert(np.all(sess.sim(x_q) == unsolved))
+y = sess.quantizer.dequantize_output(unsolved).reshape(expected.shape)
+assert(np.all(np.abs(y - expected) <= sess.quantizer.output))
+
+print("DONE")
+
+import os
+os.remove('test_pool.onnx')
+os.remove('test_pool_wide.onnx')
@@ -0,0 +1,100 @@
+from onnx.helper import make_node, make_graph, make_model
+from onnx.helper import make_tensor, make_tensor_value_info
+from onnx import TensorProto
+import onnx
+import numpy as np
+
+from maeri.compiler.compile import Compile
+from maeri.compiler.quantize import reference
+from maeri.compiler.nodes import OpTable
+from maeri.compiler.assembler import opcodes
+
+# a float residual block pooled into a classifier head
+np.random.seed(0)
+W1 = np.random.normal(0, 0.3, [4, 2, 3, 3]).astype(np.float32)
+B1 = np.random.normal(0, 0.1, [4]).astype(np.float32)
+W2 = np.random.normal(0, 0.3, [4, 4, 3, 3]).astype(np.float32)
+H = np.random.normal(0, 0.3, [6, 4]).astype(np.float32)
+C = np.random.normal(0, 0.1, [6]).astype(np.float32)
+
+nodes = [make_node('Conv', inputs=['x', 'W1', 'B1'], outputs=['a'],
+        kernel_shape=[3, 3], strides=[1, 1], pads=[1]*4),
+    make_node('Relu', inputs=['a'], outputs=['r']),
+    make_node('Conv', inputs=['r', 'W2'], outputs=['b'],
+        kernel_shape=[3, 3], strides=[1, 1], pads=[1]*4),
+    make_node('Add', inputs=['b', 'r'], outputs=['s']),
+    make_node('GlobalAveragePool', inputs=['s'], outputs=['p']),
+    make_node('Flatten', inputs=['p'], outputs=['f']),
+    make_node('Gemm', inputs=['f', 'H', 'C'], outputs=['y'], transB=1, beta=0.5)]
+graph = make_graph(
+    nodes=nodes,
+    name='test_quantize',
+    inputs=[make_tensor_value_info('x', TensorProto.FLOAT, [1, 2, 6, 6])],
+    initializer=[make_tensor('W1', TensorProto.FLOAT, list(W1.shape), W1.flatten()),
+        make_tensor('B1', TensorProto.FLOAT, list(B1.shape), B1),
+        make_tensor('W2', TensorProto.FLOAT, list(W2.shape), W2.flatten()),
+        make_tensor('H', TensorProto.FLOAT, list(H.shape), H.flatten()),
+        make_tensor('C', TensorProto.FLOAT, list(C.shape), C)],
+    outputs=[make_tensor_value_info('y', TensorProto.FLOAT, [1, 6])])
+model = make_model(graph, producer_name='onnx-example')
+onnx.save(model, 'test_quantize.onnx')
+
+calibration = np.random.normal(0, 1, [32, 1, 2, 6, 6]).astype(np.float32)
+x = np.random.normal(0, 1, [8, 1, 2, 6, 6]).astype(np.float32)
+
+# the reference runs the whole batch at once, matching the
+# float op graph input by input
+expected = reference(model, x)['y']
+sess = Compile('test_quantize.onnx', buff_length=8, ports=8, mults=16)
+assert(np.allclose(sess.sim(x).reshape(expected.shape), expected, atol=1e-4))
+
+for per_channel in [True, False]:
+    sess = Compile('test_quantize.onnx', buff_length=8, ports=8, mults=16,
+        calibration=calibration, per_channel=per_channel)
+    quantizer = sess.quantizer
+
+    # weights and activations are int8, biases int32
+    table = OpTable.from_ops(sess.op_graph, list(sess.memories))
+    dtypes = {memory.dtype for memory in table.memories}
+    assert(dtypes == {np.dtype(np.int8), np.dtype(np.int32)})
+    assert(sess.entrypoint.mem_ref.dtype == np.int8)
+
+    # a factor per output channel with per channel weights,
+    # and the operands of the Add share a scale
+    assert(len(quantizer.requant['a']) == (4 if per_channel else 1))
+    assert(set(quantizer.requant) == {'a', 'b', 's', 'p', 'y'})
+    assert(quantizer.scales['b'] == quantizer.scales['r'] == quantizer.scales['s'])
+
+    # quantized results stay within a few percent of the
+    # float model
+    x_q = quantizer.quantize_input(x)
+    y_q = sess.sim(x_q)
+    y = quantizer.dequantize_output(y_q).reshape(expected.shape)
+    assert(np.max(np.abs(y - expected)) < 0.05*np.max(np.abs(expected)))
+
+    # solving splits accumulations without changing the
+    # integer results
+    sess.solve()
+    assert(np.all(sess.sim(x_q) == y_q))
+
+    # int32 biases wider than a weight are refused rather
+    # than loaded into their lane, and every requantization
+    # has a fixed point
+    sess.map()
+    opcodes.InitISA(_bytes_in_address=3, _num_nodes=31, _num_adders=15,
+        _num_mults=16, _input_width=8, _num_ports=8)
+    for mapping in sess.mappings:
+        wide = any(not (-128 <= mapping.weights[mult] <= 127) for mult in mapping.bias_mults)
+        try:
+            ops = mapping.instructions()
+        except ValueError:
+            assert(wide)
+            continue
+        assert(not wide)
+        assert(all(-128 <= weight <= 127 for weight in ops[1].weights))
+        assert(len(ops[4].params()) == 2*8)
+
+print("DONE")
+
+import os
+os.remove('test_quantize.onnx')
@@ -0,0 +1,36 @@
+from maeri.compiler.assembler.reduction import reduction_states, reduce
+from maeri.compiler.assembler.states import ConfigUp
+from random import randint, seed
+
+seed(0)
+depth = 6
+num_mults = 2**(depth - 1)
+
+# neurons of 3x3 windows over three channels, and of 3x3
+# windows alone, packed back to back
+for length, count in [(27, 1), (9, 2), (3, 10), (4, 8), (2, 16)]:
+    segments = [(index*length, (index + 1)*length) for index in range(count)]
+    states, collectors = reduction_states(segments, depth)
+    assert(len(states) == num_mults - 1)
+
+    products = [0]*num_mults
+    for first, end in segments:
+        for mult in range(first, end):
+            products[mult] = randint(-8, 8)
+
+    values = reduce(states, products, depth)
+    for (first, end), collector in zip(segments, collectors):
+        assert(values[collector] == sum(products[first:end]))
+
+# neurons straddling two subtrees meet over a forwarding link
+states, collectors = reduction_states([(0, 9), (9, 18)], depth)
+assert(ConfigUp.sum_l_r_f in states)
+
+# two single mults under one adder can not both be collected
+try:
+    reduction_states([(0, 1), (1, 2)], depth)
+    raise AssertionError("expected ValueError")
+except ValueError:
+    pass
+
+print("DONE")
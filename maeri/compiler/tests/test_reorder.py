@@ -0,0 +1,86 @@
+from maeri.compiler.nodes import Memory, Input, Output, Conv2, OpTable
+from maeri.compiler.solver import solve_table
+from maeri.compiler.sim_engine import SimEngine
+from maeri.compiler.reorder import reorder, dependencies, config_loads
+from maeri.compiler.sim_engine import overlaps
+import numpy as np
+import time
+
+# two output channels of a 4 channel 3x3 layer, each
+# filter split into two passes, and each row into two
+# tiles whose passes alternate in the tree
+np.random.seed(0)
+x = np.random.randint(-4, 4, [1, 4, 10, 10]).astype(np.float32)
+W = np.random.randint(-2, 3, [2, 4, 3, 3]).astype(np.float32)
+
+x_mem = Memory(x)
+W_mem = Memory(W)
+y_mem = Memory(np.zeros([1, 2, 10, 10], dtype=np.float32))
+memories = [x_mem, W_mem, y_mem]
+
+op_graph = []
+for channel in range(2):
+    X = Input((0, slice(0, 4), slice(0, 10), slice(0, 10)), x_mem)
+    W_in = Input((channel, slice(0, 4), slice(0, 3), slice(0, 3)), W_mem)
+    res = Output((0, channel, slice(0, 10), slice(0, 10)), y_mem)
+    op_graph += [Conv2(X, W_in, res, [1]*4)]
+
+table = solve_table(OpTable.from_ops(op_graph, memories), 8, 16, 32)
+reordered, order = reorder(table)
+
+# grouped, each pass of a filter is configured once
+# along with the two shapes of Add accumulating them
+assert(config_loads(table) == 16)
+assert(config_loads(reordered) == 2*(2 + 2))
+
+# every dependency keeps its order
+position = np.argsort(order)
+earlier, later = dependencies(table)
+assert(np.all(position[earlier] < position[later]))
+
+# as does every pair of rows where one touches what the
+# other writes, most only through a chain of dependencies
+def conflicts(table):
+    pairs = []
+    for operand in range(table.mem.shape[1]):
+        same = table.mem[:, operand, None] == table.mem[None, :, 2]
+        same &= table.mem[:, operand, None] >= 0
+        hit = overlaps(table.start[:, operand], table.stop[:, operand],
+            table.start[:, 2], table.stop[:, 2])
+        first, second = np.nonzero(same & hit)
+        pairs += list(zip(np.minimum(first, second), np.maximum(first, second)))
+    return [(first, second) for first, second in pairs if first != second]
+pairs = conflicts(table)
+assert(len(pairs) > len(earlier))
+for first, second in pairs:
+    assert(position[first] < position[second])
+
+entrypoint = Input((slice(None),)*4, x_mem)
+exitpoint = Input((slice(None),)*4, y_mem)
+expected = SimEngine(table, entrypoint, exitpoint).run(x)
+assert(np.all(SimEngine(reordered, entrypoint, exitpoint).run(x) == expected))
+
+# a 32 channel layer on a 56x56 map solves to tens of
+# thousands of rows sharing one scratch memory, whose
+# dependencies must grow with the rows, not their square
+x_mem = Memory(np.zeros([1, 32, 56, 56], dtype=np.float32))
+W_mem = Memory(np.zeros([32, 32, 3, 3], dtype=np.float32))
+y_mem = Memory(np.zeros([1, 32, 56, 56], dtype=np.float32))
+op_graph = []
+for channel in range(32):
+    X = Input((0, slice(0, 32), slice(0, 56), slice(0, 56)), x_mem)
+    W_in = Input((channel, slice(0, 32), slice(0, 3), slice(0, 3)), W_mem)
+    res = Output((0, channel, slice(0, 56), slice(0, 56)), y_mem)
+    op_graph += [Conv2(X, W_in, res, [1]*4)]
+table = solve_table(OpTable.from_ops(op_graph, [x_mem, W_mem, y_mem]), 128, 4, 64)
+assert(len(table) > 50000)
+
+start = time.time()
+earlier, later = dependencies(table)
+assert(len(earlier) < 4*len(table))
+reordered, order = reorder(table)
+assert(time.time() - start < 60)
+position = np.argsort(order)
+assert(np.all(position[earlier] < position[later]))
+
+print("DONE")
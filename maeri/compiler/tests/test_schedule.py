@@ -0,0 +1,35 @@
+from onnx.helper import make_node, make_graph, make_model
+from onnx.helper import make_tensor_value_info
+from onnx import TensorProto
+
+from maeri.compiler.schedule import schedule
+
+# build a long chain of nodes listed in reverse
+# order, which the scheduler must untangle
+length = 2000
+nodes = [make_node('Relu', [f"t{i}"], [f"t{i + 1}"], name=f"n{i}")
+    for i in range(length)]
+nodes.reverse()
+
+x_input = make_tensor_value_info('t0', TensorProto.FLOAT, [1])
+y_output = make_tensor_value_info(f"t{length}", TensorProto.FLOAT, [1])
+graph = make_graph(nodes, 'chain', [x_input], [y_output])
+model = make_model(graph)
+
+ordered_nodes = schedule(model)
+assert([node.name for node in ordered_nodes] == [f"n{i}" for i in range(length)])
+
+# scheduling must not consume the model
+assert(len(model.graph.node) == length)
+
+# nodes that can never be satisfied are reported
+# rather than spinning forever
+node = make_node('Add', ['t0', 'missing'], ['y'], name='unsatisfiable')
+graph = make_graph([node], 'bad', [x_input], [])
+try:
+    schedule(make_model(graph))
+    raise AssertionError("expected RuntimeError")
+except RuntimeError as error:
+    assert('unsatisfiable' in str(error))
+
+print("DONE")
@@ -0,0 +1,87 @@
+from onnx.helper import make_node, make_graph, make_model
+from onnx.helper import make_tensor, make_tensor_value_info
+from onnx import TensorProto
+import onnx
+import numpy as np
+
+from maeri.compiler.compile import Compile
+from maeri.compiler.nodes import Memory, Input, Output, Add, OpTable
+from maeri.compiler.solver.solve_graph import scratch_target
+
+# two layers of 4 channel 3x3 convolutions, more rows than
+# a pass of the tree takes, so every conv accumulates
+# partial sums in scratch memories
+np.random.seed(0)
+W1 = np.random.normal(0, 0.3, [4, 2, 3, 3]).astype(np.float32)
+W2 = np.random.normal(0, 0.3, [4, 4, 3, 3]).astype(np.float32)
+
+nodes = [make_node('Conv', inputs=['x', 'W1'], outputs=['a'],
+        kernel_shape=[3, 3], strides=[1, 1], pads=[1]*4),
+    make_node('Relu', inputs=['a'], outputs=['r']),
+    make_node('Conv', inputs=['r', 'W2'], outputs=['y'],
+        kernel_shape=[3, 3], strides=[1, 1], pads=[1]*4)]
+graph = make_graph(
+    nodes=nodes,
+    name='test_solve_parallel',
+    inputs=[make_tensor_value_info('x', TensorProto.FLOAT, [1, 2, 6, 6])],
+    initializer=[make_tensor('W1', TensorProto.FLOAT, list(W1.shape), W1.flatten()),
+        make_tensor('W2', TensorProto.FLOAT, list(W2.shape), W2.flatten())],
+    outputs=[make_tensor_value_info('y', TensorProto.FLOAT, [1, 4, 6, 6])])
+onnx.save(make_model(graph, producer_name='onnx-example'), 'test_solve_parallel.onnx')
+
+calibration = np.random.normal(0, 1, [8, 1, 2, 6, 6]).astype(np.float32)
+x = np.random.normal(0, 1, [1, 2, 6, 6]).astype(np.float32)
+
+# float results accumulate partial sums straight into the
+# result, int8 ones through a scratch accumulator fed by
+# the scratch partial sums
+for calibration_ in [None, calibration]:
+    serial = Compile('test_solve_parallel.onnx', buff_length=8, ports=4, mults=16,
+        calibration=calibration_)
+    pooled = Compile('test_solve_parallel.onnx', buff_length=8, ports=4, mults=16,
+        calibration=calibration_)
+    if calibration_ is not None:
+        x_ = serial.quantizer.quantize_input(x)
+    else:
+        x_ = x
+    expected = serial.sim(x_)
+
+    serial.solve()
+    pooled.solve(processes=2)
+    assert(len(serial.memories) > 3)
+    assert(np.any(serial.op_graph.kind == OpTable.ADD))
+
+    # the pool recreates the scratch memories in the order
+    # the serial solve adds them
+    assert(len(pooled.memories) == len(serial.memories))
+    for name in OpTable.column_names:
+        assert(np.all(getattr(pooled.op_graph, name) == getattr(serial.op_graph, name)))
+    for memory, other in zip(pooled.memories, serial.memories):
+        assert(memory.data.shape == other.data.shape)
+        assert(memory.dtype == other.dtype)
+
+    # splitting only reorders float sums, and leaves
+    # integer ones exact
+    result = pooled.sim(x_)
+    assert(np.all(result == serial.sim(x_)))
+    if calibration_ is None:
+        assert(np.allclose(result, expected, atol=1e-5))
+    else:
+        assert(np.all(result == expected))
+
+# partial sums summed only into an accumulator are sent
+# back with the result the accumulator finally writes
+memories = [Memory(np.zeros([1, 1, 4, 4], dtype=dtype))
+    for dtype in [np.int8, np.int8, np.int32, np.int32]]
+x_mem, y_mem, partial, accumulator = memories
+slice_ = (0, 0, slice(0, 4), slice(0, 4))
+table = OpTable.from_ops([
+    Add(Input(slice_, partial), Input(slice_, accumulator), Output(slice_, accumulator)),
+    Add(Input(slice_, accumulator), Input(slice_, x_mem), Output(slice_, y_mem))], memories)
+assert(scratch_target(table, 3, 2) == 1)
+assert(scratch_target(table, 2, 2) == 1)
+
+print("DONE")
+
+import os
+os.remove('test_solve_parallel.onnx')
@@ -0,0 +1,88 @@
+from maeri.compiler.nodes import Memory, Input, Output, Conv2, OpTable
+from maeri.compiler.solver import solve_table
+from maeri.compiler.sim_engine import SimEngine
+from maeri.compiler.assembler.mapper import map_table
+from scipy.signal import correlate2d
+import numpy as np
+
+# a 7x7 filter holds more weights than the 32 mults
+np.random.seed(0)
+x = np.random.randint(0, 4, [1, 1, 12, 12]).astype(np.float64)
+W = np.random.randint(-2, 3, [1, 1, 7, 7]).astype(np.float64)
+pad = 3
+
+x_mem = Memory(x)
+W_mem = Memory(W)
+y_mem = Memory(np.zeros([1, 1, 12, 12]))
+memories = [x_mem, W_mem, y_mem]
+
+X = Input((0, 0, slice(0, 12), slice(0, 12)), x_mem)
+W_in = Input((0, 0, slice(0, 7), slice(0, 7)), W_mem)
+res = Output((0, 0, slice(0, 12), slice(0, 12)), y_mem)
+op_graph = [Conv2(X, W_in, res, [pad]*4)]
+
+table = solve_table(OpTable.from_ops(op_graph, memories), 16, 16, 32)
+
+# every pass fits in the tree, and partial sums are
+# accumulated from a new scratch memory
+assert(np.all(np.prod(table.extent(1)[table.kind == OpTable.CONV], axis=1) <= 32))
+assert(np.any(table.kind == OpTable.ADD))
+assert(len(memories) == 4)
+
+engine = SimEngine(table, Input((slice(None),)*4, x_mem), Input((slice(None),)*4, y_mem))
+result = engine.run(x)
+expected = correlate2d(np.pad(x[0, 0], pad), W[0, 0], mode='valid')
+assert(np.all(result[0, 0] == expected))
+
+# the padding of a 3x3 filter streams from the zero page
+# through the ports of its filter rows, so four ports do
+W = np.random.randint(-2, 3, [1, 1, 3, 3]).astype(np.float64)
+W_mem = Memory(W)
+y_mem = Memory(np.zeros([1, 1, 12, 12]))
+memories = [x_mem, W_mem, y_mem]
+W_in = Input((0, 0, slice(0, 3), slice(0, 3)), W_mem)
+res = Output((0, 0, slice(0, 12), slice(0, 12)), y_mem)
+op_graph = [Conv2(X, W_in, res, [1]*4)]
+
+table = solve_table(OpTable.from_ops(op_graph, memories), 16, 4, 32)
+engine = SimEngine(table, Input((slice(None),)*4, x_mem), Input((slice(None),)*4, y_mem))
+result = engine.run(x)
+expected = correlate2d(np.pad(x[0, 0], 1), W[0, 0], mode='valid')
+assert(np.all(result[0, 0] == expected))
+map_table(table, 6, 4)
+
+# a filter row of 5 weights spans three ports of two
+# mults each, so every pass the solver picks must also
+# be laid out by the mapper
+x = np.random.randint(0, 4, [1, 16, 8, 8]).astype(np.float64)
+W = np.random.randint(-2, 3, [1, 16, 5, 5]).astype(np.float64)
+x_mem = Memory(x)
+W_mem = Memory(W)
+y_mem = Memory(np.zeros([1, 1, 8, 8]))
+memories = [x_mem, W_mem, y_mem]
+X = Input((0, slice(0, 16), slice(0, 8), slice(0, 8)), x_mem)
+W_in = Input((0, slice(0, 16), slice(0, 5), slice(0, 5)), W_mem)
+res = Output((0, 0, slice(0, 8), slice(0, 8)), y_mem)
+op_graph = [Conv2(X, W_in, res, [2]*4)]
+
+for ports, mults in [(16, 32), (8, 32), (16, 64)]:
+    solved = solve_table(OpTable.from_ops(op_graph, list(memories)), 16, ports, mults)
+    mappings = map_table(solved, int(np.log2(mults)) + 1, ports)
+    conv = np.nonzero(solved.kind == OpTable.CONV)[0]
+    assert(sorted(row for mapping in mappings for row in mapping.rows) == conv.tolist())
+
+    engine = SimEngine(solved, Input((slice(None),)*4, x_mem), Input((slice(None),)*4, y_mem))
+    result = engine.run(x)
+    expected = sum(correlate2d(np.pad(x[0, channel], 2), W[0, channel], mode='valid')
+        for channel in range(16))
+    assert(np.all(result[0, 0] == expected))
+
+# more ports than mults leave ports with no mult to
+# inject into
+try:
+    solve_table(OpTable.from_ops(op_graph, list(memories)), 16, 64, 32)
+    assert(False)
+except ValueError:
+    pass
+
+print("DONE")
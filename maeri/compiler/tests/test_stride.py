@@ -0,0 +1,95 @@
+from onnx.helper import make_node, make_graph, make_model
+from onnx.helper import make_tensor, make_tensor_value_info
+from onnx import TensorProto
+from numpy.lib.stride_tricks import sliding_window_view
+import onnx
+import numpy as np
+
+from maeri.compiler.compile import Compile
+from maeri.compiler.nodes import OpTable
+from maeri.compiler.cost_model import DeviceConfig, estimate_cost
+
+def save_model(path, x, W, stride, **attributes):
+    node = make_node('Conv', inputs=['x', 'W'], outputs=['y'],
+        kernel_shape=list(W.shape[2:]), strides=[stride]*2, **attributes)
+    out_width = -(-x.shape[2]//stride)
+    graph = make_graph(
+        nodes=[node],
+        name='test_stride',
+        inputs=[make_tensor_value_info('x', TensorProto.FLOAT, list(x.shape)),
+            make_tensor_value_info('W', TensorProto.FLOAT, list(W.shape))],
+        initializer=[make_tensor('W', TensorProto.FLOAT, list(W.shape), W.flatten())],
+        outputs=[make_tensor_value_info('y', TensorProto.FLOAT,
+            [1, W.shape[0], out_width, out_width])])
+    onnx.save(make_model(graph, producer_name='onnx-example'), path)
+
+def reference(x, W, pad, stride):
+    x_padded = np.pad(x[0], ((0, 0), (pad, pad), (pad, pad)))
+    windows = sliding_window_view(x_padded, W.shape[2:], axis=(1, 2))
+    windows = windows[:, ::stride, ::stride]
+    return np.einsum('chwij,ocij->ohw', windows, W)[np.newaxis]
+
+np.random.seed(0)
+x = np.random.randint(-4, 4, [1, 4, 11, 11]).astype(np.float32)
+W = np.random.randint(-2, 3, [2, 4, 3, 3]).astype(np.float32)
+expected = reference(x, W, 1, 2)
+
+# SAME_UPPER padding keeps ceil(11/2) outputs
+save_model('test_stride.onnx', x, W, 2, auto_pad='SAME_UPPER')
+sess = Compile('test_stride.onnx', buff_length=8, ports=16, mults=32)
+assert(np.all(sess.sim(x) == expected))
+
+# tiled and split into passes, every output is still
+# written by exactly one Conv2 row
+sess.solve()
+table = sess.op_graph
+assert(np.all(sess.sim(x) == expected))
+conv = table.kind == OpTable.CONV
+first = conv & (table.mem[:, 2] == table.mem[0, 2])
+assert(np.sum(np.prod(table.extent(2)[first], axis=1)) == expected.size)
+
+# and only the outputs kept are ever multiplied out
+estimate = estimate_cost(table, DeviceConfig(4, 16, 32))
+assert(np.sum(estimate.macs) == expected.size*W[0].size)
+
+# collectors keep every other sum once the chains fill
+sess.map()
+for mapping in sess.mappings:
+    assert(mapping.pace == 2)
+port_data = np.random.randint(-4, 5, [16, 9])
+sums = mapping.run(port_data)
+assert(sums.shape[1] == 2 + 4)
+
+# a strided row left in a single tile still drops the
+# trailing columns no window reaches, so it fits the
+# buffer
+x = np.random.randint(-4, 4, [1, 1, 5, 5]).astype(np.float32)
+W = np.random.randint(-2, 3, [1, 1, 5, 5]).astype(np.float32)
+save_model('test_stride.onnx', x, W, 3, pads=[2]*4)
+sess = Compile('test_stride.onnx', buff_length=8, ports=16, mults=32)
+sess.solve()
+assert(np.all(sess.sim(x) == reference(x, W, 2, 3)))
+conv = sess.op_graph.kind == OpTable.CONV
+assert(np.all(sess.op_graph.extent(0)[conv, 3] + sess.op_graph.pad[conv, 0] +
+    sess.op_graph.pad[conv, 2] <= 8))
+
+# as does an unpadded pool whose last column is never
+# pooled
+x = np.random.randint(-4, 4, [1, 1, 9, 9]).astype(np.float32)
+node = make_node('AveragePool', inputs=['x'], outputs=['y'],
+    kernel_shape=[2, 2], strides=[2, 2])
+graph = make_graph(
+    nodes=[node],
+    name='test_stride',
+    inputs=[make_tensor_value_info('x', TensorProto.FLOAT, list(x.shape))],
+    outputs=[make_tensor_value_info('y', TensorProto.FLOAT, [1, 1, 4, 4])])
+onnx.save(make_model(graph, producer_name='onnx-example'), 'test_stride.onnx')
+sess = Compile('test_stride.onnx', buff_length=8, ports=16, mults=32)
+sess.solve()
+expected = x[0, 0, :8, :8].reshape(4, 2, 4, 2).mean(axis=(1, 3))
+assert(np.allclose(sess.sim(x)[0, 0], expected))
+
+print("DONE")
+
+import os
+os.remove('test_stride.onnx')
@@ -0,0 +1,34 @@
+from maeri.compiler.nodes import Memory, Input, Output, Conv2, OpTable
+from maeri.compiler.solver import solve_table
+from maeri.compiler.sim_engine import SimEngine
+from scipy.signal import correlate2d
+import numpy as np
+
+# a 28 wide row with a 3x3 filter and a buffer of 8 fits
+# 6 outputs per tile, halving the row would need 8 tiles
+np.random.seed(0)
+x = np.random.randint(-4, 4, [1, 1, 28, 28]).astype(np.float32)
+W = np.random.randint(-2, 3, [1, 1, 3, 3]).astype(np.float32)
+
+x_mem = Memory(x)
+W_mem = Memory(W)
+y_mem = Memory(np.zeros([1, 1, 28, 28], dtype=np.float32))
+memories = [x_mem, W_mem, y_mem]
+
+X = Input((0, 0, slice(0, 28), slice(0, 28)), x_mem)
+W_in = Input((0, 0, slice(0, 3), slice(0, 3)), W_mem)
+res = Output((0, 0, slice(0, 28), slice(0, 28)), y_mem)
+table = solve_table(OpTable.from_ops([Conv2(X, W_in, res, [1]*4)], memories), 8, 16, 32)
+
+# five tiles for each of the 28 output rows, within a
+# column of each other
+assert(len(table) == 5*28)
+widths = table.extent(2)[:, 3]
+assert(set(widths.tolist()) == {5, 6})
+assert(np.all(table.extent(0)[:, 3] + table.pad[:, 0] + table.pad[:, 2] <= 8))
+
+engine = SimEngine(table, Input((slice(None),)*4, x_mem), Input((slice(None),)*4, y_mem))
+expected = correlate2d(np.pad(x[0, 0], 1), W[0, 0], mode='valid')
+assert(np.all(engine.run(x)[0, 0] == expected))
+
+print("DONE")
@@ -50,7 +50,9 @@ class FPGADriver():
                         _num_nodes= (2*self.no_mults) - 1,
                         _num_adders= (self.no_mults - 1),
                         _num_mults=self.no_mults,
-                        _input_width=8
+                        _input_width=8,
+                        _num_ports=self.ports,
+                        _bytes_in_line=self.mem_width
                         )
 
     def get_config(self):
@@ -11,7 +11,7 @@ from maeri.customize.adder import Adder3
 from maeri.gateware.compute_unit.config_bus import ConfigBus
 
 class AdderNode(Elaboratable):
-    def __init__(self,ID, LATENCY, INPUT_WIDTH=8):
+    def __init__(self,ID, LATENCY, INPUT_WIDTH=8, ACC_WIDTH=None):
         """
         Implements an adder node that follows the
         state table described in `maeri.common.enums`.
@@ -19,24 +19,31 @@ class AdderNode(Elaboratable):
         The adder node can be configured from the top
         config in bus, and duplicates config on next
         cycle to the top bus of its two children.
+
+        Sums are ``ACC_WIDTH`` bits wide, by default that of
+        an int32 for int8 features, while the config bus
+        stays ``INPUT_WIDTH`` bits wide.
         """
+        if ACC_WIDTH is None:
+            ACC_WIDTH = 4*INPUT_WIDTH
         self.INPUT_WIDTH = INPUT_WIDTH
+        self.ACC_WIDTH = ACC_WIDTH
         self.ID = ID
         self.LATENCY = LATENCY
 
         # inputs
-        self.lhs_in = Signal(signed(INPUT_WIDTH))
-        self.rhs_in = Signal(signed(INPUT_WIDTH))
-        self.F_in = Signal(signed(INPUT_WIDTH))
+        self.lhs_in = Signal(signed(ACC_WIDTH))
+        self.rhs_in = Signal(signed(ACC_WIDTH))
+        self.F_in = Signal(signed(ACC_WIDTH))
         self.Config_Bus_top_in = ConfigBus(f"config_in_node_{ID}", INPUT_WIDTH)
 
 
         # outputs
-        self.Up_out = Signal(signed(INPUT_WIDTH))
-        self.F_out = Signal(signed(INPUT_WIDTH))
+        self.Up_out = Signal(signed(ACC_WIDTH))
+        self.F_out = Signal(signed(ACC_WIDTH))
         
         # submodules
-        self.adder = Adder3(INPUT_WIDTH=INPUT_WIDTH)
+        self.adder = Adder3(INPUT_WIDTH=ACC_WIDTH)
 
         # lookup table(dict) for adder_node state
         self.up_dict = up_dict = defaultdict(lambda : 'ZERO')
@@ -57,7 +64,7 @@ class AdderNode(Elaboratable):
         # internals
         # the adder node can have 5 states
         self.id_reg = Signal(8)
-        adder_sum = Signal(self.INPUT_WIDTH * 2)
+        adder_sum = Signal(signed(self.ACC_WIDTH))
 
         # set the ID
         m.d.comb += self.id_reg.eq(self.ID)
@@ -11,8 +11,15 @@ from maeri.gateware.compute_unit.config_bus import ConfigBus
 from maeri.common.helpers import print_sig
 
 class MultNode(Elaboratable):
-    def __init__(self, ID, LATENCY, INPUT_WIDTH=8):
+    def __init__(self, ID, LATENCY, INPUT_WIDTH=8, ACC_WIDTH=None):
+        # products leave the mult in the width sums are
+        # accumulated in, by default that of an int32
+        # for int8 features
+        if ACC_WIDTH is None:
+            ACC_WIDTH = 4*INPUT_WIDTH
+        assert(ACC_WIDTH >= 2*INPUT_WIDTH)
         self.INPUT_WIDTH = INPUT_WIDTH
+        self.ACC_WIDTH = ACC_WIDTH
         self.ID = ID
         self.LATENCY = LATENCY
 
@@ -23,8 +30,8 @@ class MultNode(Elaboratable):
 
         # outputs
         self.F_out = Signal(INPUT_WIDTH)
-        # holds the product
-        self.Up_out = Signal(signed(INPUT_WIDTH))
+        # holds the whole product
+        self.Up_out = Signal(signed(ACC_WIDTH))
 
         # submodules
         self.mult = Mult(INPUT_WIDTH=INPUT_WIDTH)
@@ -65,9 +72,7 @@ class MultNode(Elaboratable):
             self.mult.B_in.eq(weight),
         ]
 
-        m.d.sync += self.Up_out.eq(
-            self.mult.Product_out[(self.INPUT_WIDTH- 1): -1]
-            )
+        m.d.sync += self.Up_out.eq(self.mult.Product_out)
 
         # update the weights from values on the config
         # bus when we are in configuration mode
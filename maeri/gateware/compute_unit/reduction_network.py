@@ -1,5 +1,5 @@
 from nmigen import Signal, Elaboratable, Module
-from nmigen import Array, signed
+from nmigen import Array, Cat, signed
 
 from maeri.common.skeleton import Skeleton
 from maeri.gateware.compute_unit.config_bus import ConfigBus
@@ -11,7 +11,7 @@ from nmigen import Memory
 
 class ReductionNetwork(Elaboratable):
     def __init__(self, depth, num_ports, INPUT_WIDTH, 
-            bytes_in_line, VERBOSE = False):
+            bytes_in_line, VERBOSE = False, ACC_WIDTH = None):
         """
         Attributes:
         ===========
@@ -24,17 +24,32 @@ class ReductionNetwork(Elaboratable):
         self.select_output_node_ports:
         self.config_bus_ports:
         self.sel_sram:
+        self.w_sram_addr:
         self.w_sram_data:
         self.w_sram_en:
+        self.r_sram_addr:
         self.r_sram_en:
         self.run:
         self.length:
+        self.pace:
         self.relu_en_by_port:
+        self.scale_multiplier_by_port:
+        self.scale_shift_by_port:
         
         outputs:
         self.r_sram_data
         self.done
 
+        Port buffers are written and read a line of four
+        features at a time, ``done`` rising once every
+        collector has kept the sums of a run.
+
+        Sums travel up the tree and through the scale of
+        every collector ``ACC_WIDTH`` bits wide, by default
+        that of the int32 sums of int8 features, and are
+        only saturated to ``INPUT_WIDTH`` bits as they are
+        written, as the compiler's simulation writes them.
+
         Formal
         ======
         Externally, the injection srams can only be written
@@ -45,8 +60,11 @@ class ReductionNetwork(Elaboratable):
         """
 
         # common parameters
+        if ACC_WIDTH is None:
+            ACC_WIDTH = 4*INPUT_WIDTH
         self.num_ports = num_ports
         self.INPUT_WIDTH = INPUT_WIDTH
+        self.ACC_WIDTH = ACC_WIDTH
 
 
         # skeleton on top of which maeri will be created
@@ -55,18 +73,27 @@ class ReductionNetwork(Elaboratable):
         
         # control parameters -- inputs
         self.sel_sram = Signal(range(num_ports))
-        self.w_sram_data = Signal(signed(INPUT_WIDTH))
+        self.w_sram_addr = Signal(4)
+        self.w_sram_data = Signal(32)
         self.w_sram_en = Signal()
+        self.r_sram_addr = Signal(4)
         self.r_sram_en = Signal()
         # moves data from injection FIFOs over the
         # reduction network to the collection FIFOs
         self.run = Signal()
         self.length = Signal(6)
+        # collectors keep one sum every ``pace`` cycles,
+        # the windows of a strided filter
+        self.pace = Signal(4, reset=1)
         self.relu_en_by_port = [Signal() for port in range(num_ports)]
+        # collectors multiply sums by ``multiplier >> shift``,
+        # one by default
+        self.scale_multiplier_by_port = [Signal(8, reset=128) for port in range(num_ports)]
+        self.scale_shift_by_port = [Signal(5, reset=7) for port in range(num_ports)]
         self.done = Signal()
 
         # control parameters -- outputs
-        self.r_sram_data = Signal(signed(INPUT_WIDTH))
+        self.r_sram_data = Signal(32)
         
         # make list of injection srams
         self.injection_srams = []
@@ -97,13 +124,15 @@ class ReductionNetwork(Elaboratable):
         self.adders = adders = []
         for node in self.skeleton.adder_nodes:
             # generate and append adder instance
-            adders += [AdderNode(node.id, LATENCY=node.latency,INPUT_WIDTH=INPUT_WIDTH)]
+            adders += [AdderNode(node.id, LATENCY=node.latency,INPUT_WIDTH=INPUT_WIDTH,
+                ACC_WIDTH=ACC_WIDTH)]
             
         # instantiate mult_nodes in tree
         self.mults = mults = []
         for node in self.skeleton.mult_nodes:
             # generate and append mult instance
-            mults += [MultNode(node.id, LATENCY=node.latency,INPUT_WIDTH=INPUT_WIDTH)]
+            mults += [MultNode(node.id, LATENCY=node.latency,INPUT_WIDTH=INPUT_WIDTH,
+                ACC_WIDTH=ACC_WIDTH)]
 
     def elaborate(self, platform):
         m = Module()
@@ -134,38 +163,52 @@ class ReductionNetwork(Elaboratable):
         wp_data_by_injection_sram = Array([sram.wp_data for sram in self.injection_srams])
         m.d.comb += wp_en_by_injection_sram[self.sel_sram].eq(self.w_sram_en)
         m.d.comb += wp_data_by_injection_sram[self.sel_sram].eq(self.w_sram_data)
+        m.d.comb += [sram.wp_addr.eq(self.w_sram_addr) for sram in self.injection_srams]
 
         # inject data into reduction tree
         m.d.comb += [sram.rp_addr.eq(injection_addr) for sram in self.injection_srams]
-        with m.If(self.run):
-            increment_condition_1 = self.run
-            increment_condition_2 = injection_addr < (self.length - 1)
-            with m.If(increment_condition_1 & increment_condition_2):
-                m.d.comb += [sram.rp_en.eq(1) for sram in self.injection_srams]
-                m.d.sync += injection_addr.eq(injection_addr + 1)
-            with m.Elif(increment_condition_1):
-                m.d.sync += injection_addr.eq(injection_addr)
-            with m.Else():
-                m.d.sync += injection_addr.eq(0)
+        # and rewind once the run is over
+        increment_condition_1 = self.run
+        increment_condition_2 = injection_addr < (self.length - 1)
+        with m.If(increment_condition_1 & increment_condition_2):
+            m.d.comb += [sram.rp_en.eq(1) for sram in self.injection_srams]
+            m.d.sync += injection_addr.eq(injection_addr + 1)
+        with m.Elif(increment_condition_1):
+            m.d.sync += injection_addr.eq(injection_addr)
+        with m.Else():
+            m.d.sync += injection_addr.eq(0)
         
         # collect data from reduction tree
         latency_by_node = Array([node.latency for node in (adders + mults)])
         addr_by_collector = [Signal.like(self.length) for collector in range(self.num_ports)]
         assert(len(addr_by_collector) == len(self.collection_srams))
-        zipped_list =  zip(self.collection_srams, addr_by_collector, self.select_output_node_ports)
-        for sram, collector_addr, selected_port in zipped_list:
+        zipped_list =  zip(self.collection_srams, addr_by_collector, self.select_output_node_ports,
+            done_by_collect_port)
+        for sram, collector_addr, selected_port, collector_done in zipped_list:
+            phase = Signal.like(self.pace)
             m.d.comb += sram.wp_addr.eq(collector_addr)
             increment_condition_1 = self.run
             increment_condition_2 = injection_addr > latency_by_node[selected_port]
             increment_condition_3 = collector_addr < (self.length - 1)
             with m.If(increment_condition_1 & increment_condition_2 & increment_condition_3):
-                m.d.sync += collector_addr.eq(collector_addr + 1)
-                m.d.comb += sram.wp_en.eq(1)
+                # sums between kept windows are dropped
+                with m.If(phase == 0):
+                    m.d.sync += collector_addr.eq(collector_addr + 1)
+                    m.d.comb += sram.wp_en.eq(1)
+                with m.If(phase == (self.pace - 1)):
+                    m.d.sync += phase.eq(0)
+                with m.Else():
+                    m.d.sync += phase.eq(phase + 1)
             with m.Elif(increment_condition_1):
                 # TODO : test if "pass" works
                 m.d.sync += collector_addr.eq(collector_addr)
             with m.Else():
                 m.d.sync += collector_addr.eq(0)
+                m.d.sync += phase.eq(0)
+            m.d.comb += collector_done.eq(collector_addr == (self.length - 1))
+
+        # the run is done once every collector kept its sums
+        m.d.comb += self.done.eq(self.run & Cat(*done_by_collect_port).all())
 
         # earlier, we expose once read port width-matched to main
         # memory width, namely, self.r_sram_data
@@ -175,6 +218,7 @@ class ReductionNetwork(Elaboratable):
         rp_data_by_collection_sram = Array([sram.rp_data for sram in self.collection_srams])
         m.d.comb += rp_en_by_collection_sram[self.sel_sram].eq(self.r_sram_en)
         m.d.comb += self.r_sram_data.eq(rp_data_by_collection_sram[self.sel_sram])
+        m.d.comb += [sram.rp_addr.eq(self.r_sram_addr) for sram in self.collection_srams]
 
         for node in mults:
             # add generated adder as named submodule
@@ -217,14 +261,43 @@ class ReductionNetwork(Elaboratable):
         # allow collection port to select which node
         # it collects from        
         assert(len(self.select_output_node_ports) == len(self.collection_srams))
-        for sel_port, sram in zip(self.select_output_node_ports, self.collection_srams):
+        assert(len(self.relu_en_by_port) == len(self.collection_srams))
+        ports = zip(self.select_output_node_ports, self.collection_srams, self.relu_en_by_port,
+            self.scale_multiplier_by_port, self.scale_shift_by_port)
+        for sel_port, sram, relu_en, multiplier, shift in ports:
+            collected = Signal(signed(self.ACC_WIDTH))
             with m.Switch(sel_port):
                 for skel_node in self.skeleton.adder_nodes:
                     maeri_node = self.skel_v_hw_dict[skel_node]
                     with m.Case(skel_node.id):
-                        m.d.comb += sram.wp_data.eq(maeri_node.Up_out)
+                        m.d.comb += collected.eq(maeri_node.Up_out)
                 with m.Default():
-                    m.d.comb += sram.wp_data.eq(0)
+                    m.d.comb += collected.eq(0)
+
+            # sums are scaled by a fixed point multiplier
+            # and arithmetic right shift at full width
+            product = Signal(signed(self.ACC_WIDTH + multiplier.width + 1))
+            scaled = Signal.like(product)
+            m.d.comb += product.eq(collected * multiplier)
+            m.d.comb += scaled.eq(product >> shift)
+
+            # then saturated to the written width
+            high = 2**(self.INPUT_WIDTH - 1) - 1
+            low = -2**(self.INPUT_WIDTH - 1)
+            written = Signal(signed(self.INPUT_WIDTH))
+            with m.If(scaled > high):
+                m.d.comb += written.eq(high)
+            with m.Elif(scaled < low):
+                m.d.comb += written.eq(low)
+            with m.Else():
+                m.d.comb += written.eq(scaled)
+
+            # a fused relu clamps negative sums at zero
+            # as they are written to the collection sram
+            with m.If(relu_en & written[-1]):
+                m.d.comb += sram.wp_data.eq(0)
+            with m.Else():
+                m.d.comb += sram.wp_data.eq(written)
         
         # link up forwarding links between adders
         for left, right in self.skeleton.adder_forwarding_links:
@@ -263,12 +336,17 @@ class ReductionNetwork(Elaboratable):
         for port in self.config_bus_ports:
             ports += [port[sig] for sig in port.fields]
         ports += [self.sel_sram]
+        ports += [self.w_sram_addr]
         ports += [self.w_sram_data]
         ports += [self.w_sram_en]
+        ports += [self.r_sram_addr]
         ports += [self.r_sram_en]
         ports += [self.run]
         ports += [self.length]
+        ports += [self.pace]
         ports += self.relu_en_by_port
+        ports += self.scale_multiplier_by_port
+        ports += self.scale_shift_by_port
 
         # outputs
         ports += [self.r_sram_data]
@@ -0,0 +1,140 @@
+from maeri.gateware.compute_unit.top import Top, State
+from maeri.gateware.platform.sim.mem import Mem
+from maeri.compiler.assembler.assemble import assemble
+from maeri.compiler.assembler.mapper import TreeMapping
+from maeri.compiler.assembler.signs import to_signed, to_unsigned
+
+from nmigen import Signal
+from nmigen import Elaboratable, Module
+
+from maeri.compiler.assembler import opcodes
+import numpy as np
+
+# memory lines holding the features streamed into every
+# port and the sums collected on every port
+FEATURES = 256
+RESULTS = 384
+LINES_PER_PORT = 4
+
+def to_lines(values, bytes_in_line):
+    lines = []
+    for line in range(len(values)//bytes_in_line):
+        data = values[line*bytes_in_line : (line + 1)*bytes_in_line]
+        data = bytearray([to_unsigned(int(value), 8) for value in data])
+        lines += [int.from_bytes(data, 'little')]
+    return lines
+
+class Sim(Elaboratable):
+    def __init__(self):
+        """
+        Runs a 3x3 convolution with a fused relu on the tree,
+        a row of the filter on each of three ports, from
+        loading the features to storing the collected sums.
+        """
+        self.start = Signal()
+        self.status = Signal(State)
+        self.controller = controller =\
+             Top(
+                    addr_shape = 24,
+                    data_shape = 32,
+
+                    depth = 6,
+                    num_ports = 16,
+                    INPUT_WIDTH = 8, 
+                    bytes_in_line = 4,
+                    VERBOSE=False
+                )
+        bytes_in_line = controller.bytes_in_line
+
+        np.random.seed(0)
+        filter_ = np.random.randint(-3, 4, [1, 3, 3])
+        self.mapping = mapping = TreeMapping([0], 6, controller.num_ports, [filter_],
+            relus=[True])
+
+        self.length = length = LINES_PER_PORT*bytes_in_line
+        self.port_data = np.random.randint(-4, 5, [controller.num_ports, length])
+
+        # load the ports the neuron streams, run, then store
+        # the sums of its collector
+        ops = mapping.instructions()
+        feature_lines = []
+        for port, stream in enumerate(mapping.ports):
+            feature_lines += to_lines(self.port_data[port], bytes_in_line)
+            if stream is not None:
+                address = FEATURES + port*LINES_PER_PORT
+                ops += [opcodes.LoadFeatures(port, LINES_PER_PORT, address)]
+        ops += [opcodes.Run(length, mapping.pace)]
+        ops += [opcodes.StoreFeatures(0, LINES_PER_PORT, RESULTS)]
+
+        # assemble ops
+        init = assemble(ops)
+        assert(len(init) == FEATURES)
+        init += feature_lines
+        init += [0]*(2*RESULTS - len(init))
+
+        # attach and initialize mem
+        self.mem = Mem(width=32, depth=2*RESULTS, init=init)
+    
+    def elaborate(self, platform):
+        m = Module()
+        m.submodules.controller = controller = self.controller
+        m.submodules.mem = mem = self.mem
+
+        m.d.comb += controller.read_port.connect(mem.read_port1)
+        m.d.comb += mem.write_port1.connect(controller.write_port)
+
+        m.d.comb += controller.start.eq(self.start)
+        m.d.comb += self.status.eq(controller.status)
+
+        return m
+    
+    def ports(self):
+        return [self.start, self.status]
+
+
+
+if __name__ == "__main__":
+    from nmigen.sim import Simulator, Tick
+
+    def process():
+        yield dut.start.eq(1)
+        yield Tick()
+        yield dut.start.eq(0)
+        yield Tick()
+
+        # the program ends by resetting the compute unit
+        for tick in range(20000):
+            yield Tick()
+            if (yield dut.status) == State.reset:
+                break
+        assert((yield dut.status) == State.reset)
+
+        collected = []
+        for line in range(LINES_PER_PORT):
+            data = (yield dut.mem.memory[RESULTS + line])
+            collected += [to_signed(byte, 8) for byte in data.to_bytes(4, 'little')]
+
+        # the collector writes all but the last sum of a run,
+        # saturated then clamped at zero, and the sums of the
+        # full windows follow its latency
+        width = dut.mapping.filters[0].shape[2]
+        expected = np.clip(dut.mapping.run(dut.port_data)[0], -128, 127)[width - 1:]
+        collected = np.array(collected[:dut.length - 1])
+        print()
+        print("COLLECTED SUMS")
+        print(collected)
+        print("EXPECTED SUMS")
+        print(expected)
+        assert(np.all(collected >= 0))
+        assert(np.any(expected == 0) and np.any(expected > 0))
+        windows = np.lib.stride_tricks.sliding_window_view(collected, len(expected) - width)
+        assert(np.any(np.all(windows == expected[:len(expected) - width], axis=1)))
+
+    dut = Sim()
+    sim = Simulator(dut, engine="pysim")
+    sim.add_clock(1e-6)
+    sim.add_sync_process(process)
+
+    with sim.write_vcd(f"{__file__[:-3]}.vcd"):
+        sim.run()
+    print("DONE")
@@ -21,6 +21,7 @@ class State(IntEnum):
     run = 8
     debug = 9
     fetch = 10
+    configure_scales = 11
 
 class Top(Elaboratable):
 
@@ -73,7 +74,8 @@ class Top(Elaboratable):
                         _num_ports=self.num_ports,
                         _num_adders=self.num_adders,
                         _num_mults=self.num_mults,
-                        _input_width=INPUT_WIDTH
+                        _input_width=INPUT_WIDTH,
+                        _bytes_in_line=bytes_in_line
                         )
 
         # memory connections
@@ -105,6 +107,7 @@ class Top(Elaboratable):
         parsed_port_buffer = Signal(8)
         parsed_num_lines = Signal(8)
         parsed_len_runtime = Signal(8)
+        parsed_pace = Signal.like(self.rn.pace)
 
         state = self.status
 
@@ -144,13 +147,24 @@ class Top(Elaboratable):
                             m.d.sync += num_params.eq(opcodes.ConfigureCollectors.num_params())
                             m.d.sync += pc.eq(pc + 1)
                             m.next = 'FETCH_PARAMS'
+                        with m.Case(opcodes.ConfigureRelus.op):
+                            m.d.sync += num_params.eq(opcodes.ConfigureRelus.num_params())
+                            m.d.sync += pc.eq(pc + 1)
+                            m.next = 'FETCH_PARAMS'
+                        with m.Case(opcodes.ConfigureScales.op):
+                            m.d.sync += num_params.eq(opcodes.ConfigureScales.num_params())
+                            m.d.sync += pc.eq(pc + 1)
+                            m.next = 'FETCH_PARAMS'
                         with m.Case(opcodes.LoadFeatures.op):
+                            m.d.sync += num_params.eq(opcodes.LoadFeatures.num_params())
                             m.d.sync += pc.eq(pc + 1)
                             m.next = 'FETCH_PARAMS'
                         with m.Case(opcodes.StoreFeatures.op):
+                            m.d.sync += num_params.eq(opcodes.StoreFeatures.num_params())
                             m.d.sync += pc.eq(pc + 1)
                             m.next = 'FETCH_PARAMS'
                         with m.Case(opcodes.Run.op):
+                            m.d.sync += num_params.eq(opcodes.Run.num_params())
                             m.d.sync += pc.eq(pc + 1)
                             m.next = 'FETCH_PARAMS'
                         with m.Case(opcodes.Debug.op):
@@ -190,6 +204,14 @@ class Top(Elaboratable):
                     with m.If(param_counter == (bytes_in_address + 2)):
                         m.d.sync += parsed_num_lines.eq(mem_adaptor.byte_out)
 
+                    # run takes the runtime length then the pace
+                    # collectors keep sums at
+                    with m.If(sync_op == opcodes.Run.op):
+                        with m.If(param_counter == 0):
+                            m.d.sync += parsed_len_runtime.eq(mem_adaptor.byte_out)
+                        with m.If(param_counter == 1):
+                            m.d.sync += parsed_pace.eq(mem_adaptor.byte_out)
+
                     with m.If(param_counter == (num_params - 1)):
                         m.d.sync += param_counter.eq(0)
                         with m.Switch(sync_op):
@@ -199,6 +221,10 @@ class Top(Elaboratable):
                                 m.next = 'CONFIGURE_WEIGHTS'
                             with m.Case(opcodes.ConfigureCollectors.op):
                                 m.next = 'CONFIGURE_COLLECTORS'
+                            with m.Case(opcodes.ConfigureRelus.op):
+                                m.next = 'CONFIGURE_RELUS'
+                            with m.Case(opcodes.ConfigureScales.op):
+                                m.next = 'CONFIGURE_SCALES'
                             with m.Case(opcodes.LoadFeatures.op):
                                 m.next = 'LOAD_FEATURES'
                             with m.Case(opcodes.StoreFeatures.op):
@@ -304,15 +330,121 @@ class Top(Elaboratable):
                             port_slice = slice(chunk*self.bytes_in_line , (chunk + 1)*self.bytes_in_line)
                             port_slice_list = self.rn.select_output_node_ports[port_slice]
                             for index, select_port in enumerate(port_slice_list):
-                                data_slice = slice(index*self.bytes_in_line , (index + 1)*self.bytes_in_line)
+                                data_slice = slice(index*8 , (index + 1)*8)
                                 m.d.sync += select_port.eq(self.read_port.data[data_slice])
 
+            with m.State("CONFIGURE_RELUS"):
+                # this state sets which collectors clamp the
+                # sums they write at zero, a bit per port
+                m.d.comb += state.eq(State.configure_relus)
+
+                # access memory with parsed_address
+                m.d.comb += mem_adaptor.read_rq.eq(1)
+                m.d.comb += mem_adaptor.mem_line_byte_select.eq(0)
+                m.d.comb += mem_adaptor.mem_line_addr.eq(parsed_address)
+
+                # the whole mask fits in one line
+                assert(self.rn.num_ports <= 8*self.bytes_in_line)
+                with m.If(mem_adaptor.read_byte_ready):
+                    for port, relu_en in enumerate(self.rn.relu_en_by_port):
+                        m.d.sync += relu_en.eq(self.read_port.data[port])
+                    m.next = "FETCH_OP"
+
+            with m.State("CONFIGURE_SCALES"):
+                # this state loads the multiplier and shift each
+                # collector scales its sums by, two bytes a port
+                m.d.comb += state.eq(State.configure_scales)
+
+                scale_address_offset = Signal(range(2*self.rn.num_ports))
+
+                # access memory with parsed_address
+                m.d.comb += mem_adaptor.read_rq.eq(1)
+                m.d.comb += mem_adaptor.mem_line_byte_select.eq(0)
+                m.d.comb += mem_adaptor.mem_line_addr.eq(parsed_address + scale_address_offset)
+
+                ports_in_line = self.bytes_in_line//2
+                num_chunks = self.rn.num_ports//ports_in_line
+                with m.If(mem_adaptor.read_byte_ready):
+                    with m.If(scale_address_offset == (num_chunks - 1)):
+                        m.d.sync += scale_address_offset.eq(0)
+                        m.next = "FETCH_OP"
+                    with m.Else():
+                        m.d.sync += scale_address_offset.eq(scale_address_offset + 1)
+
+                    for chunk in range(num_chunks):
+                        with m.If(scale_address_offset == chunk):
+                            for index in range(ports_in_line):
+                                port = chunk*ports_in_line + index
+                                multiplier = self.read_port.data[16*index : 16*index + 8]
+                                shift = self.read_port.data[16*index + 8 : 16*index + 13]
+                                m.d.sync += self.rn.scale_multiplier_by_port[port].eq(multiplier)
+                                m.d.sync += self.rn.scale_shift_by_port[port].eq(shift)
+
             with m.State("LOAD_FEATURES"):
+                # this state copies lines of features from memory
+                # into the buffer of one port
                 m.d.comb += state.eq(State.load_features)
 
+                # port buffers hold lines of four features
+                assert(self.bytes_in_line == 4)
+                load_line = Signal.like(parsed_num_lines)
+
+                # access memory with parsed_address
+                m.d.comb += mem_adaptor.read_rq.eq(1)
+                m.d.comb += mem_adaptor.mem_line_byte_select.eq(0)
+                m.d.comb += mem_adaptor.mem_line_addr.eq(parsed_address + load_line)
+
+                m.d.comb += self.rn.sel_sram.eq(parsed_port_buffer)
+                m.d.comb += self.rn.w_sram_addr.eq(load_line)
+                m.d.comb += self.rn.w_sram_data.eq(self.read_port.data)
+
+                with m.If(mem_adaptor.read_byte_ready):
+                    m.d.comb += self.rn.w_sram_en.eq(1)
+                    with m.If(load_line == (parsed_num_lines - 1)):
+                        m.d.sync += load_line.eq(0)
+                        m.next = "FETCH_OP"
+                    with m.Else():
+                        m.d.sync += load_line.eq(load_line + 1)
+
             with m.State("STORE_FEATURES"):
+                # this state copies lines of collected sums from
+                # the buffer of one port into memory
                 m.d.comb += state.eq(State.store_features)
 
+                # port buffers hold lines of four features
+                assert(self.bytes_in_line == 4)
+                store_line = Signal.like(parsed_num_lines)
+                store_done = Signal()
+
+                m.d.comb += self.rn.sel_sram.eq(parsed_port_buffer)
+                m.d.comb += self.rn.r_sram_addr.eq(store_line)
+                m.d.comb += self.write_port.addr.eq(parsed_address + store_line)
+                m.d.comb += self.write_port.data.eq(self.rn.r_sram_data)
+
+                with m.FSM(name="STORE_FEATURES"):
+                    # buffer reads take a cycle
+                    with m.State("READ"):
+                        m.d.comb += self.rn.r_sram_en.eq(1)
+                        m.next = "START_WRITE"
+
+                    with m.State("START_WRITE"):
+                        m.d.comb += self.write_port.rq.eq(1)
+                        m.d.comb += self.write_port.en.eq(1)
+                        m.next = "FINISH_WRITE"
+
+                    with m.State("FINISH_WRITE"):
+                        m.d.comb += self.write_port.en.eq(1)
+                        with m.If(self.write_port.ack):
+                            m.next = "READ"
+                            with m.If(store_line == (parsed_num_lines - 1)):
+                                m.d.comb += store_done.eq(1)
+                                m.d.sync += store_line.eq(0)
+                            with m.Else():
+                                m.d.sync += store_line.eq(store_line + 1)
+
+                with m.If(store_done):
+                    m.next = "FETCH_OP"
+
             with m.State("DEBUG"):
                 m.d.comb += state.eq(State.debug)
 
@@ -426,6 +558,17 @@ class Top(Elaboratable):
 
             with m.State("RUN"):
                 m.d.comb += state.eq(State.run)
+
+                # stream the injection srams through the tree,
+                # collectors keeping one sum every pace cycles
+                m.d.comb += self.rn.run.eq(1)
+                m.d.comb += self.rn.length.eq(parsed_len_runtime)
+                m.d.comb += self.rn.pace.eq(parsed_pace)
+
+                # leaving run rewinds the injection and
+                # collection buffers for the next run
+                with m.If(self.rn.done):
+                    m.next = "FETCH_OP"
         
         return m
     
@@ -21,6 +21,8 @@ class Mem(Elaboratable):
 
         mem = Memory(width=width, depth=depth, init=init)
         mem.attrs['ram_block'] = 1
+        # for inspection in simulation
+        self.memory = mem
         self.__rp = mem.read_port()
         self.__wp = mem.write_port()
 